@@ -1,21 +1,115 @@
-from typing import List, Dict, Optional, Tuple
-from openai import OpenAI
+from typing import List, Dict, Optional, Tuple, AsyncIterator, FrozenSet, Set
+from openai import OpenAI, AsyncOpenAI
 import json
+import os
+import time
+import asyncio
+import contextvars
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 from knowledge_base_enriched import EnrichedKnowledgeBase
+from intent_router import IntentRouter, nearest_reference
+from conversation_store import create_conversation_store
+from response_cache import ResponseCache, menu_entities, menu_vocabulary
+from text_utils import tokenize
+from response_validator import ResponseValidator, GENERIC_RESTAURANT_ANSWER, strip_markdown
 from logger_config import setup_logger
+import tracing
 
 # Setup structured JSON logging
 logger = setup_logger(__name__)
 
+# Planned tools run concurrently; each one gets its own deadline
+TOOL_TIMEOUT_SECONDS = float(os.getenv('TOOL_TIMEOUT_SECONDS', '8'))
+TOOL_MAX_WORKERS = int(os.getenv('TOOL_MAX_WORKERS', '8'))
+
+# Local intent router in front of the LLM planner
+INTENT_ROUTER_ENABLED = os.getenv('INTENT_ROUTER', 'true').lower() == 'true'
+INTENT_ROUTER_CENTROIDS = os.getenv('INTENT_ROUTER_CENTROIDS', 'false').lower() == 'true'
+
+# How often a request checks (one stat) whether the knowledge file changed; 0 disables.
+# Every worker polls, so a refresh done by one worker reaches all of them
+KB_POLL_SECONDS = float(os.getenv('KB_POLL_SECONDS', '30'))
+
+# Cache of final answers for first-turn / self-contained questions
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE', 'true').lower() == 'true'
+RESPONSE_CACHE_SEMANTIC = os.getenv('RESPONSE_CACHE_SEMANTIC', 'true').lower() == 'true'
+# Words that make a later turn depend on what was said before ("et à Bondy ?", "celui-ci")
+FOLLOW_UP_OPENERS = {'et', 'and', 'oui', 'non', 'ok', 'yes', 'no', 'sinon', 'alors', 'puis'}
+FOLLOW_UP_WORDS = {'ca', 'cela', 'celui', 'celle', 'ceux', 'celles', 'meme', 'aussi', 'autre', 'autres', 'it', 'that', 'same'}
+
+# Static part of the answer prompt - never formatted per request
+CHAT_SYSTEM_PROMPT = """AGENTIC AI SYSTEM - Tool-First RAG Architecture
+
+CRITICAL: You are a TOOL-CALLING agent. Always use tools to retrieve context before responding. Never answer from memory.
+
+LANGUAGE: Auto-detect query language (French/English/Vietnamese). Respond in SAME language detected.
+
+AVAILABLE TOOLS (use these first):
+1. search_knowledge(query) - Semantic search across all KB
+2. get_restaurants() - List all 20 restaurant locations
+3. get_menu() - Full menu with prices
+4. filter_menu(vegetarian=True/False, vegan=True/False) - Filtered dishes
+5. get_restaurant_info(city_or_dept) - Specific location details
+6. recommend_dish(preferences) - Personalized suggestions
+7. get_contact() - Contact information
+8. detect_department(query) - Extract department code from query
+
+AGENTIC WORKFLOW:
+Step 1: Analyze query intent
+Step 2: Select 1-3 relevant tools
+Step 3: Execute tools to retrieve RAG context
+Step 4: Synthesize response from retrieved context ONLY
+Step 5: Automatic validation (restaurants/schedules/prices/departments)
+
+RETRIEVED CONTEXT FROM TOOLS:
+Provided in the system message right before the latest user question.
+
+GENERATION CONSTRAINTS:
+- Context is absolute source of truth. Never contradict retrieved data.
+- If context empty or contains [HORS_PERIMETRE]: Say "Cette information n'est pas disponible sur le site pour le moment." + suggest contacting restaurant directly.
+- Schedules: Use exact format from context (11:30-14:30). If missing: "Ces horaires ne sont pas disponibles sur le site pour le moment."
+- Prices: Only mention if present in context. If missing: "Les prix sont disponibles sur la carte en restaurant."
+- Links: If context has HTML tags <a href>, copy EXACTLY as-is (preserve HTML).
+- Format: Plain text only. NO markdown syntax (no bold/italic/underline markers).
+
+MULTI-STEP REASONING EXAMPLES:
+Query "vegetarian menu in Essonne" → detect_department("Essonne") → filter_menu(vegetarian=True) + get_restaurant_info("91") → synthesize
+Query "do you have spring rolls" → search_knowledge("spring rolls") → extract dishes → respond with HTML links from context
+Query "yes" (after confirmation request) → execute previously suggested action (get_menu or filter_menu)
+
+RESPONSE STYLE: First-person plural, concise, conversational. Respect detected language.
+"""
+
+PLANNING_SYSTEM_PROMPT = "Agent de planning multi-tool. Analyse query → Sélection outils optimaux → Output JSON strict (pas texte). Capacité: décomposition requêtes complexes en étapes parallèles."
+
+
 class AIAgent:
     
-    def __init__(self, openai_api_key: str, website_url: str):
+    def __init__(self, openai_api_key: str, website_url: str, kb: Optional[EnrichedKnowledgeBase] = None):
         self.client = OpenAI(api_key=openai_api_key)
+        self.async_client = AsyncOpenAI(api_key=openai_api_key)
         self.website_url = website_url
-        self.kb = EnrichedKnowledgeBase()
-        self.conversations = {}  # {conversation_id: [messages]}
+        # A KB preloaded in the gunicorn master is shared read-only by every worker
+        self.kb = kb if kb is not None else EnrichedKnowledgeBase()
+        self.conversations = create_conversation_store()  # bounded history + last city per conversation
+        self.response_cache = ResponseCache(
+            max_size=int(os.getenv('RESPONSE_CACHE_SIZE', '1024')),
+            ttl_seconds=float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '21600')),
+            min_similarity=float(os.getenv('RESPONSE_CACHE_MIN_SIMILARITY', '0.97'))
+        )
         self.tools = self._define_tools()
+        self.tools_json = json.dumps(self.tools, indent=2, ensure_ascii=False)
+        self.tool_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+        self.tool_metrics = {}  # {tool_name: {calls, errors, timeouts, total_ms, max_ms}}
+        self._tool_metrics_lock = threading.Lock()
+        self._router = None
+        self._router_kb = None
+        self._router_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._kb_polled_at = time.monotonic()
         self.agent_state = {
             'knowledge_ready': True,
             'total_interactions': 0,
@@ -72,8 +166,19 @@ class AIAgent:
             }
         ]
     
-    def search_knowledge(self, query: str) -> str:
+    def search_knowledge(self, query: str, conversation_id: Optional[str] = None) -> str:
         """Enriched search across entire knowledge base - auto-detects department"""
+        results = self.kb.search(self._prepare_search_query(query, conversation_id), limit=5)
+        return self._format_knowledge_results(results)
+    
+    async def asearch_knowledge(self, query: str, conversation_id: Optional[str] = None) -> str:
+        """Async variant of search_knowledge (non-blocking embedding call)"""
+        query = await self._off_loop(self._prepare_search_query, query, conversation_id)
+        results = await self.kb.asearch(query, limit=5)
+        return self._format_knowledge_results(results)
+    
+    def _prepare_search_query(self, query: str, conversation_id: Optional[str] = None) -> str:
+        """Replace department names and enrich vague queries before retrieval"""
         import re
         
         # Department detection in query - 100% RAG from KB
@@ -91,29 +196,18 @@ class AIAgent:
                 logger.info("Department detected and replaced", extra={"dept": dept, "ville": ville, "query": query})
                 break
         
-        # Enrich vague queries with conversation context (last restaurant mentioned)
-        # Get all cities dynamically from KB
-        all_cities = self.kb.get_all_cities()  # Dynamic from KB
+        # Enrich vague queries with this conversation's last mentioned city
         vague_queries = ['url', 'lien', 'site', 'link', 'tel', 'telephone', 'adresse', 'address']
         if query_lower.strip() in vague_queries or (len(query.split()) <= 2 and not dept_found):
-            # Extract city from last 3 messages across all active conversations
-            # (Fallback: check most recent conversation for context)
-            recent_messages = []
-            for conv_messages in self.conversations.values():
-                recent_messages.extend(conv_messages[-3:])
-            
-            for msg in reversed(recent_messages[-10:]):  # Check last 10 messages max
-                content = msg.get('content', '').lower()
-                for ville in all_cities:
-                    if ville.lower() in content:
-                        query = f"{query} {ville}"
-                        logger.info("Vague query enriched with conversation context", extra={"original_query": query_lower, "enriched_query": query, "ville": ville})
-                        break
-                if any(v.lower() in content for v in all_cities):
-                    break
-        
-        results = self.kb.search(query, limit=5)
+            ville = self.conversations.last_city(conversation_id) if conversation_id else None
+            if ville:
+                query = f"{query} {ville}"
+                logger.info("Vague query enriched with conversation context", extra={"original_query": query_lower, "enriched_query": query, "ville": ville})
         
+        return query
+    
+    def _format_knowledge_results(self, results: List[Dict]) -> str:
+        """Join retrieved documents into tool context"""
         if not results:
             return "[HORS_PERIMETRE] Cette information n'est pas disponible sur notre site web. Pour des questions spécifiques (parking, événements, réservations privées...), contactez directement le restaurant concerné."
         
@@ -127,7 +221,10 @@ class AIAgent:
         return "\n\n".join(context)
     
     def get_restaurants(self) -> str:
-        """Liste tous les restaurants Bolkiri"""
+        """Liste tous les restaurants Bolkiri (formatted once per KB version)"""
+        return self.kb.views.get('restaurants_overview', self._format_restaurants)
+    
+    def _format_restaurants(self) -> str:
         restaurants = self.kb.get_all_restaurants()
         
         if not restaurants:
@@ -139,17 +236,23 @@ class AIAgent:
             result += f"• {resto['name']}\n"
             result += f"   Adresse : {resto['adresse']}\n"
             result += f"   Téléphone : {resto['telephone']}\n"
-            result += f"   Email : {resto['email']}\n"
+            result += f"   Email : {resto.get('email', 'N/A')}\n"
             result += f"   Services : {', '.join(resto.get('services', []))}\n\n"
         
         return result
     
     def get_restaurant_info(self, ville: str) -> str:
         """Detailed info for specific restaurant - supports department and postal code"""
-        # Use RAG for intelligent search
-        results = self.kb.search(f"restaurant {ville}", limit=3)
-        
-        if not results:
+        # Structured lookup (city, slug, postal code, department, aliases) - no embedding call
+        return self._format_restaurant_info(ville, self.kb.lookup_restaurants(ville))
+    
+    async def aget_restaurant_info(self, ville: str) -> str:
+        """Async variant of get_restaurant_info (lookup is in-memory, nothing to await)"""
+        return self.get_restaurant_info(ville)
+    
+    def _format_restaurant_info(self, ville: str, restaurants: List[Dict]) -> str:
+        """Format matching restaurants, or list available restaurants"""
+        if not restaurants:
             # List all available restaurants
             all_restos = self.kb.get_all_restaurants()
             return f"Restaurant non trouvé pour '{ville}'.\n\n" + \
@@ -157,9 +260,26 @@ class AIAgent:
                    "\n".join([f"- {r.get('name', 'N/A')}" for r in all_restos[:10]]) + \
                    "\n\n(10 premiers restaurants affichés)"
         
-        # Take best result
-        best_result = results[0]
-        return f"[RESTAURANT TROUVE]\n\n{best_result.get('content', 'Information non disponible')}"
+        if len(restaurants) == 1:
+            return f"[RESTAURANT TROUVE]\n\n{self._restaurant_details(restaurants[0])}"
+        
+        # Department or ambiguous city: every matching restaurant
+        details = "\n\n".join(self._restaurant_details(r) for r in restaurants)
+        return f"[RESTAURANTS TROUVES] {len(restaurants)} restaurants pour '{ville}':\n\n{details}"
+    
+    def _restaurant_details(self, resto: Dict) -> str:
+        """Restaurant card: scraped description, or rebuilt from structured fields"""
+        if resto.get('description'):
+            return resto['description']
+        
+        lines = [f"Restaurant {resto.get('name', 'N/A')}", f"Adresse: {resto.get('adresse', 'N/A')}"]
+        if resto.get('telephone'):
+            lines.append(f"Téléphone: {resto['telephone']}")
+        for jour, heures in resto.get('horaires', {}).items():
+            lines.append(f"{jour}: {heures}")
+        if resto.get('url'):
+            lines.append(f"Page du restaurant: {resto['url']}")
+        return "\n".join(lines)
     
     def get_menu(self) -> str:
         """Complete menu with categories"""
@@ -181,10 +301,7 @@ class AIAgent:
         for cat, plats in categories.items():
             result += f"━━━ {cat.upper()} ━━━\n\n"
             for plat in plats[:5]:  # Limit to avoid overload
-                result += f"• {plat['nom']}"
-                if plat.get('nom_vietnamien'):
-                    result += f" ({plat['nom_vietnamien']})"
-                result += f" - {plat['prix']}\n"
+                result += f"• {self._dish_label(plat)}\n"
                 if plat.get('description'):
                     result += f"  {plat['description'][:100]}\n"
                 
@@ -208,48 +325,48 @@ class AIAgent:
         
         return result
     
+    @staticmethod
+    def _dish_label(plat: Dict) -> str:
+        """Name, Vietnamese name and price (scraped dishes often have no price)"""
+        label = plat['nom']
+        if plat.get('nom_vietnamien'):
+            label += f" ({plat['nom_vietnamien']})"
+        if plat.get('prix'):
+            label += f" - {plat['prix']}"
+        return label
+    
     def filter_menu(self, criteria: str) -> str:
-        """Intelligent menu filtering"""
+        """Intelligent menu filtering (local dish table, no API call)"""
+        return self._filter_menu_structured(criteria, self._parse_menu_criteria(criteria))
+    
+    async def afilter_menu(self, criteria: str) -> str:
+        """Async variant of filter_menu"""
+        return self.filter_menu(criteria)
+    
+    def _parse_menu_criteria(self, criteria: str) -> Dict:
+        """Detect diet flags and max price in free-text criteria"""
         criteria_lower = criteria.lower()
         
-        # Detect filters
-        vegetarien = 'végétarien' in criteria_lower or 'vegetarien' in criteria_lower or 'veggie' in criteria_lower
-        vegan = 'vegan' in criteria_lower
-        sans_gluten = 'sans gluten' in criteria_lower or 'gluten' in criteria_lower
-        epice = 'épicé' in criteria_lower or 'epice' in criteria_lower or 'piquant' in criteria_lower
-        
         # Extract max price
         import re
         prix_match = re.search(r'(\d+)\s*€', criteria)
-        prix_max = float(prix_match.group(1)) if prix_match else None
-        
-        # For vegetarian/vegan, use RAG search (KB has tags, not structured fields)
-        if vegetarien or vegan:
-            search_term = "végétarien" if vegetarien else "vegan"
-            results = self.kb.search(f"plat {search_term} menu", limit=10)
-            
-            if not results:
-                return f"Aucun plat trouvé correspondant à: {criteria}"
-            
-            result = f"Plats correspondant à '{criteria}':\n\n"
-            for item in results[:10]:
-                content = item.get('content', '')
-                # Extract dish name from content (first line usually)
-                lines = content.split('\n')
-                dish_name = lines[0] if lines else content[:50]
-                result += f"• {dish_name}\n"
-                if len(content) > 100:
-                    result += f"  {content[50:150]}...\n"
-                result += "\n"
-            
-            return result
         
-        # For other filters, use structured filtering
+        return {
+            'vegetarien': 'végétarien' in criteria_lower or 'vegetarien' in criteria_lower or 'veggie' in criteria_lower,
+            'vegan': 'vegan' in criteria_lower,
+            'sans_gluten': 'sans gluten' in criteria_lower or 'gluten' in criteria_lower,
+            'epice': 'épicé' in criteria_lower or 'epice' in criteria_lower or 'piquant' in criteria_lower,
+            'prix_max': float(prix_match.group(1)) if prix_match else None
+        }
+    
+    def _filter_menu_structured(self, criteria: str, filters: Dict) -> str:
+        """Structured filtering on menu fields"""
         filtered = self.kb.filter_menu(
-            vegetarien=vegetarien if vegetarien else None,
-            vegan=vegan if vegan else None,
-            sans_gluten=sans_gluten if sans_gluten else None,
-            prix_max=prix_max
+            vegetarien=filters['vegetarien'] if filters['vegetarien'] else None,
+            vegan=filters['vegan'] if filters['vegan'] else None,
+            sans_gluten=filters['sans_gluten'] if filters['sans_gluten'] else None,
+            epice=True if filters['epice'] else None,
+            prix_max=filters['prix_max']
         )
         
         if not filtered:
@@ -257,7 +374,7 @@ class AIAgent:
         
         result = f"Plats correspondant à '{criteria}':\n\n"
         for plat in filtered[:10]:
-            result += f"• {plat['nom']} - {plat['prix']}\n"
+            result += f"• {self._dish_label(plat)}\n"
             if plat.get('description'):
                 result += f"  {plat['description'][:100]}\n"
             result += "\n"
@@ -306,7 +423,14 @@ class AIAgent:
     def find_nearest_restaurant(self, ville_reference: str) -> str:
         """Find nearest Bolkiri restaurant from a reference city"""
         result = self.kb.find_nearest_restaurant(ville_reference)
-        
+        return self._format_nearest_restaurant(ville_reference, result)
+    
+    async def afind_nearest_restaurant(self, ville_reference: str) -> str:
+        """Async variant of find_nearest_restaurant (non-blocking geocoding)"""
+        result = await self.kb.afind_nearest_restaurant(ville_reference)
+        return self._format_nearest_restaurant(ville_reference, result)
+    
+    def _format_nearest_restaurant(self, ville_reference: str, result: Dict) -> str:
         if result.get('error'):
             return f"[ERREUR] {result['error']}\n\nVoici la liste de tous nos restaurants:\n{self.get_restaurants()}"
         
@@ -321,6 +445,12 @@ class AIAgent:
         if result.get('url'):
             output += f'Plus d\'infos: <a href="{result["url"]}" target="_blank">BOLKIRI {result["ville"]}</a>\n'
         
+        others = result.get('nearest', [])[1:]
+        if others:
+            output += "\nAUTRES RESTAURANTS PROCHES:\n"
+            for other in others:
+                output += f"• {other['restaurant'].strip()} ({other['ville']}) - {other['distance_km']} km - {other['adresse']}\n"
+        
         return output
     
     def get_hours(self, ville: Optional[str] = None) -> str:
@@ -387,7 +517,7 @@ class AIAgent:
             if signatures:
                 result = "PLATS SIGNATURE:\n\n"
                 for plat in signatures[:3]:
-                    result += f"• {plat['nom']} - {plat['prix']}\n"
+                    result += f"• {self._dish_label(plat)}\n"
                     result += f"  {plat.get('description', '')}\n\n"
                 return result
             else:
@@ -395,10 +525,7 @@ class AIAgent:
         
         result = "PLATS RECOMMANDÉS:\n\n"
         for plat, _ in recommendations[:3]:
-            result += f"• {plat['nom']}"
-            if plat.get('nom_vietnamien'):
-                result += f" ({plat['nom_vietnamien']})"
-            result += f" - {plat['prix']}\n"
+            result += f"• {self._dish_label(plat)}\n"
             result += f"   {plat.get('description', '')}\n"
             
             # Why recommended
@@ -415,13 +542,11 @@ class AIAgent:
             result += "\n"
         
         return result
-        
-        return result
     
-    def execute_tool(self, tool_name: str, parameters: Dict) -> str:
+    def execute_tool(self, tool_name: str, parameters: Dict, conversation_id: Optional[str] = None) -> str:
         """Execute tool with enriched tool set"""
         if tool_name == "search_knowledge":
-            return self.search_knowledge(parameters.get("query", ""))
+            return self.search_knowledge(parameters.get("query", ""), conversation_id)
         elif tool_name == "get_restaurants":
             return self.get_restaurants()
         elif tool_name == "get_restaurant_info":
@@ -441,7 +566,121 @@ class AIAgent:
         else:
             return f"Outil inconnu: {tool_name}"
     
-    def plan_and_execute(self, user_query: str) -> str:
+    async def aexecute_tool(self, tool_name: str, parameters: Dict, conversation_id: Optional[str] = None) -> str:
+        """Async variant of execute_tool
+        
+        Tools doing network I/O (embeddings, geocoding) are awaited natively,
+        the others only read in-memory KB data and run inline.
+        """
+        if tool_name == "search_knowledge":
+            return await self.asearch_knowledge(parameters.get("query", ""), conversation_id)
+        elif tool_name == "get_restaurant_info":
+            return await self.aget_restaurant_info(parameters.get("ville", ""))
+        elif tool_name == "filter_menu":
+            return await self.afilter_menu(parameters.get("criteria", ""))
+        elif tool_name == "find_nearest_restaurant":
+            return await self.afind_nearest_restaurant(parameters.get("ville_reference", ""))
+        return self.execute_tool(tool_name, parameters, conversation_id)
+    
+    def _record_tool_latency(self, tool_name: str, elapsed_ms: float, status: str):
+        """Accumulate per-tool latency counters and log the execution"""
+        with self._tool_metrics_lock:
+            stats = self.tool_metrics.setdefault(tool_name, {
+                'calls': 0, 'errors': 0, 'timeouts': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if status == 'error':
+                stats['errors'] += 1
+            elif status == 'timeout':
+                stats['timeouts'] += 1
+        tracing.record_tool(tool_name, elapsed_ms / 1000, status)
+        
+        logger.info("Tool executed", extra={"tool_name": tool_name, "latency_ms": round(elapsed_ms, 1), "status": status})
+    
+    def _run_tools(self, steps: List[Dict], conversation_id: Optional[str] = None) -> List[str]:
+        """Run planned tools in parallel on the bounded executor
+        
+        Results keep plan order. A tool that fails or exceeds
+        TOOL_TIMEOUT_SECONDS is dropped from the context.
+        """
+        def timed(step: Dict) -> Tuple[str, float]:
+            start = time.perf_counter()
+            result = self.execute_tool(step.get("tool"), step.get("parameters", {}), conversation_id)
+            return result, (time.perf_counter() - start) * 1000
+        
+        submitted = time.perf_counter()
+        # Each tool runs in the caller's context so its stages and logs carry the trace
+        futures = [self.tool_executor.submit(contextvars.copy_context().run, timed, step) for step in steps]
+        
+        results = []
+        for step, future in zip(steps, futures):
+            tool_name = step.get("tool")
+            remaining = max(0.0, TOOL_TIMEOUT_SECONDS - (time.perf_counter() - submitted))
+            try:
+                result, elapsed_ms = future.result(timeout=remaining)
+                self._record_tool_latency(tool_name, elapsed_ms, 'ok')
+                results.append(result)
+            except FutureTimeoutError:
+                future.cancel()
+                self._record_tool_latency(tool_name, TOOL_TIMEOUT_SECONDS * 1000, 'timeout')
+            except Exception as e:
+                self._record_tool_latency(tool_name, (time.perf_counter() - submitted) * 1000, 'error')
+                logger.error("Tool execution failed", extra={"tool_name": tool_name, "error_type": type(e).__name__})
+        
+        return results
+    
+    async def _arun_tools(self, steps: List[Dict], conversation_id: Optional[str] = None) -> List[str]:
+        """Async counterpart of _run_tools using asyncio.gather"""
+        async def timed(step: Dict) -> Optional[str]:
+            tool_name = step.get("tool")
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    self.aexecute_tool(tool_name, step.get("parameters", {}), conversation_id),
+                    timeout=TOOL_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                self._record_tool_latency(tool_name, (time.perf_counter() - start) * 1000, 'timeout')
+                return None
+            except Exception as e:
+                self._record_tool_latency(tool_name, (time.perf_counter() - start) * 1000, 'error')
+                logger.error("Tool execution failed", extra={"tool_name": tool_name, "error_type": type(e).__name__})
+                return None
+            self._record_tool_latency(tool_name, (time.perf_counter() - start) * 1000, 'ok')
+            return result
+        
+        results = await asyncio.gather(*(timed(step) for step in steps))
+        return [result for result in results if result is not None]
+    
+    def _get_router(self) -> Optional[IntentRouter]:
+        """Intent router for the current KB (rebuilt when the KB is replaced)"""
+        if not INTENT_ROUTER_ENABLED:
+            return None
+        kb = self.kb
+        if self._router is None or self._router_kb is not kb:
+            with self._router_lock:
+                # Centroid fitting embeds every seed utterance: only one thread does it
+                if self._router is None or self._router_kb is not kb:
+                    embed_fn = kb.rag_engine._get_embedding if INTENT_ROUTER_CENTROIDS else None
+                    router = IntentRouter(kb, self.tools, embed_fn=embed_fn)
+                    if embed_fn is not None:
+                        router.fit_centroids()
+                    self._router, self._router_kb = router, kb
+        return self._router
+    
+    def _route_or_plan_locally(self, user_query: str) -> Optional[List[Dict]]:
+        """Fast path: tool plan from the intent router, None if unsure"""
+        try:
+            router = self._get_router()
+            return router.route(user_query) if router else None
+        except Exception as e:
+            logger.warning("Intent router failed", extra={"error_type": type(e).__name__})
+            return None
+    
+    def _planning_prefix(self) -> str:
+        """Planner instructions, tools and department rules - built once per KB version"""
         # 100% RAG - Build department rules dynamically from KB
         dept_mapping = self.kb.get_department_mapping()
         dept_rules = "\n".join([
@@ -450,17 +689,17 @@ class AIAgent:
             if dept.isdigit()  # Only numeric department codes
         ])
         
-        planning_prompt = f"""Tu es un agent IA autonome et intelligent pour le restaurant Bolkiri.
+        return f"""{PLANNING_SYSTEM_PROMPT}
 
-Outils disponibles:
-{json.dumps(self.tools, indent=2, ensure_ascii=False)}
+Tu es un agent IA autonome et intelligent pour le restaurant Bolkiri.
 
-Question client: "{user_query}"
+Outils disponibles:
+{self.tools_json}
 
 RÈGLE IMPORTANTE - DÉPARTEMENTS (auto-généré depuis base de connaissances):
 {dept_rules}
 
-Analyse la question et choisis les meilleurs outils à utiliser.
+Analyse la question du client et choisis les meilleurs outils à utiliser.
 
 Réponds UNIQUEMENT avec un JSON valide (pas de texte avant ou après):
 {{
@@ -468,38 +707,81 @@ Réponds UNIQUEMENT avec un JSON valide (pas de texte avant ou après):
     {{"tool": "nom_outil", "parameters": {{"param": "valeur"}}}}
   ]
 }}"""
-
+    
+    def _build_planning_messages(self, user_query: str) -> List[Dict]:
+        """Static planner prefix (cached per KB version) + the question"""
+        prefix = self.kb.views.get('planning_prompt', self._planning_prefix)
+        return [
+            {"role": "system", "content": prefix},
+            {"role": "user", "content": f'Question client: "{user_query}"'}
+        ]
+    
+    def _parse_plan(self, plan_text: str, user_query: str) -> List[Dict]:
+        """Parse planner JSON output into at most 3 tool steps"""
+        plan_text = plan_text.strip().replace('```json', '').replace('```', '').strip()
+        
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Agent de planning multi-tool. Analyse query → Sélection outils optimaux → Output JSON strict (pas texte). Capacité: décomposition requêtes complexes en étapes parallèles."},
-                    {"role": "user", "content": planning_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=300
-            )
+            plan = json.loads(plan_text)
+        except:
+            plan = {"tools_to_use": [{"tool": "search_knowledge", "parameters": {"query": user_query}}]}
+        
+        return plan.get("tools_to_use", [])[:3]
+    
+    def plan_and_execute(self, user_query: str, conversation_id: Optional[str] = None) -> str:
+        try:
+            with tracing.span("routing"):
+                steps = self._route_or_plan_locally(user_query)
+            if steps is None:
+                with tracing.span("planning"):
+                    response = self.client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=self._build_planning_messages(user_query),
+                        temperature=0.3,
+                        max_tokens=300
+                    )
+                self._log_usage("planning", response.usage)
+                steps = self._parse_plan(response.choices[0].message.content, user_query)
             
-            plan_text = response.choices[0].message.content.strip()
+            with tracing.span("tools"):
+                results = self._run_tools(steps, conversation_id)
             
-            plan_text = plan_text.replace('```json', '').replace('```', '').strip()
+            return "\n\n".join(results) if results else self.search_knowledge(user_query, conversation_id)
             
-            try:
-                plan = json.loads(plan_text)
-            except:
-                plan = {"tools_to_use": [{"tool": "search_knowledge", "parameters": {"query": user_query}}]}
-            
-            results = []
-            for step in plan.get("tools_to_use", [])[:3]:
-                tool_name = step.get("tool")
-                parameters = step.get("parameters", {})
-                result = self.execute_tool(tool_name, parameters)
-                results.append(result)
+        except Exception as e:
+            return self.search_knowledge(user_query, conversation_id)
+    
+    async def aplan_and_execute(self, user_query: str, conversation_id: Optional[str] = None) -> str:
+        """Async variant of plan_and_execute built on AsyncOpenAI"""
+        try:
+            with tracing.span("routing"):
+                if INTENT_ROUTER_CENTROIDS:
+                    # Centroid fitting and lookups call the (sync) embeddings API
+                    steps = await asyncio.to_thread(self._route_or_plan_locally, user_query)
+                else:
+                    steps = self._route_or_plan_locally(user_query)
+            if steps is None:
+                with tracing.span("planning"):
+                    response = await self.async_client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=self._build_planning_messages(user_query),
+                        temperature=0.3,
+                        max_tokens=300
+                    )
+                self._log_usage("planning", response.usage)
+                steps = self._parse_plan(response.choices[0].message.content, user_query)
+            
+            with tracing.span("tools"):
+                results = await self._arun_tools(steps, conversation_id)
             
-            return "\n\n".join(results) if results else self.search_knowledge(user_query)
+            return "\n\n".join(results) if results else await self.asearch_knowledge(user_query, conversation_id)
             
         except Exception as e:
-            return self.search_knowledge(user_query)
+            return await self.asearch_knowledge(user_query, conversation_id)
+    
+    def _validator(self) -> ResponseValidator:
+        """Validator compiled for the current KB (department codes, cities)"""
+        return self.kb.views.get('response_validator',
+                                 lambda: ResponseValidator(self.kb.get_department_mapping()))
     
     def _validate_response(self, response: str, context: str, user_query: str) -> Tuple[str, bool]:
         """Validate generated response against context and detect hallucinations
@@ -507,231 +789,332 @@ Réponds UNIQUEMENT avec un JSON valide (pas de texte avant ou après):
         Returns:
             (corrected_response, is_valid)
         """
-        response_lower = response.lower()
-        context_lower = context.lower()
-        
-        # 1. Check restaurant contradictions
-        if "[restaurant trouvé]" in context_lower or "restaurant" in context_lower:
-            # Detect negative phrases when restaurant exists
-            negative_phrases = [
-                "n'avons pas de restaurant",
-                "pas de restaurant dans",
-                "aucun restaurant dans",
-                "malheureusement pas",
-                "ne disposons pas"
-            ]
-            
-            for phrase in negative_phrases:
-                if phrase in response_lower:
-                    logger.warning("Restaurant hallucination detected", extra={"phrase": phrase, "validation_result": "negative_phrase_despite_positive_context"})
-                    # Return simple and direct corrected response
-                    # Extract city/department from query - 100% RAG
-                    import re
-                    dept_mapping = self.kb.get_department_mapping()
-                    dept_codes = [d for d in dept_mapping.keys() if d.isdigit()]
-                    dept_pattern = r'\b(' + '|'.join(dept_codes) + r')\b'
-                    dept_match = re.search(dept_pattern, user_query)
-                    
-                    if dept_match or any(d in user_query.lower() for d in dept_mapping.keys()):
-                        # Use get_restaurant_info for structured response
-                        dept = dept_match.group(1) if dept_match else user_query
-                        corrected = self.get_restaurant_info(dept)
-                        return corrected, False
-                    # Otherwise return generic message based on context
-                    return "Oui, nous avons plusieurs restaurants en Île-de-France. Pour plus de détails sur un restaurant spécifique, précisez la ville ou le département.", False
-        
-        # 2. Check schedule inconsistencies
-        import re
-        # Extract hours from context (format HH:MM-HH:MM)
-        context_hours = re.findall(r'\d{1,2}:\d{2}-\d{1,2}:\d{2}', context)
-        # Extract hours from response (format HH:MM-HH:MM or HHhMM-HHhMM)
-        response_hours = re.findall(r'\d{1,2}[h:]?\d{2}\s?-\s?\d{1,2}[h:]?\d{2}', response)
-        
-        if context_hours and response_hours:
-            # Normalize for comparison
-            def normalize_hour(h):
-                # "11:30" or "11h30" → "1130"
-                return re.sub(r'[:\sh-]', '', h)
-            
-            context_normalized = set(normalize_hour(h) for h in context_hours)
-            response_normalized = set(normalize_hour(h) for h in response_hours)
-            
-            # If completely different hours
-            if context_normalized and not any(rh in ' '.join(context_normalized) for rh in response_normalized):
-                logger.warning("Schedule hallucination detected", extra={"context_hours": context_hours, "response_hours": response_hours})
-                # Replace hours in response with context hours
-                corrected = response
-                for wrong_hour in response_hours:
-                    # Replace with real context hours
-                    if context_hours:
-                        corrected = corrected.replace(wrong_hour, context_hours[0])
-                return corrected, False
-        
-        # 3. Check department/city coherence - 100% RAG
-        dept_mapping = self.kb.get_department_mapping()
-        # Filter to numeric departments only and lowercase cities for comparison
-        dept_ville = {
-            dept: ville.lower() 
-            for dept, ville in dept_mapping.items() 
-            if dept.isdigit()
-        }
+        report = self._validator().validate(response, context, user_query)
+        if report['valid']:
+            return response, True
         
-        for dept, ville in dept_ville.items():
-            # If question mentions department
-            if dept in user_query.lower():
-                # But response says "no restaurant" AND context mentions the city
-                if ville in context_lower and any(neg in response_lower for neg in ["pas de restaurant", "aucun restaurant"]):
-                    logger.warning("Department contradiction detected", extra={"department": dept, "ville": ville})
-                    # Use get_restaurant_info for clean response
-                    corrected = self.get_restaurant_info(dept)
-                    return corrected, False
-        
-        # 4. Check aberrant or hallucinated prices
-        context_prices = re.findall(r'(\d+[,.]?\d*)\s*€', context)
-        response_prices = re.findall(r'(\d+[,.]?\d*)\s*€', response)
-        
-        # If response mentions prices BUT context has NONE → Hallucination
-        if response_prices and not context_prices:
-            logger.warning("Price hallucination detected", extra={"response_prices": response_prices, "context_empty": True})
-            # Replace all prices with generic message
-            corrected = re.sub(r'\d+[,.]?\d*\s*€', '', response)
-            corrected += "\n\nPrix disponibles sur la carte en restaurant. Contactez-nous pour plus d'informations."
-            return corrected.strip(), False
-        
-        if context_prices and response_prices:
-            context_nums = [float(p.replace(',', '.')) for p in context_prices]
-            response_nums = [float(p.replace(',', '.')) for p in response_prices]
-            
-            # If price in response > 2x max of context
-            if max(response_nums) > max(context_nums) * 2:
-                logger.warning("Aberrant price detected", extra={"context_max": max(context_nums), "response_max": max(response_nums)})
-                # Correct by replacing aberrant prices
-                corrected = response
-                for i, wrong_price in enumerate(response_prices):
-                    if i < len(context_prices):
-                        corrected = corrected.replace(f"{wrong_price}€", f"{context_prices[i]}€")
-                return corrected, False
-        
-        # Valid response
-        return response, True
+        logger.warning("Hallucination detected", extra={
+            "validation_result": [finding['check'] for finding in report['findings']],
+            "findings": report['findings']
+        })
+        first = report['findings'][0]
+        if first['check'] in ('restaurant', 'department'):
+            # Restaurant exists: answer from the KB instead of the denial
+            if first['department']:
+                return self.get_restaurant_info(first['department']), False
+            return GENERIC_RESTAURANT_ANSWER, False
+        return report['response'], False
     
-    def chat(self, user_message: str, conversation_id: Optional[str] = None) -> str:
-        self.agent_state['total_interactions'] += 1
+    def _build_chat_messages(self, user_message: str, conversation_id: Optional[str], context: str) -> List[Dict]:
+        """Record the user turn and assemble system prompt + recent history"""
+        self._record_message(conversation_id, "user", user_message)
         
-        # Initialize conversation if new
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = []
+        # Byte-stable prefix (static prompt + earlier turns) for provider-side prompt
+        # caching; the per-request context goes last, right before the question
+        history = self.conversations.history(conversation_id, limit=10)
+        return [{"role": "system", "content": CHAT_SYSTEM_PROMPT}] + history[:-1] + [
+            {"role": "system", "content": f"RETRIEVED CONTEXT FROM TOOLS:\n{context}"},
+            history[-1]
+        ]
+    
+    def _finalize_response(self, assistant_message: str, context: str, user_message: str, conversation_id: Optional[str]) -> str:
+        """Validate, strip markdown and record the assistant turn"""
+        # AUTOMATIC RESPONSE VALIDATION
+        try:
+            with tracing.span("validation"):
+                validated_message, is_valid = self._validate_response(assistant_message, context, user_message)
+            
+            if not is_valid:
+                logger.info("Response corrected by validator", extra={"validation_result": "invalid_corrected"})
+                assistant_message = validated_message
+            else:
+                logger.info("Response validated successfully", extra={"validation_result": "valid"})
+        except Exception as e:
+            logger.error("Validation error", extra={"error_type": type(e).__name__}, exc_info=True)
+            # In case of validation error, keep original response
         
-        context = self.plan_and_execute(user_message)
+        # POST-PROCESSING: Strip markdown syntax (bold, italic, underline)
+        assistant_message = strip_markdown(assistant_message)
         
-        # Dynamically load restaurant info
-        restaurants = self.kb.get_all_restaurants()
-        restaurants_info = []
-        for resto in restaurants:
-            # Extract city from name "BOLKIRI {city} Street Food Viêt"
-            name = resto.get('name', '')
-            ville = name.replace('BOLKIRI', '').replace('Street Food Viêt', '').strip()
-            telephone = resto.get('telephone', 'N/A')
-            adresse = resto.get('adresse', 'N/A')
-            restaurants_info.append(f"  * {ville} - {adresse} - Tel: {telephone}")
-        restaurants_list = "\n".join(restaurants_info)
-        
-        system_prompt = f"""AGENTIC AI SYSTEM - Tool-First RAG Architecture
-
-CRITICAL: You are a TOOL-CALLING agent. Always use tools to retrieve context before responding. Never answer from memory.
-
-LANGUAGE: Auto-detect query language (French/English/Vietnamese). Respond in SAME language detected.
-
-AVAILABLE TOOLS (use these first):
-1. search_knowledge(query) - Semantic search across all KB
-2. get_restaurants() - List all 20 restaurant locations
-3. get_menu() - Full menu with prices
-4. filter_menu(vegetarian=True/False, vegan=True/False) - Filtered dishes
-5. get_restaurant_info(city_or_dept) - Specific location details
-6. recommend_dish(preferences) - Personalized suggestions
-7. get_contact() - Contact information
-8. detect_department(query) - Extract department code from query
-
-AGENTIC WORKFLOW:
-Step 1: Analyze query intent
-Step 2: Select 1-3 relevant tools
-Step 3: Execute tools to retrieve RAG context
-Step 4: Synthesize response from retrieved context ONLY
-Step 5: Automatic validation (restaurants/schedules/prices/departments)
-
-RETRIEVED CONTEXT FROM TOOLS:
-{context}
-
-GENERATION CONSTRAINTS:
-- Context is absolute source of truth. Never contradict retrieved data.
-- If context empty or contains [HORS_PERIMETRE]: Say "Cette information n'est pas disponible sur le site pour le moment." + suggest contacting restaurant directly.
-- Schedules: Use exact format from context (11:30-14:30). If missing: "Ces horaires ne sont pas disponibles sur le site pour le moment."
-- Prices: Only mention if present in context. If missing: "Les prix sont disponibles sur la carte en restaurant."
-- Links: If context has HTML tags <a href>, copy EXACTLY as-is (preserve HTML).
-- Format: Plain text only. NO markdown syntax (no bold/italic/underline markers).
-
-MULTI-STEP REASONING EXAMPLES:
-Query "vegetarian menu in Essonne" → detect_department("Essonne") → filter_menu(vegetarian=True) + get_restaurant_info("91") → synthesize
-Query "do you have spring rolls" → search_knowledge("spring rolls") → extract dishes → respond with HTML links from context
-Query "yes" (after confirmation request) → execute previously suggested action (get_menu or filter_menu)
-
-RESPONSE STYLE: First-person plural, concise, conversational. Respect detected language.
-"""
-
-        self.conversations[conversation_id].append({
-            "role": "user",
-            "content": user_message
-        })
+        self._record_message(conversation_id, "assistant", assistant_message)
+        
+        return assistant_message
+    
+    def _record_message(self, conversation_id: Optional[str], role: str, content: str):
+        """Append a turn and remember the city it names, if exactly one"""
+        self.conversations.append(conversation_id, {"role": role, "content": content})
         
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ] + self.conversations[conversation_id][-10:]
+        mentioned = self._mentioned_cities(content)
+        if len(mentioned) == 1:
+            self.conversations.set_last_city(conversation_id, mentioned.pop())
+    
+    def _mentioned_cities(self, text: str) -> Set[str]:
+        text_lower = text.lower()
+        return {ville for ville in self.kb.get_all_cities() if ville.lower() in text_lower}
+    
+    def _menu_entities(self, text: str) -> Set[str]:
+        vocabulary = self.kb.views.get('menu_vocabulary', lambda: menu_vocabulary(
+            [item.get('nom', '') for item in self.kb.get_all_menu_items()]
+            + [item.get('categorie', '') for item in self.kb.get_all_menu_items()]
+        ))
+        return menu_entities(text, vocabulary)
+    
+    def _cache_scope(self, user_message: str, conversation_id: Optional[str]) -> Optional[FrozenSet[str]]:
+        """Cities, places and menu entities the answer depends on, or None when earlier turns may change its meaning"""
+        if not RESPONSE_CACHE_ENABLED:
+            return None
+        cities = frozenset(self._mentioned_cities(user_message))
+        if self.conversations.history(conversation_id, limit=1):
+            tokens = tokenize(user_message)
+            if len(tokens) <= 2 or tokens[0] in FOLLOW_UP_OPENERS or FOLLOW_UP_WORDS.intersection(tokens):
+                return None
+            if not cities and self.conversations.last_city(conversation_id):
+                # "quels horaires ?" after talking about Ivry means Ivry's hours
+                return None
+        entities = cities | self._menu_entities(user_message)
+        # "le plus proche de Melun" and "... de Meaux" are near-duplicates for the
+        # embedding and Melun is not a KB city: the place itself must match
+        reference = nearest_reference(user_message)
+        if reference:
+            entities |= {"place:" + " ".join(tokenize(reference))}
+        return entities
+    
+    async def _off_loop(self, func, *args):
+        """Run a helper that reads or writes conversations, in a thread when the store does I/O"""
+        if self.conversations.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+    
+    def _valid_cache_embedding(self, embedding) -> Optional[np.ndarray]:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding if embedding.ndim == 1 and embedding.size else None
+    
+    def _semantic_lookup_useful(self, user_message: str, scope: Optional[FrozenSet[str]]) -> bool:
+        return (RESPONSE_CACHE_SEMANTIC and scope is not None
+                and self.response_cache.has_semantic_candidates(user_message, self.kb.version, scope))
+    
+    def _cache_embedding(self, user_message: str, scope: Optional[FrozenSet[str]]) -> Optional[np.ndarray]:
+        """Message embedding for near-duplicate lookups, None when no cached answer could match
         
+        Costs an embeddings call unless the text was embedded before (query
+        embedding cache); it is skipped when the cache holds no candidate for
+        the message's entities.
+        """
+        if not self._semantic_lookup_useful(user_message, scope):
+            return None
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                temperature=0.1,  # Minimal for consistency while keeping some naturalness
-                max_tokens=500
-            )
+            return self._valid_cache_embedding(self.kb.rag_engine._get_embedding(user_message))
+        except Exception as e:
+            logger.warning("Response cache embedding failed", extra={"error_type": type(e).__name__})
+            return None
+    
+    async def _acache_embedding(self, user_message: str, scope: Optional[FrozenSet[str]]) -> Optional[np.ndarray]:
+        if not self._semantic_lookup_useful(user_message, scope):
+            return None
+        try:
+            return self._valid_cache_embedding(await self.kb.rag_engine._aget_embedding(user_message))
+        except Exception as e:
+            logger.warning("Response cache embedding failed", extra={"error_type": type(e).__name__})
+            return None
+    
+    def _cached_response(self, user_message: str, conversation_id: Optional[str],
+                         scope: Optional[FrozenSet[str]], embedding: Optional[np.ndarray]) -> Optional[str]:
+        """Answer served from the response cache (both turns recorded), None on miss"""
+        if scope is None:
+            self.response_cache.skip()
+            return None
+        cached = self.response_cache.get(user_message, self.kb.version, scope, embedding)
+        if cached is None:
+            return None
+        self._record_message(conversation_id, "user", user_message)
+        self._record_message(conversation_id, "assistant", cached)
+        logger.info("Response cache hit", extra={"cache_stats": self.response_cache.stats()})
+        return cached
+    
+    def _store_response(self, user_message: str, response: str,
+                        scope: Optional[FrozenSet[str]], embedding: Optional[np.ndarray]):
+        if scope is None:
+            return
+        if embedding is None and RESPONSE_CACHE_SEMANTIC:
+            # Reuse the retrieval embedding when search ran on the message text; never a new API call
+            try:
+                peeked = self.kb.rag_engine.query_cache.peek(user_message)
+                embedding = self._valid_cache_embedding(peeked) if peeked is not None else None
+            except Exception:
+                embedding = None
+        self.response_cache.put(user_message, self.kb.version, response, scope, embedding)
+    
+    def _log_usage(self, stage: str, usage) -> None:
+        """Count and log prompt/completion tokens and how many prompt tokens hit the provider cache"""
+        tokens = tracing.record_usage(stage, usage)
+        if tokens is None:
+            return
+        logger.info("LLM token usage", extra={
+            "stage": stage,
+            "prompt_tokens": tokens['prompt'],
+            "completion_tokens": tokens['completion'],
+            "cached_tokens": tokens['cached']
+        })
+    
+    def _start_turn(self):
+        self.agent_state['total_interactions'] += 1
+    
+    def _log_trace(self, trace: Dict):
+        """One log line per chat turn with the latency of each stage"""
+        logger.info("Request trace", extra={
+            "stage": trace['kind'],
+            "status": trace['status'],
+            "latency_ms": trace['total_ms'],
+            "stages": trace['stages']
+        })
+    
+    def chat(self, user_message: str, conversation_id: Optional[str] = None) -> str:
+        with tracing.trace("chat", on_finish=self._log_trace) as trace:
+            self._start_turn()
+            
+            with tracing.span("cache_lookup"):
+                scope = self._cache_scope(user_message, conversation_id)
+                embedding = self._cache_embedding(user_message, scope)
+                cached = self._cached_response(user_message, conversation_id, scope, embedding)
+            if cached is not None:
+                trace['status'] = 'cache_hit'
+                return cached
             
-            assistant_message = response.choices[0].message.content
+            context = self.plan_and_execute(user_message, conversation_id)
+            messages = self._build_chat_messages(user_message, conversation_id, context)
             
-            # AUTOMATIC RESPONSE VALIDATION
             try:
-                validated_message, is_valid = self._validate_response(assistant_message, context, user_message)
+                with tracing.span("generation"):
+                    response = self.client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=messages,
+                        temperature=0.1,  # Minimal for consistency while keeping some naturalness
+                        max_tokens=500
+                    )
+                self._log_usage("answer", response.usage)
+                
+                answer = self._finalize_response(response.choices[0].message.content, context, user_message, conversation_id)
+                self._store_response(user_message, answer, scope, embedding)
+                return answer
                 
-                if not is_valid:
-                    logger.info("Response corrected by validator", extra={"validation_result": "invalid_corrected"})
-                    assistant_message = validated_message
-                else:
-                    logger.info("Response validated successfully", extra={"validation_result": "valid"})
             except Exception as e:
-                logger.error("Validation error", extra={"error_type": type(e).__name__}, exc_info=True)
-                # In case of validation error, keep original response
-            
-            # POST-PROCESSING: Strip markdown syntax (bold, italic, underline)
-            import re
-            # Remove **bold**, __bold__
-            assistant_message = re.sub(r'\*\*([^*]+)\*\*', r'\1', assistant_message)
-            assistant_message = re.sub(r'__([^_]+)__', r'\1', assistant_message)
-            # Remove *italic*, _italic_
-            assistant_message = re.sub(r'(?<!\*)\*(?!\*)([^*]+)(?<!\*)\*(?!\*)', r'\1', assistant_message)
-            assistant_message = re.sub(r'(?<!_)_(?!_)([^_]+)(?<!_)_(?!_)', r'\1', assistant_message)
-            
-            self.conversations[conversation_id].append({
-                "role": "assistant",
-                "content": assistant_message
-            })
+                trace['status'] = 'error'
+                logger.error("OpenAI API error", extra={"error_type": type(e).__name__, "error_message": str(e)}, exc_info=True)
+                return f"Désolé, une erreur est survenue. Veuillez réessayer."
+    
+    async def achat(self, user_message: str, conversation_id: Optional[str] = None) -> str:
+        """Async variant of chat - never blocks the event loop on OpenAI calls"""
+        with tracing.trace("chat", on_finish=self._log_trace) as trace:
+            self._start_turn()
             
-            return assistant_message
+            with tracing.span("cache_lookup"):
+                scope = await self._off_loop(self._cache_scope, user_message, conversation_id)
+                embedding = await self._acache_embedding(user_message, scope)
+                cached = await self._off_loop(self._cached_response, user_message, conversation_id, scope, embedding)
+            if cached is not None:
+                trace['status'] = 'cache_hit'
+                return cached
             
-        except Exception as e:
-            logger.error("OpenAI API error", extra={"error_type": type(e).__name__, "error_message": str(e)}, exc_info=True)
-            return f"Désolé, une erreur est survenue. Veuillez réessayer."
+            context = await self.aplan_and_execute(user_message, conversation_id)
+            messages = await self._off_loop(self._build_chat_messages, user_message, conversation_id, context)
+            
+            try:
+                with tracing.span("generation"):
+                    response = await self.async_client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=messages,
+                        temperature=0.1,
+                        max_tokens=500
+                    )
+                self._log_usage("answer", response.usage)
+                
+                answer = await self._off_loop(self._finalize_response, response.choices[0].message.content,
+                                              context, user_message, conversation_id)
+                self._store_response(user_message, answer, scope, embedding)
+                return answer
+                
+            except Exception as e:
+                trace['status'] = 'error'
+                logger.error("OpenAI API error", extra={"error_type": type(e).__name__, "error_message": str(e)}, exc_info=True)
+                return f"Désolé, une erreur est survenue. Veuillez réessayer."
+    
+    async def achat_stream(self, user_message: str, conversation_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Stream the final completion token by token
+        
+        Yields events:
+            {"type": "token", "content": delta} for each generated chunk
+            {"type": "done", "content": final, "corrected": bool} once validation
+            and markdown stripping ran on the full answer (clients replace the
+            streamed text with `content`)
+            {"type": "error", "content": message} if the OpenAI call fails
+        """
+        with tracing.trace("chat_stream", on_finish=self._log_trace) as trace:
+            self._start_turn()
+            
+            with tracing.span("cache_lookup"):
+                scope = await self._off_loop(self._cache_scope, user_message, conversation_id)
+                embedding = await self._acache_embedding(user_message, scope)
+                cached = await self._off_loop(self._cached_response, user_message, conversation_id, scope, embedding)
+            if cached is not None:
+                trace['status'] = 'cache_hit'
+                yield {"type": "token", "content": cached}
+                yield {"type": "done", "content": cached, "corrected": False}
+                return
+            
+            context = await self.aplan_and_execute(user_message, conversation_id)
+            messages = await self._off_loop(self._build_chat_messages, user_message, conversation_id, context)
+            
+            chunks = []
+            generation_start = time.perf_counter()
+            try:
+                stream = await self.async_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=500,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                
+                async for chunk in stream:
+                    if not chunk.choices:
+                        # Final chunk carries token usage only
+                        self._log_usage("answer", getattr(chunk, 'usage', None))
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not chunks:
+                            tracing.record_stage("first_token", time.perf_counter() - generation_start)
+                        chunks.append(delta)
+                        yield {"type": "token", "content": delta}
+                        
+            except Exception as e:
+                trace['status'] = 'error'
+                logger.error("OpenAI API error", extra={"error_type": type(e).__name__, "error_message": str(e)}, exc_info=True)
+                yield {"type": "error", "content": "Désolé, une erreur est survenue. Veuillez réessayer."}
+                return
+            # Includes the time the client took to read the streamed tokens
+            tracing.record_stage("generation", time.perf_counter() - generation_start)
+            
+            raw_message = "".join(chunks)
+            final_message = await self._off_loop(self._finalize_response, raw_message, context, user_message, conversation_id)
+            self._store_response(user_message, final_message, scope, embedding)
+            yield {"type": "done", "content": final_message, "corrected": final_message != raw_message}
+    
+    def knowledge_refresh_due(self) -> bool:
+        """True at most once per KB_POLL_SECONDS, when the knowledge file changed and no refresh runs"""
+        now = time.monotonic()
+        if KB_POLL_SECONDS <= 0 or now - self._kb_polled_at < KB_POLL_SECONDS:
+            return False
+        self._kb_polled_at = now
+        return not self._refresh_lock.locked() and self.kb.knowledge_file_changed()
     
     def refresh_knowledge_from_web(self):
         """Rescrape website and update KB"""
+        with self._refresh_lock:
+            return self._refresh_knowledge()
+    
+    def _refresh_knowledge(self):
         try:
             logger.info("Refreshing knowledge base...")
             
@@ -741,12 +1124,18 @@ RESPONSE STYLE: First-person plural, concise, conversational. Respect detected l
             # Could add real scraping here if necessary
             # For now, just reload enriched KB
             
-            self.kb = EnrichedKnowledgeBase()
+            # Built beside the live KB (only changed documents are embedded),
+            # then swapped in with a single assignment
+            kb = self.kb.refreshed()
+            if kb is self.kb:
+                logger.info("Knowledge base unchanged", extra={"kb_version": kb.version})
+                return True
+            self.kb = kb
             self.agent_state['last_update'] = datetime.now().isoformat()
             
-            restaurant_count = len(self.kb.get_all_restaurants())
-            menu_count = len(self.kb.get_all_menu_items())
-            logger.info("Knowledge base refreshed successfully", extra={"restaurant_count": restaurant_count, "menu_count": menu_count})
+            restaurant_count = len(kb.get_all_restaurants())
+            menu_count = len(kb.get_all_menu_items())
+            logger.info("Knowledge base refreshed successfully", extra={"restaurant_count": restaurant_count, "menu_count": menu_count, "index_stats": kb.index_stats})
             return True
             
         except Exception as e:
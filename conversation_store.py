@@ -0,0 +1,364 @@
+"""
+Conversation store - bounded per-conversation history with idle-TTL eviction
+
+Three interchangeable backends share the same methods:
+- ConversationStore: in-process LRU (default, single worker)
+- SQLiteConversationStore: file shared by the workers of one host
+- RedisConversationStore: any Redis-protocol server (Redis, Valkey, KeyDB...)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+
+class ConversationStore:
+    """In-memory conversations, least recently used evicted first
+
+    Each conversation keeps at most max_messages messages. A conversation
+    idle for ttl_seconds is dropped, and the whole store stays under
+    max_conversations and max_chars (sum of message lengths) by evicting
+    the least recently used conversations.
+    """
+
+    # Methods do disk or network I/O: async callers run them in a thread
+    blocking = False
+
+    def __init__(self, max_messages: int = 20, ttl_seconds: float = 3600,
+                 max_conversations: int = 5000, max_chars: int = 20_000_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        self.max_chars = max_chars
+        self.clock = clock
+        # conversation_id -> {'messages', 'last_city', 'chars', 'updated_at'}, oldest first
+        self._conversations: "OrderedDict[str, Dict]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, entry: Dict) -> bool:
+        return self.ttl_seconds is not None and self.clock() - entry['updated_at'] > self.ttl_seconds
+
+    def _get(self, conversation_id: str) -> Optional[Dict]:
+        """Live entry for conversation_id, refreshed in the LRU (lock held)"""
+        entry = self._conversations.get(conversation_id)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._drop(conversation_id)
+            self.expirations += 1
+            return None
+        self._conversations.move_to_end(conversation_id)
+        return entry
+
+    def _drop(self, conversation_id: str):
+        entry = self._conversations.pop(conversation_id)
+        self._chars -= entry['chars']
+
+    def _entry(self, conversation_id: str) -> Dict:
+        entry = self._get(conversation_id)
+        if entry is None:
+            entry = {'messages': [], 'last_city': None, 'chars': 0, 'updated_at': self.clock()}
+            self._conversations[conversation_id] = entry
+        return entry
+
+    def _evict(self):
+        """Expire idle conversations, then enforce global ceilings (lock held)"""
+        # Ordered by last access: expired entries are all at the head
+        while self._conversations:
+            conversation_id, entry = next(iter(self._conversations.items()))
+            if not self._expired(entry):
+                break
+            self._drop(conversation_id)
+            self.expirations += 1
+        while len(self._conversations) > 1 and (
+                len(self._conversations) > self.max_conversations or self._chars > self.max_chars):
+            self._drop(next(iter(self._conversations)))
+            self.evictions += 1
+
+    def append(self, conversation_id: str, message: Dict):
+        size = len(message.get('content') or '')
+        with self._lock:
+            entry = self._entry(conversation_id)
+            entry['messages'].append(message)
+            entry['chars'] += size
+            self._chars += size
+            if len(entry['messages']) > self.max_messages:
+                dropped = entry['messages'][:-self.max_messages]
+                del entry['messages'][:-self.max_messages]
+                freed = sum(len(m.get('content') or '') for m in dropped)
+                entry['chars'] -= freed
+                self._chars -= freed
+            entry['updated_at'] = self.clock()
+            self._evict()
+
+    def history(self, conversation_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Most recent messages, oldest first (copy)"""
+        with self._lock:
+            entry = self._get(conversation_id)
+            if entry is None:
+                return []
+            messages = entry['messages']
+            return list(messages[-limit:] if limit else messages)
+
+    def last_city(self, conversation_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self._get(conversation_id)
+            return entry['last_city'] if entry else None
+
+    def set_last_city(self, conversation_id: str, city: str):
+        with self._lock:
+            entry = self._entry(conversation_id)
+            entry['last_city'] = city
+            entry['updated_at'] = self.clock()
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            if conversation_id in self._conversations:
+                self._drop(conversation_id)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._get(conversation_id) is not None
+
+    def __getitem__(self, conversation_id: str) -> List[Dict]:
+        return self.history(conversation_id)
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def stats(self) -> Dict:
+        return {
+            'backend': 'memory',
+            'conversations': len(self._conversations),
+            'chars': self._chars,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversations in a SQLite file, shared by every worker process of the host
+
+    Timestamps are wall-clock so all processes agree on idle time. Expired
+    and surplus conversations are purged every purge_every writes.
+    """
+
+    blocking = True
+
+    def __init__(self, db_path: str = "conversations.db", max_messages: int = 20,
+                 ttl_seconds: float = 3600, max_conversations: int = 50000,
+                 purge_every: int = 200, clock: Callable[[], float] = time.time):
+        super().__init__(max_messages, ttl_seconds, max_conversations=max_conversations, clock=clock)
+        self.purge_every = purge_every
+        self._writes = 0
+        self._db = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, last_city TEXT, updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS conversations_by_age ON conversations (updated_at);"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, message TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (conversation_id, seq);"
+        )
+        self._db.commit()
+
+    def _live_since(self) -> float:
+        return self.clock() - self.ttl_seconds if self.ttl_seconds is not None else float('-inf')
+
+    def _touch(self, conversation_id: str):
+        self._db.execute(
+            "INSERT INTO conversations (id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at",
+            (conversation_id, self.clock())
+        )
+
+    def append(self, conversation_id: str, message: Dict):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT updated_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is not None and row[0] < self._live_since():
+                self._delete([conversation_id])
+            self._touch(conversation_id)
+            self._db.execute(
+                "INSERT INTO messages (conversation_id, message) VALUES (?, ?)",
+                (conversation_id, json.dumps(message, ensure_ascii=False))
+            )
+            self._db.execute(
+                "DELETE FROM messages WHERE conversation_id = ? AND seq <= ("
+                "SELECT seq FROM messages WHERE conversation_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (conversation_id, conversation_id, self.max_messages)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge()
+            self._db.commit()
+
+    def _delete(self, conversation_ids: List[str]):
+        for conversation_id in conversation_ids:
+            self._db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def _purge(self):
+        """Drop idle conversations and the oldest ones above max_conversations (lock held)"""
+        stale = [row[0] for row in self._db.execute(
+            "SELECT id FROM conversations WHERE updated_at < ?", (self._live_since(),)
+        )]
+        stale += [row[0] for row in self._db.execute(
+            "SELECT id FROM conversations WHERE updated_at >= ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+            (self._live_since(), self.max_conversations)
+        )]
+        self._delete(stale)
+
+    def _live(self, conversation_id: str) -> Optional[tuple]:
+        row = self._db.execute(
+            "SELECT last_city, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None or row[1] < self._live_since():
+            return None
+        return row
+
+    def history(self, conversation_id: str, limit: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            if self._live(conversation_id) is None:
+                return []
+            rows = self._db.execute(
+                "SELECT message FROM messages WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+                (conversation_id, limit or self.max_messages)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def last_city(self, conversation_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._live(conversation_id)
+        return row[0] if row else None
+
+    def set_last_city(self, conversation_id: str, city: str):
+        with self._lock:
+            self._touch(conversation_id)
+            self._db.execute("UPDATE conversations SET last_city = ? WHERE id = ?", (city, conversation_id))
+            self._db.commit()
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            self._delete([conversation_id])
+            self._db.commit()
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._live(conversation_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM conversations WHERE updated_at >= ?", (self._live_since(),)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict:
+        return {'backend': 'sqlite', 'conversations': len(self)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class RedisConversationStore(ConversationStore):
+    """Conversations in a Redis-protocol server shared by every worker and host
+
+    Messages live in a capped list (RPUSH + LTRIM), the last city in a plain
+    key; both get the idle TTL refreshed on each write. The global memory
+    ceiling is the server's maxmemory with an LRU eviction policy.
+    """
+
+    blocking = True
+
+    def __init__(self, client, max_messages: int = 20, ttl_seconds: float = 3600,
+                 prefix: str = "bolkiri:conversation:"):
+        super().__init__(max_messages, int(ttl_seconds) if ttl_seconds is not None else None)
+        self.client = client
+        self.prefix = prefix
+
+    def _keys(self, conversation_id: str):
+        return f"{self.prefix}{conversation_id}:messages", f"{self.prefix}{conversation_id}:city"
+
+    def _expire(self, pipe, conversation_id: str):
+        if self.ttl_seconds is not None:
+            for key in self._keys(conversation_id):
+                pipe.expire(key, self.ttl_seconds)
+
+    def append(self, conversation_id: str, message: Dict):
+        messages_key, _ = self._keys(conversation_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(messages_key, json.dumps(message, ensure_ascii=False))
+        pipe.ltrim(messages_key, -self.max_messages, -1)
+        self._expire(pipe, conversation_id)
+        pipe.execute()
+
+    def history(self, conversation_id: str, limit: Optional[int] = None) -> List[Dict]:
+        messages_key, _ = self._keys(conversation_id)
+        return [json.loads(raw) for raw in self.client.lrange(messages_key, -(limit or self.max_messages), -1)]
+
+    def last_city(self, conversation_id: str) -> Optional[str]:
+        city = self.client.get(self._keys(conversation_id)[1])
+        if isinstance(city, bytes):
+            city = city.decode('utf-8')
+        return city
+
+    def set_last_city(self, conversation_id: str, city: str):
+        pipe = self.client.pipeline()
+        pipe.set(self._keys(conversation_id)[1], city)
+        self._expire(pipe, conversation_id)
+        pipe.execute()
+
+    def clear(self, conversation_id: str):
+        self.client.delete(*self._keys(conversation_id))
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return bool(self.client.exists(*self._keys(conversation_id)))
+
+    def __len__(self) -> int:
+        raise TypeError("conversation count is not tracked by the Redis backend")
+
+    def stats(self) -> Dict:
+        return {'backend': 'redis'}
+
+
+def create_conversation_store() -> ConversationStore:
+    """Backend selected by CONVERSATION_BACKEND (memory, sqlite or redis)"""
+    backend = os.getenv('CONVERSATION_BACKEND', 'memory').lower()
+    max_messages = int(os.getenv('CONVERSATION_MAX_MESSAGES', '20'))
+    ttl_seconds = float(os.getenv('CONVERSATION_TTL_SECONDS', '3600'))
+
+    if backend == 'sqlite':
+        return SQLiteConversationStore(
+            db_path=os.getenv('CONVERSATION_DB', 'conversations.db'),
+            max_messages=max_messages,
+            ttl_seconds=ttl_seconds
+        )
+    if backend == 'redis':
+        try:
+            import redis  # optional dependency, only needed for this backend
+        except ImportError:
+            raise RuntimeError("CONVERSATION_BACKEND=redis requires the redis package (pip install redis)") from None
+        return RedisConversationStore(
+            redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')),
+            max_messages=max_messages,
+            ttl_seconds=ttl_seconds
+        )
+    if backend != 'memory':
+        raise ValueError(f"Unknown CONVERSATION_BACKEND: {backend}")
+    return ConversationStore(
+        max_messages=max_messages,
+        ttl_seconds=ttl_seconds,
+        max_conversations=int(os.getenv('CONVERSATION_MAX_ACTIVE', '5000')),
+        max_chars=int(os.getenv('CONVERSATION_MAX_CHARS', '20000000'))
+    )
@@ -0,0 +1,194 @@
+"""
+Dish table - scraped menu dishes as typed columns with bitmap indexes for local filtering
+"""
+import re
+from typing import Dict, List, Optional, Union
+import numpy as np
+
+from text_utils import tokenize
+
+FLAGS = ('vegetarien', 'vegan', 'sans_gluten', 'signature')
+# Index = spice level stored in the table ('' is not spicy)
+SPICE_LEVELS = ('', 'Léger', 'Moyen', 'Épicé')
+DEFAULT_CATEGORY = 'plats'
+# First match on the dish name wins (a "Formule salade papaye" is a formule)
+CATEGORY_KEYWORDS = (
+    ('formules', ('formule',)),
+    ('boissons', ('boisson', 'thé glacé', 'jus', 'soda', 'bubble tea', 'limonade')),
+    ('desserts', ('dessert', 'mochi', 'perle de coco')),
+    ('soupes', ('soupe', 'phô', 'pho')),
+    ('entrees', ('nêms', 'nems', 'nem', 'raviolis', 'tempura', 'dim sum', 'bao', 'salade', 'assortiment')),
+)
+# Checked first, on the start of the name only ("... servi avec du riz" is a plat)
+CATEGORY_PREFIXES = (
+    ('accompagnements', ('riz ',)),
+)
+# Markers looked up in the lowercased name + description when a flag is not given explicitly
+FLAG_MARKERS = {
+    'vegetarien': ('végé', 'vegetarien', 'végétarien', 'veggie', 'tofu'),
+    'vegan': ('vegan', 'végan', 'végétalien'),
+    'sans_gluten': ('sans gluten',),
+    'signature': ('signature',),
+}
+# A dish naming one of these (folded tokens) is not vegetarian whatever its tags or
+# markers say: "nems poulet/végé", "tofu ou viande"
+MEAT_WORDS = {'viande', 'viandes', 'poulet', 'boeuf', 'porc', 'canard', 'dinde', 'jambon', 'lardons', 'agneau',
+              'crevette', 'crevettes', 'poisson', 'saumon', 'thon', 'calamar', 'calamars', 'crabe'}
+SPICE_MARKERS = ('épicé', 'pimenté', '🌶')
+MILD_MARKERS = ('légèrement', 'peu épicé')
+HOT_MARKERS = ('très épicé', 'extra épicé')
+
+_PRICE = re.compile(r'(\d+(?:[.,]\d{1,2})?)\s*€')
+
+
+def parse_price(value) -> Optional[float]:
+    """Euros as a float ('6,50 €' -> 6.5), None when there is no price"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _PRICE.search(value or '')
+    return float(match.group(1).replace(',', '.')) if match else None
+
+
+def _folded(text: str) -> str:
+    """Accent-folded words between spaces (' soupe pho bo '), for whole-word lookups"""
+    return f" {' '.join(tokenize(text.replace('œ', 'oe').replace('Œ', 'OE')))} "
+
+
+def dish_category(name: str) -> str:
+    """Menu category inferred from the dish name (accent-insensitive: 'phở' is a 'pho')"""
+    name = _folded(name)
+    for category, prefixes in CATEGORY_PREFIXES:
+        if name.startswith(tuple(_folded(prefix) for prefix in prefixes)):
+            return category
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(_folded(keyword) in name for keyword in keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def names_meat(text: str) -> bool:
+    """True when text names a meat or seafood (not as in "sans viande")"""
+    words = _folded(text).split()
+    return any(word in MEAT_WORDS and words[i - 1:i] != ['sans'] for i, word in enumerate(words))
+
+
+def spice_level(text: str) -> int:
+    """Index into SPICE_LEVELS for a lowercased dish text"""
+    if any(marker in text for marker in HOT_MARKERS) or text.count('🌶') >= 2:
+        return 3
+    if not any(marker in text for marker in SPICE_MARKERS):
+        return 0
+    return 1 if any(marker in text for marker in MILD_MARKERS) else 2
+
+
+def normalize_dish(record: Dict, url: str = '') -> Dict:
+    """One menu row from a scraped dish_data (or an old-format menu item)
+
+    Explicit fields win over what is inferred from tags and text: a record
+    carrying 'vegetarien': False stays non-vegetarian whatever its text says.
+    An inferred vegetarian or vegan flag is dropped when the dish names a
+    meat, and a vegan dish is always vegetarian.
+    """
+    name = (record.get('nom') or '').strip()
+    description = (record.get('description') or '').strip()
+    tags = list(record.get('tags') or [])
+    text = f"{name} {description}".lower()
+
+    dish = {
+        'nom': name,
+        'description': description,
+        'prix': record.get('prix') or '',
+        'prix_eur': parse_price(record.get('prix')),
+        'categorie': (record.get('categorie') or dish_category(name)).lower(),
+        'tags': tags,
+        'url': record.get('url', url),
+    }
+    meat = names_meat(text)
+    for flag in FLAGS:
+        if flag in record:
+            dish[flag] = bool(record[flag])
+        elif flag in ('vegetarien', 'vegan') and meat:
+            dish[flag] = False
+        else:
+            dish[flag] = flag in tags or any(marker in text for marker in FLAG_MARKERS[flag])
+    dish['vegetarien'] = dish['vegetarien'] or dish['vegan']
+
+    epice = record.get('epice')
+    if isinstance(epice, str) and epice in SPICE_LEVELS:
+        level = SPICE_LEVELS.index(epice)
+    else:
+        level = spice_level(text)
+        if not level and 'epice' in tags:
+            level = 2
+    dish['epice'] = SPICE_LEVELS[level]
+    dish['epice_niveau'] = level
+    return dish
+
+
+class DishTable:
+    """Menu dishes as columns: price (NaN when unknown), spice level, one bitmap per flag and category
+
+    filter() ANDs the bitmaps and a price comparison, then materializes the
+    matching rows - no scan over dicts and no API call.
+    """
+
+    def __init__(self, records: List[Dict]):
+        """records: dish_data dicts (optionally with a 'url'), duplicates by name dropped"""
+        self.dishes = []
+        seen = set()
+        for record in records:
+            dish = normalize_dish(record)
+            key = dish['nom'].lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            self.dishes.append(dish)
+
+        self.prices = np.array([np.nan if d['prix_eur'] is None else d['prix_eur'] for d in self.dishes],
+                               dtype=np.float64)
+        self.spice = np.array([d['epice_niveau'] for d in self.dishes], dtype=np.int8)
+        self.flags = {flag: np.array([d[flag] for d in self.dishes], dtype=bool) for flag in FLAGS}
+        categories = np.array([d['categorie'] for d in self.dishes], dtype=object)
+        self.categories = {category: categories == category for category in dict.fromkeys(categories)}
+
+    def __len__(self) -> int:
+        return len(self.dishes)
+
+    def filter(self,
+               vegetarien: Optional[bool] = None,
+               vegan: Optional[bool] = None,
+               sans_gluten: Optional[bool] = None,
+               signature: Optional[bool] = None,
+               epice: Union[bool, str, None] = None,
+               prix_max: Optional[float] = None,
+               categorie: Optional[str] = None) -> List[Dict]:
+        """Dishes matching every given criterion, in menu order
+
+        epice: True for any spicy dish, False for none, or a SPICE_LEVELS name
+        for that exact level. prix_max leaves out dishes without a price.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for flag, wanted in (('vegetarien', vegetarien), ('vegan', vegan),
+                             ('sans_gluten', sans_gluten), ('signature', signature)):
+            if wanted is not None:
+                mask &= self.flags[flag] if wanted else ~self.flags[flag]
+
+        if isinstance(epice, bool):
+            mask &= (self.spice > 0) if epice else (self.spice == 0)
+        elif epice:
+            levels = [level.lower() for level in SPICE_LEVELS]
+            if epice.lower() not in levels:
+                return []
+            mask &= self.spice == levels.index(epice.lower())
+
+        if prix_max is not None:
+            # NaN compares False: unpriced dishes never pass a budget
+            mask &= self.prices <= prix_max
+
+        if categorie:
+            category = self.categories.get(categorie.lower())
+            if category is None:
+                return []
+            mask &= category
+
+        return [self.dishes[i] for i in np.flatnonzero(mask)]
@@ -0,0 +1,199 @@
+"""
+Query embedding cache - LRU/TTL in memory with optional SQLite persistence
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Callable, Dict
+import numpy as np
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+class EmbeddingCache:
+    """Bounded cache of query embeddings keyed by normalized text
+
+    Lookups hit the in-memory LRU first, then the SQLite store (if any) so
+    warm queries survive restarts without any embeddings API call.
+
+    New entries reach SQLite in batches: one commit per write_batch misses,
+    or on the first miss after flush_interval seconds. The table is pruned
+    of expired rows and kept under max_rows at startup and every
+    prune_every writes.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 30 * 24 * 3600,
+                 db_path: Optional[str] = None, model: str = "text-embedding-ada-002",
+                 clock: Callable[[], float] = time.time, max_rows: int = 50000,
+                 write_batch: int = 32, flush_interval: float = 10.0, prune_every: int = 1000):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.model = model
+        self.clock = clock
+        self.max_rows = max_rows
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.prune_every = prune_every
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, vector)
+        self._pending: Dict[str, tuple] = {}  # key -> (created_at, vector bytes) not yet in SQLite
+        self._pending_since = None
+        self._writes_since_prune = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db_path = db_path
+        self._db = None
+        self._connect()
+
+    def _connect(self):
+        if self.db_path:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT NOT NULL, model TEXT NOT NULL, created_at REAL NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (key, model))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_created ON query_embeddings (created_at)")
+            self._db.commit()
+            try:
+                self._prune()
+                self._db.commit()
+            except sqlite3.OperationalError:
+                # Another worker holds the write lock (pruning too): it is done next time
+                self._db.rollback()
+
+    def _prune(self):
+        """Delete expired rows, then the oldest beyond max_rows (lock held or not shared yet)"""
+        if self.ttl_seconds is not None:
+            self._db.execute("DELETE FROM query_embeddings WHERE created_at < ?",
+                             (self.clock() - self.ttl_seconds,))
+        if self.max_rows is not None:
+            self._db.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN ("
+                "SELECT rowid FROM query_embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,)
+            )
+        self._writes_since_prune = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Case/whitespace-insensitive key ('  Menu  Végétarien ?' -> 'menu végétarien ?')"""
+        return _SPACES_RE.sub(' ', text.strip().lower())
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and self.clock() - created_at > self.ttl_seconds
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.normalize(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, vector = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created_at, vector FROM query_embeddings WHERE key = ? AND model = ?",
+                    (key, self.model)
+                ).fetchone()
+                if row is None and key in self._pending:
+                    # Evicted from the LRU before its batch was written
+                    row = self._pending[key]
+                if row is not None and not self._expired(row[0]):
+                    vector = np.frombuffer(row[1], dtype=np.float32)
+                    self._store(key, row[0], vector)
+                    self.hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def peek(self, text: str) -> Optional[np.ndarray]:
+        """In-memory entry for text if any - no SQLite read, no hit/miss counted"""
+        key = self.normalize(text)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or self._expired(entry[0]):
+            return None
+        return entry[1]
+
+    def put(self, text: str, vector: np.ndarray, autoflush: bool = True):
+        """Cache vector; with autoflush=False the caller runs flush() when flush_due()"""
+        key = self.normalize(text)
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        created_at = self.clock()
+        with self._lock:
+            self._store(key, created_at, vector)
+            if self._db is None:
+                return
+            if not self._pending:
+                self._pending_since = created_at
+            self._pending[key] = (created_at, vector.tobytes())
+        if autoflush and self.flush_due():
+            self.flush()
+
+    def flush_due(self) -> bool:
+        with self._lock:
+            return bool(self._pending) and (len(self._pending) >= self.write_batch
+                                            or self.clock() - self._pending_since >= self.flush_interval)
+
+    def flush(self):
+        """Write pending entries in one transaction, pruning every prune_every writes"""
+        with self._lock:
+            if self._db is None or not self._pending:
+                return
+            rows = [(key, self.model, created_at, blob) for key, (created_at, blob) in self._pending.items()]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (key, model, created_at, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._pending = {}
+            self._writes_since_prune += len(rows)
+            if self._writes_since_prune >= self.prune_every:
+                self._prune()
+            self._db.commit()
+
+    def _store(self, key: str, created_at: float, vector: np.ndarray):
+        """Insert into the LRU, evicting the least recently used entry (lock held)"""
+        self._entries[key] = (created_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, text: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        vector = self.get(text)
+        if vector is None:
+            vector = compute(text)
+            self.put(text, vector)
+        return vector
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+            'persistent': self._db is not None
+        }
+
+    def reopen(self):
+        """New SQLite connection (a connection must not cross a fork)"""
+        self._db = None
+        self._pending = {}
+        self._connect()
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,116 @@
+"""
+Nearest-location search - vectorized haversine over packed coordinate arrays
+"""
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances (km) from one point to arrays of points (broadcasts)"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class LocationIndex:
+    """k-nearest locations by great-circle distance
+
+    Coordinates are packed into float64 arrays once. Small sets are scanned
+    in a single vectorized pass; from grid_threshold locations on, a uniform
+    lat/lon grid limits the scan to the rings of cells around the query.
+    """
+
+    def __init__(self, locations: List[Dict], cell_degrees: float = 0.1, grid_threshold: int = 256):
+        """locations: dicts with 'lat' and 'lon' (other keys are kept as payload)"""
+        self.locations = locations
+        self.lats = np.array([loc['lat'] for loc in locations], dtype=np.float64)
+        self.lons = np.array([loc['lon'] for loc in locations], dtype=np.float64)
+        self.cell_degrees = cell_degrees
+        self.cells = None
+        if len(locations) >= grid_threshold:
+            self._build_grid()
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(np.floor(lat / self.cell_degrees)), int(np.floor(lon / self.cell_degrees))
+
+    def _build_grid(self):
+        cells = defaultdict(list)
+        for row, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            cells[self._cell(lat, lon)].append(row)
+        self.cells = {cell: np.array(rows) for cell, rows in cells.items()}
+        rows, cols = zip(*self.cells)
+        self._extent = (min(rows), max(rows), min(cols), max(cols))
+        self._max_abs_lat = float(np.abs(self.lats).max())
+
+    def _outside_km(self, lat: float, radius: int) -> float:
+        """Lower bound of the distance from a query at lat to any point outside `radius` rings
+
+        Such a point is more than radius cells away in latitude or in
+        longitude. A longitude gap shrinks towards the poles, so the bound
+        uses the highest latitude of the query and of every stored point.
+        """
+        cos_lat = np.cos(np.radians(max(abs(lat), self._max_abs_lat)))
+        half_step = np.radians(min(180.0, radius * self.cell_degrees)) / 2
+        return 2 * EARTH_RADIUS_KM * float(np.arcsin(cos_lat * np.sin(half_step)))
+
+    def _ring(self, center: Tuple[int, int], radius: int) -> List[np.ndarray]:
+        row, col = center
+        found = []
+        for r in range(row - radius, row + radius + 1):
+            for c in range(col - radius, col + radius + 1):
+                if max(abs(r - row), abs(c - col)) == radius and (r, c) in self.cells:
+                    found.append(self.cells[(r, c)])
+        return found
+
+    def _grid_candidates(self, lat: float, lon: float, k: int) -> np.ndarray:
+        """Rows close enough to contain the k nearest (rings grow until provably complete)"""
+        center = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self._extent
+        max_radius = max(abs(center[0] - min_row), abs(center[0] - max_row),
+                         abs(center[1] - min_col), abs(center[1] - max_col))
+        chunks = []
+        count = 0
+        for radius in range(max_radius + 1):
+            ring = self._ring(center, radius)
+            chunks.extend(ring)
+            count += sum(len(rows) for rows in ring)
+            if count >= k:
+                rows = np.concatenate(chunks)
+                kth = np.partition(haversine_km(lat, lon, self.lats[rows], self.lons[rows]), k - 1)[k - 1]
+                if kth <= self._outside_km(lat, radius):
+                    return rows
+        return np.concatenate(chunks) if chunks else np.arange(len(self))
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[Dict, float]]:
+        """Up to k (location, distance_km) pairs, closest first"""
+        if not len(self) or k <= 0:
+            return []
+        k = min(k, len(self))
+        rows = self._grid_candidates(lat, lon, k) if self.cells is not None else np.arange(len(self))
+        distances = haversine_km(lat, lon, self.lats[rows], self.lons[rows])
+        if k < len(rows):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(distances[top], kind='stable')]
+        return [(self.locations[rows[i]], float(distances[i])) for i in top]
+
+    def nearest_batch(self, lats: np.ndarray, lons: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest for many points at once (analytics)
+
+        Returns:
+            (indices, distances_km), both shaped (len(points), k), closest first
+        """
+        lats = np.asarray(lats, dtype=np.float64)[:, None]
+        lons = np.asarray(lons, dtype=np.float64)[:, None]
+        k = min(k, len(self))
+        distances = haversine_km(lats, lons, self.lats[None, :], self.lons[None, :])
+        indices = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return indices, np.take_along_axis(distances, indices, axis=1)
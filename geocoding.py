@@ -0,0 +1,310 @@
+"""
+Geocoding - offline gazetteer of communes, persistent cache, rate-limited Nominatim
+"""
+import asyncio
+import csv
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+from restaurant_index import location_key
+from text_utils import normalize_text
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HEADERS = {'User-Agent': 'BolkiriChatbot/1.0'}
+GAZETTEER_FILE = "data/gazetteer_communes.csv"
+
+_POSTAL_RE = re.compile(r'\b(\d{5})\b')
+# "Paris 15", "Paris 15e", "paris 1er" -> arrondissement postal code
+_ARRONDISSEMENT_RE = re.compile(r'^paris (\d{1,2})(?:e|er|eme)?$')
+_SAINT_RE = re.compile(r'\bst(e?)\b')
+_SHORT_FORM_RE = re.compile(r'[ -](?:sur|sous|en|les|lès)[ -]')
+
+
+def _place_key(text: str) -> str:
+    """location_key with 'St'/'Ste' spelled out ('St-Maur, France' -> 'saint maur')"""
+    text = _SAINT_RE.sub(lambda m: 'sainte' if m.group(1) else 'saint', normalize_text(text))
+    return ' '.join(token for token in location_key(text).split() if token != 'france')
+
+
+class Gazetteer:
+    """Communes and postal codes resolved in memory
+
+    Coordinates live in two float32 arrays; names and postal codes map to
+    row numbers. A postal code shared by several communes resolves to the
+    mean of their coordinates.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, str, float, float]]):
+        self.names: List[str] = []
+        self.keys: Dict[str, int] = {}
+        self.postal_codes: Dict[str, List[int]] = defaultdict(list)
+        lats, lons = [], []
+
+        for name, postal_code, lat, lon in rows:
+            row = len(self.names)
+            self.names.append(name)
+            lats.append(lat)
+            lons.append(lon)
+            key = _place_key(name)
+            if key:
+                self.keys.setdefault(key, row)
+                self.keys.setdefault(key.replace(' ', ''), row)
+            if postal_code:
+                self.postal_codes[postal_code].append(row)
+
+        # Short forms ("Ivry" for Ivry-sur-Seine) only when they name a single commune
+        short_forms = defaultdict(dict)  # short key -> {full key: first row}
+        for row, name in enumerate(self.names):
+            short = _SHORT_FORM_RE.split(normalize_text(name), maxsplit=1)
+            if len(short) > 1:
+                short_forms[_place_key(short[0])].setdefault(_place_key(name), row)
+        for key, communes in short_forms.items():
+            if key and len(communes) == 1 and key not in self.keys:
+                self.keys[key] = next(iter(communes.values()))
+
+        self.lat = np.array(lats, dtype=np.float32)
+        self.lon = np.array(lons, dtype=np.float32)
+
+    @classmethod
+    def from_csv(cls, path: str = GAZETTEER_FILE,
+                 extra_rows: Iterable[Tuple[str, str, float, float]] = ()) -> "Gazetteer":
+        """Bundled table (name,postal_code,lat,lon); extra rows take precedence"""
+        rows = list(extra_rows)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for record in csv.DictReader(f):
+                    rows.append((record['name'], record['postal_code'], float(record['lat']), float(record['lon'])))
+        except OSError:
+            pass
+        return cls(rows)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _postal(self, postal_code: str) -> Optional[Dict]:
+        rows = self.postal_codes.get(postal_code)
+        if not rows:
+            return None
+        return {
+            'lat': float(self.lat[rows].mean()),
+            'lon': float(self.lon[rows].mean()),
+            'name': self.names[rows[0]]
+        }
+
+    def lookup(self, query: str) -> Optional[Dict]:
+        """{'lat', 'lon', 'name'} for a commune name or postal code, None if unknown"""
+        postal = _POSTAL_RE.search(query)
+        if postal:
+            found = self._postal(postal.group(1))
+            if found:
+                return found
+
+        key = _place_key(query)
+        arrondissement = _ARRONDISSEMENT_RE.match(' '.join(normalize_text(query).split()))
+        if arrondissement:
+            found = self._postal(f"750{int(arrondissement.group(1)):02d}")
+            if found:
+                return found
+
+        row = self.keys.get(key)
+        if row is None:
+            row = self.keys.get(key.replace(' ', ''))
+        if row is None:
+            return None
+        return {'lat': float(self.lat[row]), 'lon': float(self.lon[row]), 'name': self.names[row]}
+
+
+class GeocodeCache:
+    """Persistent geocoding results keyed by normalized query
+
+    Also used by the scraper for restaurant addresses (dict-style access).
+    Unknown places are remembered for negative_ttl_seconds so junk input
+    does not hit Nominatim again.
+    """
+
+    def __init__(self, db_path: Optional[str] = "geocode_cache.db",
+                 negative_ttl_seconds: float = 7 * 24 * 3600, clock: Callable[[], float] = time.time):
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.clock = clock
+        self.db_path = db_path
+        self._memory: Dict[str, Tuple[Optional[Dict], float]] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self._connect()
+
+    def _connect(self):
+        if self.db_path:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocodes ("
+                "key TEXT PRIMARY KEY, lat REAL, lon REAL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return normalize_text(query.replace('\n', ', '))
+
+    def lookup(self, query: str) -> Tuple[bool, Optional[Dict]]:
+        """(known, coordinates) - known with None coordinates is a cached miss"""
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT lat, lon, created_at FROM geocodes WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    coords = {'lat': row[0], 'lon': row[1]} if row[0] is not None else None
+                    entry = (coords, row[2])
+                    self._memory[key] = entry
+        if entry is None:
+            return False, None
+        coords, created_at = entry
+        if coords is None and self.clock() - created_at > self.negative_ttl_seconds:
+            return False, None
+        return True, coords
+
+    def put(self, query: str, coords: Optional[Dict]):
+        key = self.normalize(query)
+        created_at = self.clock()
+        with self._lock:
+            self._memory[key] = (coords, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocodes (key, lat, lon, created_at) VALUES (?, ?, ?, ?)",
+                    (key, coords['lat'] if coords else None, coords['lon'] if coords else None, created_at)
+                )
+                self._db.commit()
+
+    def __contains__(self, query: str) -> bool:
+        known, coords = self.lookup(query)
+        return known and coords is not None
+
+    def __getitem__(self, query: str) -> Dict:
+        known, coords = self.lookup(query)
+        if not known or coords is None:
+            raise KeyError(query)
+        return coords
+
+    def __setitem__(self, query: str, coords: Dict):
+        self.put(query, coords)
+
+    def reopen(self):
+        """New SQLite connection (a connection must not cross a fork)"""
+        self._db = None
+        self._connect()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class GeocoderBusy(RuntimeError):
+    """Too many network lookups queued: the caller's slot is beyond max_wait"""
+
+
+class Geocoder:
+    """Gazetteer first, then the persistent cache, Nominatim as last resort
+
+    Network calls are spaced by min_interval seconds across threads and
+    coroutines (Nominatim usage policy: 1 request per second). A caller
+    that would wait more than max_wait seconds for its slot gets
+    GeocoderBusy instead of queueing.
+    """
+
+    def __init__(self, gazetteer: Gazetteer, cache: Optional[GeocodeCache] = None,
+                 min_interval: float = 1.0, timeout: float = 5, max_wait: float = 5.0):
+        self.gazetteer = gazetteer
+        self.cache = cache
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self._next_slot = 0.0
+        self._slot_lock = threading.Lock()
+        self.stats = {'gazetteer': 0, 'cache': 0, 'network': 0, 'not_found': 0}
+
+    def _from_gazetteer(self, query: str) -> Optional[Dict]:
+        found = self.gazetteer.lookup(query)
+        if not found:
+            return None
+        self.stats['gazetteer'] += 1
+        return {'lat': found['lat'], 'lon': found['lon'], 'source': 'gazetteer'}
+
+    def _from_cache(self, query: str) -> Tuple[bool, Optional[Dict]]:
+        """(known, coordinates) from the SQLite cache"""
+        if self.cache is not None:
+            known, coords = self.cache.lookup(query)
+            if known:
+                self.stats['cache' if coords else 'not_found'] += 1
+                return True, dict(coords, source='cache') if coords else None
+        return False, None
+
+    def _local(self, query: str) -> Tuple[bool, Optional[Dict]]:
+        found = self._from_gazetteer(query)
+        if found:
+            return True, found
+        return self._from_cache(query)
+
+    def _wait_time(self) -> float:
+        """Reserve the next network slot, return how long to wait for it
+
+        Raises GeocoderBusy, reserving nothing, when the slot is more than
+        max_wait seconds away (burst of unknown places).
+        """
+        with self._slot_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            if slot - now > self.max_wait:
+                raise GeocoderBusy(f"geocoding queue full, next Nominatim slot in {slot - now:.0f} s")
+            self._next_slot = slot + self.min_interval
+            return slot - now
+
+    @staticmethod
+    def _params(query: str) -> Dict:
+        return {'q': f"{query}, France", 'format': 'json', 'limit': 1, 'countrycodes': 'fr'}
+
+    def _remember(self, query: str, data: List[Dict]) -> Optional[Dict]:
+        coords = {'lat': float(data[0]['lat']), 'lon': float(data[0]['lon'])} if data else None
+        self.stats['network' if coords else 'not_found'] += 1
+        if self.cache is not None:
+            self.cache.put(query, coords)
+        return dict(coords, source='network') if coords else None
+
+    def geocode(self, query: str) -> Optional[Dict]:
+        """{'lat', 'lon', 'source'} or None if the place is unknown
+
+        Raises on network errors (nothing is cached then).
+        """
+        known, coords = self._local(query)
+        if known:
+            return coords
+
+        import requests
+        time.sleep(self._wait_time())
+        response = requests.get(NOMINATIM_URL, params=self._params(query),
+                                headers=NOMINATIM_HEADERS, timeout=self.timeout)
+        response.raise_for_status()
+        return self._remember(query, response.json())
+
+    async def ageocode(self, query: str) -> Optional[Dict]:
+        """Async variant of geocode (cache I/O in a thread, non-blocking Nominatim call)"""
+        found = self._from_gazetteer(query)
+        if found:
+            return found
+        known, coords = await asyncio.to_thread(self._from_cache, query)
+        if known:
+            return coords
+
+        import httpx
+        await asyncio.sleep(self._wait_time())
+        async with httpx.AsyncClient(timeout=self.timeout) as http:
+            response = await http.get(NOMINATIM_URL, params=self._params(query), headers=NOMINATIM_HEADERS)
+        response.raise_for_status()
+        return await asyncio.to_thread(self._remember, query, response.json())
@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration - several uvicorn workers sharing one preloaded knowledge base
+
+    gunicorn -c gunicorn_conf.py main:app
+
+The app is imported once in the master (preload_app) with PRELOAD_KB=true, so
+the JSON parse, vector store load and FAISS index build happen a single time;
+forked workers share those pages copy-on-write.
+"""
+import os
+
+os.environ.setdefault("PRELOAD_KB", "true")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
@@ -0,0 +1,163 @@
+"""
+HTML extraction - title, headings, lists, JSON-LD, links and text in one lxml traversal
+"""
+from typing import Dict, List
+from lxml import etree, html as lxml_html
+
+# Dropped from headings, lists and main content (chrome around the page body)
+SKIPPED_TAGS = {'script', 'style', 'nav', 'footer', 'iframe', 'noscript'}
+# Never text, even in the whole-page text (same rule as BeautifulSoup's get_text)
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+HEADING_TAGS = ('h1', 'h2', 'h3')
+CONTENT_TAGS = ('main', 'article', 'body')
+# Which strings each collected element keeps: 'raw' everything (JSON-LD source),
+# 'text' all but script/style, 'visible' also drops SKIPPED_TAGS
+BUFFER_MODES = {'json_ld': 'raw', 'title': 'text', 'h1': 'text', 'heading': 'visible', 'li': 'visible', 'content': 'visible'}
+
+
+def _joined(strings: List[str], separator: str = '') -> str:
+    """BeautifulSoup get_text(separator, strip=True) over collected strings"""
+    return separator.join(s.strip() for s in strings if s.strip())
+
+
+_UTF8_PARSER = lxml_html.HTMLParser(encoding='utf-8')
+
+
+def _parser_for(document: bytes):
+    """UTF-8 unless the bytes say otherwise (lxml alone assumes Latin-1 without a meta charset)"""
+    try:
+        document.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return _UTF8_PARSER
+
+
+def extract(document: bytes) -> Dict:
+    """Everything the scraper reads from a page, collected in a single walk
+
+    Returns:
+        {'title', 'h1', 'headings', 'lists', 'content', 'json_ld', 'links',
+         'text', 'strings'} where 'content' is the text of the first
+        main/article/body outside SKIPPED_TAGS, 'text' the whole visible
+        text and 'strings' its stripped non-empty pieces.
+    """
+    empty = {'title': '', 'h1': '', 'headings': [], 'lists': [], 'content': '', 'json_ld': [],
+             'links': [], 'text': '', 'strings': []}
+    if not document or not document.strip():
+        return empty
+    try:
+        root = lxml_html.document_fromstring(document, parser=_parser_for(document))
+    except (etree.ParserError, ValueError):
+        return empty
+
+    title = None
+    h1 = None
+    headings = []
+    lists = []
+    json_ld = []
+    links = []
+    all_strings = []
+    content = {tag: None for tag in CONTENT_TAGS}
+
+    skipped = 0      # depth inside SKIPPED_TAGS
+    non_text = 0     # depth inside NON_TEXT_TAGS
+    open_text = []   # (buffer, mode) of open title/h1/heading/li/content/JSON-LD elements
+    open_lists = []  # item lists of open ul/ol, li slots reserved in document order
+    open_items = []  # (buffer, [(list, slot)]) for open li
+    stack = []       # per open element: what to close on 'end'
+
+    def add_text(text):
+        if not text:
+            return
+        if not non_text:
+            all_strings.append(text)
+        for buffer, mode in open_text:
+            if mode == 'raw' or (not non_text and (mode == 'text' or not skipped)):
+                buffer.append(text)
+
+    for event, element in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        if event in ('comment', 'pi'):
+            # Not text itself, but the text following it is
+            add_text(element.tail)
+            continue
+        tag = element.tag.lower()
+
+        if event == 'start':
+            opened = []
+            if tag in SKIPPED_TAGS:
+                skipped += 1
+            if tag in NON_TEXT_TAGS:
+                non_text += 1
+            if tag == 'script' and (element.get('type') or '').strip().lower() == 'application/ld+json':
+                opened.append(('json_ld', []))
+            if tag == 'title' and title is None:
+                opened.append(('title', []))
+            if tag == 'h1' and h1 is None:
+                opened.append(('h1', []))
+            if tag in HEADING_TAGS and not skipped:
+                opened.append(('heading', []))
+            if tag in CONTENT_TAGS and content[tag] is None:
+                content[tag] = []
+                opened.append(('content', content[tag]))
+            if tag == 'a' and element.get('href') is not None:
+                links.append(element.get('href'))
+            if tag in ('ul', 'ol') and not skipped:
+                open_lists.append([])
+                lists.append(open_lists[-1])
+                opened.append(('list', None))
+            if tag == 'li' and not skipped and open_lists:
+                slots = []
+                for items in open_lists:
+                    items.append(None)
+                    slots.append((items, len(items) - 1))
+                buffer = []
+                open_items.append((buffer, slots))
+                opened.append(('li', buffer))
+
+            for kind, buffer in opened:
+                if kind in BUFFER_MODES:
+                    open_text.append((buffer, BUFFER_MODES[kind]))
+            stack.append((tag, opened))
+            add_text(element.text)
+            continue
+
+        # 'end': close what this element opened, then its tail belongs to the parent
+        _, opened = stack.pop()
+        for kind, buffer in reversed(opened):
+            if kind in BUFFER_MODES:
+                open_text.pop()
+            if kind == 'json_ld':
+                json_ld.append(''.join(buffer))
+            elif kind == 'title':
+                title = _joined(buffer)
+            elif kind == 'h1':
+                h1 = _joined(buffer)
+            elif kind == 'heading':
+                text = _joined(buffer)
+                if text and len(text) > 2:
+                    headings.append({'level': tag, 'text': text})
+            elif kind == 'li':
+                buffer, slots = open_items.pop()
+                for items, slot in slots:
+                    items[slot] = _joined(buffer)
+            elif kind == 'list':
+                open_lists.pop()
+        if tag in SKIPPED_TAGS:
+            skipped -= 1
+        if tag in NON_TEXT_TAGS:
+            non_text -= 1
+        add_text(element.tail)
+
+    content_strings = next((content[tag] for tag in CONTENT_TAGS if content[tag] is not None), [])
+    return {
+        'title': title or '',
+        'h1': h1 or '',
+        # Grouped by level like the old per-tag find_all passes
+        'headings': sorted(headings, key=lambda heading: heading['level']),
+        'lists': [items for items in lists if items],
+        'content': _joined(content_strings, '\n'),
+        'json_ld': json_ld,
+        'links': links,
+        'text': ''.join(all_strings),
+        'strings': [s.strip() for s in all_strings if s.strip()]
+    }
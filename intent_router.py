@@ -0,0 +1,347 @@
+"""
+Deterministic intent router - builds a tool plan locally for obvious queries
+so plan_and_execute can skip the LLM planning call.
+"""
+import re
+import threading
+from typing import List, Dict, Optional, Callable, Tuple
+import numpy as np
+
+from text_utils import normalize_text, tokenize, STOPWORDS
+from logger_config import setup_logger
+import tracing
+
+logger = setup_logger(__name__)
+
+# Keyword families (accent-folded, lowercase tokens)
+HOURS_WORDS = {'horaire', 'horaires', 'heure', 'heures', 'ouvert', 'ouverte', 'ouverts', 'ouverture',
+               'ferme', 'fermeture', 'open', 'opening', 'hours', 'close', 'closing'}
+CONTACT_WORDS = {'telephone', 'tel', 'numero', 'contact', 'contacter', 'joindre', 'appeler',
+                 'email', 'mail', 'phone', 'call'}
+DIET_WORDS = {'vegetarien', 'vegetarienne', 'vegetariens', 'vegetariennes', 'vegetarian', 'vegan',
+              'vegane', 'vegans', 'vegetalien', 'veggie', 'vege', 'gluten', 'epice', 'epices',
+              'epicee', 'piquant', 'piquants', 'spicy'}
+MENU_WORDS = {'menu', 'menus', 'carte', 'plat', 'plats', 'dishes', 'dish'}
+RESTAURANT_WORDS = {'restaurant', 'restaurants', 'resto', 'restos', 'adresse', 'adresses',
+                    'situe', 'situes', 'localise', 'localises', 'located', 'where', 'trouver'}
+NEAREST_WORDS = {'plus', 'proche', 'proches', 'pres', 'cote', 'nearest', 'closest', 'near', 'to'}
+
+NEAREST_PATTERN = re.compile(
+    r"(?:plus\s+proches?|proches?|pr[eè]s|[aà]\s+c[oô]t[eé]|nearest|closest|near)"
+    r"\s+(?:de\s+la\s+|de\s+l'|de\s+|du\s+|des\s+|d'|to\s+|from\s+)?(?P<ref>[^?!.,;]+)",
+    re.IGNORECASE
+)
+# A place name is a few words at most ("Saint-Maur-des-Fossés", "Marne la Vallée")
+MAX_REFERENCE_WORDS = 4
+# Function words that may appear inside a place name
+PLACE_CONNECTORS = {'sur', 'sous', 'de', 'du', 'des', 'la', 'le', 'les', 'l', 'd', 'en', 'aux', 'a'}
+# A word after the place ends it: "proche de Versailles est ouvert" -> "Versailles"
+REFERENCE_BREAK = ((STOPWORDS - PLACE_CONNECTORS) | HOURS_WORDS | CONTACT_WORDS | MENU_WORDS | DIET_WORDS
+                   | RESTAURANT_WORDS | {'ouvre', 'ouvrez', 'ouvrent', 'fermez', 'aujourd', 'demain', 'soir',
+                                         'midi', 'maintenant', 'stp', 'qui', 'quand', 'comment', 'combien'})
+# Intents the router cannot chain after a nearest-restaurant lookup
+CHAINED_WORDS = HOURS_WORDS | CONTACT_WORDS | MENU_WORDS | DIET_WORDS
+# "pas épicé", "non végétarien": the criterion is negated, left to the LLM planner
+NEGATION_WORDS = {'pas', 'sans', 'non', 'aucun', 'aucune', 'ni', 'no', 'not', 'without'}
+NEGATION_WINDOW = 2
+
+# Seed utterances for the optional nearest-centroid classifier
+DEFAULT_INTENT_EXAMPLES = {
+    'get_hours': ["quels sont vos horaires", "a quelle heure ouvrez-vous", "etes-vous ouverts le dimanche",
+                  "what are your opening hours"],
+    'get_contact': ["comment vous contacter", "quel est votre numero de telephone", "how can I call you"],
+    'get_menu': ["que proposez-vous a manger", "je voudrais voir la carte", "what's on the menu"],
+    'filter_menu': ["avez-vous des plats sans viande", "options vegetariennes", "plats epices"],
+    'get_restaurants': ["ou etes-vous situes", "liste de vos restaurants", "where are your restaurants"],
+    'recommend_dish': ["que me conseillez-vous", "quel plat recommandez-vous", "what do you recommend"],
+    'search_knowledge': ["programme de fidelite", "livraison a domicile", "service traiteur",
+                         "devenir franchise"],
+}
+
+# Steps a local plan may hold; more goes to the LLM planner
+MAX_STEPS = 3
+
+# Tools whose plan needs a location to be meaningful
+LOCATION_REQUIRED = {'get_restaurant_info', 'find_nearest_restaurant'}
+
+
+def nearest_reference(query: str) -> Optional[str]:
+    """Words naming the place in "le plus proche de <place> ...", None without one
+
+    The capture stops at the first word that cannot belong to a place name;
+    whether it is a real place is not checked.
+    """
+    match = NEAREST_PATTERN.search(query)
+    if not match:
+        return None
+    kept = []
+    for word in match.group('ref').split():
+        tokens = tokenize(word)
+        if not tokens or any(t in REFERENCE_BREAK for t in tokens) or len(kept) == MAX_REFERENCE_WORDS:
+            break
+        kept.append(word)
+    while kept and all(t in PLACE_CONNECTORS for t in tokenize(kept[-1])):
+        kept.pop()
+    return ' '.join(kept) or None
+
+
+class IntentRouter:
+    """Keyword/regex router built from KB data and the agent tool list
+
+    route() returns a tool plan (same shape as the LLM planner output) when
+    confident, None otherwise so the caller falls back to LLM planning.
+    """
+
+    def __init__(self, kb, tools: List[Dict], embed_fn: Optional[Callable[[str], np.ndarray]] = None,
+                 min_confidence: float = 0.6, max_words: int = 12,
+                 centroid_threshold: float = 0.85, centroid_margin: float = 0.03):
+        self.tool_names = {tool['name'] for tool in tools}
+        self.embed_fn = embed_fn
+        self.min_confidence = min_confidence
+        self.max_words = max_words
+        self.centroid_threshold = centroid_threshold
+        self.centroid_margin = centroid_margin
+        self.centroids: Optional[np.ndarray] = None
+        self.centroid_tools: List[str] = []
+        self._stats = {'routed': 0, 'fallback': 0, 'centroid': 0, 'by_tool': {}}
+        self._stats_lock = threading.Lock()
+        self._build_location_patterns(kb)
+
+    def _build_location_patterns(self, kb):
+        """Compile city / department / postal code matchers from KB data"""
+        aliases = {}  # folded alias -> value passed to tools
+        # Postal localities from addresses ("..., 75011 Paris" -> "paris")
+        for resto in kb.get_all_restaurants():
+            locality = re.search(r'\b\d{5}\s+(.+)$', resto.get('adresse', ''))
+            if locality:
+                aliases[normalize_text(locality.group(1)).replace('-', ' ')] = locality.group(1).strip()
+        for ville in kb.get_all_cities():
+            aliases[normalize_text(ville).replace('-', ' ')] = ville
+            # "Saint-Denis (Pierrefitte)" -> also match "pierrefitte"
+            for part in re.findall(r'\(([^)]+)\)', ville):
+                aliases[normalize_text(part).replace('-', ' ')] = ville
+
+        dept_codes = {}  # code -> city it stands for
+        for dept, ville in kb.get_department_mapping().items():
+            if dept.isdigit():
+                dept_codes[dept] = ville
+            else:
+                # Department names are passed through as-is ("essonne" -> get_restaurant_info("essonne"))
+                aliases[normalize_text(dept).replace('-', ' ')] = dept
+
+        self.dept_codes = dept_codes
+        self.location_aliases = aliases
+        alternatives = sorted((re.escape(a) for a in aliases if a), key=len, reverse=True)
+        self._location_re = re.compile(r'\b(' + '|'.join(alternatives) + r')\b') if alternatives else None
+        self._dept_re = re.compile(r'\b(\d{5}|\d{2})\b')
+
+    def _detect_locations(self, folded_query: str) -> Tuple[List[str], List[str]]:
+        """Return (every location value, in query order, tokens they explain)
+
+        A department or postal code standing for a city already named
+        ("Corbeil 91100") is not a second location.
+        """
+        spaced = folded_query.replace('-', ' ')
+        found = []  # (position, value)
+        words = []
+        if self._location_re:
+            for match in self._location_re.finditer(spaced):
+                found.append((match.start(), self.location_aliases[match.group(1)]))
+                words.extend(match.group(1).split())
+        named = {value for _, value in found}
+
+        for match in self._dept_re.finditer(spaced):
+            code = match.group(1)
+            if code[:2] in self.dept_codes:
+                words.append(code)
+                if self.dept_codes[code[:2]] not in named:
+                    found.append((match.start(), code))
+
+        locations = []
+        for _, value in sorted(found, key=lambda item: item[0]):
+            if value not in locations:
+                locations.append(value)
+        return locations, words
+
+    def _detect_location(self, folded_query: str) -> Tuple[Optional[str], List[str]]:
+        """Return (first location value, tokens it explains)"""
+        locations, words = self._detect_locations(folded_query)
+        return (locations[0], words) if locations else (None, [])
+
+    def _extract_nearest_reference(self, query: str) -> Optional[str]:
+        """Place after "le plus proche de", None unless it looks like one
+        
+        The reference must be a known location or a proper noun: "de la gare"
+        or "de moi" are not geocodable and go to the LLM planner.
+        """
+        reference = nearest_reference(query)
+        if reference is None:
+            return None
+        location, _ = self._detect_location(normalize_text(reference))
+        if location is None and not (reference[0].isupper() or reference[0].isdigit()):
+            return None
+        return reference
+
+    @staticmethod
+    def _negated_criteria(words: List[str]) -> bool:
+        """A diet/spice keyword preceded by a negation ("pas épicé"); "sans gluten" is a criterion itself"""
+        for i, word in enumerate(words):
+            if word not in DIET_WORDS:
+                continue
+            before = words[max(0, i - NEGATION_WINDOW):i]
+            if word == 'gluten' and before[-1:] == ['sans']:
+                continue
+            if NEGATION_WORDS & set(before):
+                return True
+        return False
+
+    def _rule_plan(self, query: str) -> Tuple[List[Dict], float]:
+        """Apply keyword rules; returns (steps, coverage of content words)"""
+        folded = normalize_text(query)
+        words = tokenize(query)
+        content_words = [w for w in words if w not in STOPWORDS]
+        if not content_words:
+            return [], 0.0
+        explained = set()
+        steps = []
+
+        if self._negated_criteria(words):
+            return [], 0.0
+
+        reference = self._extract_nearest_reference(query)
+        if reference and 'find_nearest_restaurant' in self.tool_names:
+            # "le plus proche de Melun est ouvert ?" needs the result of the lookup
+            if CHAINED_WORDS & set(words):
+                return [], 0.0
+            explained.update(NEAREST_WORDS & set(words))
+            explained.update(RESTAURANT_WORDS & set(words))
+            explained.update(tokenize(reference))
+            steps.append({"tool": "find_nearest_restaurant", "parameters": {"ville_reference": reference}})
+        else:
+            # "horaires du 91 et 94": one step per location
+            locations, location_words = self._detect_locations(folded)
+            explained.update(location_words)
+            by_location = [{"ville": location} for location in locations] or [{}]
+            word_set = set(words)
+
+            has_hours = bool(HOURS_WORDS & word_set)
+            has_contact = bool(CONTACT_WORDS & word_set)
+            has_diet = bool(DIET_WORDS & word_set)
+            has_menu = bool(MENU_WORDS & word_set)
+            has_restaurant = bool(RESTAURANT_WORDS & word_set)
+
+            if has_hours:
+                explained.update(HOURS_WORDS & word_set)
+                steps.extend({"tool": "get_hours", "parameters": parameters} for parameters in by_location)
+            if has_contact:
+                explained.update(CONTACT_WORDS & word_set)
+                steps.extend({"tool": "get_contact", "parameters": parameters} for parameters in by_location)
+            if has_diet:
+                explained.update((DIET_WORDS | MENU_WORDS) & word_set)
+                steps.append({"tool": "filter_menu", "parameters": {"criteria": query}})
+            elif has_menu:
+                explained.update(MENU_WORDS & word_set)
+                steps.append({"tool": "get_menu", "parameters": {}})
+
+            if has_restaurant:
+                explained.update(RESTAURANT_WORDS & word_set)
+            location_used = has_hours or has_contact
+            if locations and not location_used:
+                steps.extend({"tool": "get_restaurant_info", "parameters": {"ville": location}}
+                             for location in locations)
+            elif has_restaurant and not steps:
+                steps.append({"tool": "get_restaurants", "parameters": {}})
+
+        steps = [step for step in steps if step["tool"] in self.tool_names]
+        if len(steps) > MAX_STEPS:
+            # Dropping a step would silently leave part of the question unanswered
+            return [], 0.0
+        coverage = sum(1 for w in content_words if w in explained) / len(content_words)
+        return steps, coverage
+
+    def fit_centroids(self, examples: Optional[Dict[str, List[str]]] = None):
+        """Embed seed utterances and store one normalized centroid per tool"""
+        if self.embed_fn is None:
+            return
+        examples = examples or DEFAULT_INTENT_EXAMPLES
+        tools, centroids = [], []
+        for tool_name, utterances in examples.items():
+            if tool_name not in self.tool_names or not utterances:
+                continue
+            vectors = np.array([self.embed_fn(u) for u in utterances], dtype=np.float32)
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            tools.append(tool_name)
+        if centroids:
+            self.centroids = np.vstack(centroids)
+            self.centroid_tools = tools
+
+    def _centroid_plan(self, query: str) -> List[Dict]:
+        """Nearest-centroid fallback over cached query embeddings"""
+        if self.centroids is None or self.embed_fn is None:
+            return []
+        vector = np.asarray(self.embed_fn(query), dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        scores = self.centroids @ vector
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else -1.0
+        if best < self.centroid_threshold or best - runner_up < self.centroid_margin:
+            return []
+
+        tool_name = self.centroid_tools[order[0]]
+        locations, _ = self._detect_locations(normalize_text(query))
+        if len(locations) > 1 or (tool_name in LOCATION_REQUIRED and not locations):
+            return []
+        location = locations[0] if locations else None
+        parameters = {
+            'search_knowledge': {"query": query},
+            'filter_menu': {"criteria": query},
+            'recommend_dish': {"preferences": query},
+            'get_contact': {"ville": location} if location else {},
+            'get_hours': {"ville": location} if location else {},
+            'get_restaurant_info': {"ville": location},
+        }.get(tool_name, {})
+        return [{"tool": tool_name, "parameters": parameters}]
+
+    def route(self, query: str) -> Optional[List[Dict]]:
+        """Return a tool plan when confident, None to fall back to the LLM planner"""
+        steps = []
+        source = 'rules'
+        if query and len(tokenize(query)) <= self.max_words:
+            steps, coverage = self._rule_plan(query)
+            if coverage < self.min_confidence:
+                steps = []
+            if not steps:
+                try:
+                    steps = self._centroid_plan(query)
+                    source = 'centroid'
+                except Exception as e:
+                    logger.warning("Centroid routing failed", extra={"error_type": type(e).__name__})
+                    steps = []
+
+        # Hit rate on /metrics: 1 - fallback / all outcomes
+        tracing.metrics.inc('bolkiri_router_queries_total', outcome=source if steps else 'fallback')
+        with self._stats_lock:
+            if not steps:
+                self._stats['fallback'] += 1
+                return None
+            self._stats['routed'] += 1
+            if source == 'centroid':
+                self._stats['centroid'] += 1
+            for step in steps:
+                self._stats['by_tool'][step['tool']] = self._stats['by_tool'].get(step['tool'], 0) + 1
+
+        logger.info("Query routed without LLM planning", extra={"user_query": query, "tool_name": ",".join(s['tool'] for s in steps)})
+        return steps
+
+    def stats(self) -> Dict:
+        """Consistent copy of the counters, with the hit rate"""
+        with self._stats_lock:
+            stats = dict(self._stats, by_tool=dict(self._stats['by_tool']))
+        total = stats['routed'] + stats['fallback']
+        stats['hit_rate'] = stats['routed'] / total if total else 0.0
+        return stats
+
+    def hit_rate(self) -> float:
+        return self.stats()['hit_rate']
@@ -0,0 +1,32 @@
+"""
+Derived views of the knowledge base - built once per KB version
+"""
+import threading
+from typing import Any, Callable, Dict
+
+
+class KBViews:
+    """Memoized read-only projections of KB data (department mapping, city list...)
+
+    A view is computed on first access and then served from a dict. Views are
+    tied to the KB version (hash of the knowledge file); a new version starts
+    from an empty cache. Callers must not mutate returned values.
+    """
+
+    def __init__(self, version: str):
+        self.version = version
+        self._views: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, build: Callable[[], Any]) -> Any:
+        try:
+            return self._views[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._views:
+                self._views[name] = build()
+            return self._views[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._views
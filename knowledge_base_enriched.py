@@ -1,11 +1,18 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
+import copy
 import json
 import os
+import hashlib
 from datetime import datetime
 from math import radians, sin, cos, sqrt, atan2
 
 # Import RAG Engine (OBLIGATOIRE)
 from rag_engine import RAGEngine
+from restaurant_index import RestaurantIndex
+from kb_views import KBViews
+from geocoding import Gazetteer, GeocodeCache, Geocoder, GAZETTEER_FILE
+from geo_index import LocationIndex
+from dish_table import DishTable
 
 class EnrichedKnowledgeBase:
     """Enriched knowledge base for ALL Bolkiri restaurants"""
@@ -13,44 +20,88 @@ class EnrichedKnowledgeBase:
     def __init__(self):
         self.complete_file = "bolkiri_knowledge_industrial_2025.json"
         self.fallback_dir = "./data"
-        self.data = self._load_complete_knowledge()
+        # Version and data come from the same bytes (the file may be rewritten in between reads)
+        self._file_stat = self._knowledge_stat()
+        raw = self._read_knowledge_file()
+        self.data = self._load_complete_knowledge(raw)
         
-        # Adapt new structure
-        self.restaurants = self.data.get('restaurants', [])
-        self.menu_complet = self._extract_menu_from_pages()
-        self.infos_generales = self.data.get('informations_generales', {})
+        # Derived views (department mapping, cities...) are memoized per KB version
+        self.version = self._knowledge_version(raw)
+        self.views = KBViews(self.version)
         
-        # For compatibility with old system
-        self.documents = self._create_documents_from_pages()
-        self.menu_items = self.menu_complet
+        self._index_data()
+        self.geocoder = self._build_geocoder()
         
         # Initialize RAG Engine (MANDATORY)
         print("Initialisation RAG Engine...")
-        # force_rebuild from env variable (default: True in production)
-        force_rebuild = os.getenv('REBUILD_EMBEDDINGS', 'true').lower() == 'true'
-        self.rag_engine = RAGEngine(self.complete_file, force_rebuild=force_rebuild)
+        # Persisted vectors are validated per document hash and reused;
+        # REBUILD_EMBEDDINGS=true wipes them and re-embeds the whole corpus
+        force_rebuild = os.getenv('REBUILD_EMBEDDINGS', 'false').lower() == 'true'
+        # Indexed from the bytes hashed into self.version, never from a second read of the file
+        # (a missing file still fails here: the RAG engine is mandatory)
+        self.rag_engine = RAGEngine(self.complete_file, force_rebuild=force_rebuild,
+                                    data=self.data if raw is not None else None)
+        self.index_stats = self.rag_engine.index_stats
         print("RAG Engine active - Recherche semantique disponible")
         
         print(f"Base enrichie chargee: {len(self.restaurants)} restos, {len(self.menu_complet)} items menu")
     
+    def _index_data(self):
+        """Structures derived from self.data (rebuilt on every KB version)"""
+        # Adapt new structure
+        self.restaurants = self.data.get('restaurants', [])
+        self.restaurant_index = RestaurantIndex(self.restaurants)
+        self.restaurant_locations = self._build_restaurant_locations()
+        self.dish_table = DishTable(self._extract_menu_from_pages())
+        self.menu_complet = self.dish_table.dishes
+        self.infos_generales = self.data.get('informations_generales', {})
+        
+        # For compatibility with old system
+        self.documents = self._create_documents_from_pages()
+        self.menu_items = self.menu_complet
+    
+    def refreshed(self) -> "EnrichedKnowledgeBase":
+        """KB for the current knowledge file, built incrementally from this one
+        
+        Returns self when the file did not change. Otherwise returns a new
+        object: documents are diffed by ID and content hash and only added or
+        changed ones are embedded. The version, the data and the re-indexed
+        documents all come from one read of the file, as does the index of
+        this KB they are diffed against. This object is left untouched, so callers
+        swap their reference in one assignment and in-flight requests never
+        see a half-updated index.
+        """
+        stat = self._knowledge_stat()
+        raw = self._read_knowledge_file()
+        version = self._knowledge_version(raw)
+        if version == self.version:
+            # Rewritten with the same content: no need to hash it again on the next poll
+            self._file_stat = stat
+            return self
+        
+        kb = copy.copy(self)
+        kb._file_stat = stat
+        kb.data = kb._load_complete_knowledge(raw)
+        kb.version = version
+        kb.views = KBViews(version)
+        kb._index_data()
+        kb.geocoder = kb._build_geocoder(self.geocoder.cache)
+        kb.rag_engine = self.rag_engine.updated(kb.data)
+        kb.index_stats = kb.rag_engine.index_stats
+        return kb
+    
     def _extract_menu_from_pages(self) -> List[Dict]:
-        """Extract menu from scraped pages"""
+        """Dish records parsed by the scraper (dish_data of each menu page)"""
         menu = []
         pages_categorie = self.data.get('pages_par_categorie', {})
         
-        # Search in menu pages
         for page in pages_categorie.get('menu', []):
-            content = page.get('content', '')
-            # Parse content to extract dishes
-            # For now, return basic structure
-            if content:
-                menu.append({
-                    'nom': 'Menu Bolkiri',
-                    'description': content[:500],
-                    'prix': 'Variable'
-                })
+            dish = page.get('dish_data')
+            if dish and dish.get('nom'):
+                menu.append(dict(dish, url=page.get('url', '')))
         
-        return menu if menu else []
+        # Old format: menu.json items already carry their fields
+        return menu or list(self.data.get('menu_complet', []))
     
     def _create_documents_from_pages(self) -> List[Dict]:
         """Create documents from all scraped pages"""
@@ -70,12 +121,37 @@ class EnrichedKnowledgeBase:
         
         return documents
     
-    def _load_complete_knowledge(self) -> Dict:
-        """Load complete knowledge base"""
-        if os.path.exists(self.complete_file):
+    def _knowledge_stat(self) -> Optional[tuple]:
+        """(mtime_ns, size) of the knowledge file, None when it does not exist"""
+        try:
+            stat = os.stat(self.complete_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def knowledge_file_changed(self) -> bool:
+        """Cheap check (one stat) that the knowledge file differs from the one this KB was built from"""
+        return self._knowledge_stat() != self._file_stat
+    
+    def _read_knowledge_file(self) -> Optional[bytes]:
+        try:
+            with open(self.complete_file, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _knowledge_version(raw: Optional[bytes]) -> str:
+        """Content hash of the knowledge file bytes (changes only when the file does)"""
+        if raw is None:
+            return "fallback"
+        return hashlib.sha256(raw).hexdigest()[:16]
+    
+    def _load_complete_knowledge(self, raw: Optional[bytes]) -> Dict:
+        """Load complete knowledge base from the knowledge file bytes"""
+        if raw is not None:
             try:
-                with open(self.complete_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return json.loads(raw.decode('utf-8'))
             except Exception as e:
                 print(f"Erreur chargement base complete: {e}")
         
@@ -99,10 +175,17 @@ class EnrichedKnowledgeBase:
         
         return data
     
-    def search(self, query: str, limit: int = 5) -> List[Dict]:
-        """Semantic search with RAG (mandatory)"""
-        results = self.rag_engine.search(query, top_k=limit)
-        
+    def search(self, query: str, limit: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
+        """Semantic search with RAG (mandatory), optionally restricted by type/category/ville"""
+        results = self.rag_engine.search(query, top_k=limit, filters=filters)
+        return self._format_search_results(results)
+    
+    async def asearch(self, query: str, limit: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
+        """Async semantic search (non-blocking embedding call)"""
+        results = await self.rag_engine.asearch(query, top_k=limit, filters=filters)
+        return self._format_search_results(results)
+    
+    def _format_search_results(self, results: List[Dict]) -> List[Dict]:
         # Format for compatibility with old format
         formatted_results = []
         for result in results:
@@ -122,113 +205,34 @@ class EnrichedKnowledgeBase:
     
     def _extract_ville_from_name(self, name: str) -> str:
         """Extract city from name 'BOLKIRI City Street Food Viêt'"""
-        # Remove 'BOLKIRI' and 'Street Food Viêt'
-        ville = name.replace('BOLKIRI', '').replace('Street Food Viêt', '').strip()
-        return ville
+        return RestaurantIndex.city_from_name(name)
     
     def get_restaurant_by_ville(self, ville: str) -> Optional[Dict]:
-        """Find restaurant by city, department or postal code"""
-        # Department → city mapping (normalized version)
-        dept_mapping = {
-            "91": "corbeil",  # Simplified for partial match
-            "essonne": "corbeil",
-            "94": "ivry",
-            "val-de-marne": "ivry",
-            "78": "mureaux",
-            "yvelines": "mureaux",
-            "77": "lagny",
-            "seine-et-marne": "lagny"
-        }
-        
-        ville_search = ville.lower().strip()
-        
-        # Search by department mapping
-        if ville_search in dept_mapping:
-            ville_search = dept_mapping[ville_search]
-        
-        # Search by postal code (91xxx → corbeil)
-        if ville_search.startswith("91"):
-            ville_search = "corbeil"
-        elif ville_search.startswith("94"):
-            ville_search = "ivry"
-        elif ville_search.startswith("78"):
-            ville_search = "mureaux"
-        elif ville_search.startswith("77"):
-            ville_search = "lagny"
-        
-        # Search restaurant (fuzzy matching with normalization)
-        ville_lower = ville_search.lower()
-        # Normalize for matching (remove hyphens and extra spaces)
-        ville_normalized = ville_lower.replace('-', ' ').replace('  ', ' ').strip()
-        # Also create version without spaces for partial word matching
-        ville_compact = ville_normalized.replace(' ', '')
-        
-        for resto in self.restaurants:
-            # Extract city from name and address
-            resto_ville = self._extract_ville_from_name(resto.get('name', '')).lower()
-            resto_adresse = resto.get('adresse', '').lower()
-            
-            # Normalize restaurant data
-            resto_ville_normalized = resto_ville.replace('-', ' ').replace('  ', ' ').strip()
-            resto_adresse_normalized = resto_adresse.replace('-', ' ')
-            resto_ville_compact = resto_ville_normalized.replace(' ', '')
-            
-            # Multi-strategy matching:
-            # 1. Exact or starts-with match (original)
-            if ville_lower in resto_ville or resto_ville.startswith(ville_lower):
-                return resto
-            # 2. Normalized match (with spaces)
-            if ville_normalized in resto_ville_normalized or resto_ville_normalized.startswith(ville_normalized):
-                return resto
-            # 3. Compact match (e.g., "ivrysurseine" matches "ivry")
-            if resto_ville_compact in ville_compact or ville_compact.startswith(resto_ville_compact):
-                return resto
-            # 4. Address match
-            if ville_lower in resto_adresse or ville_normalized in resto_adresse_normalized:
-                return resto
-        
-        return None
+        """Find restaurant by city, department, postal code or alias (indexed lookup)"""
+        return self.restaurant_index.find(ville)
+    
+    def lookup_restaurants(self, ville: str) -> List[Dict]:
+        """All restaurants matching a city, department (code or name), postal code or alias"""
+        return self.restaurant_index.lookup(ville)
     
     def get_all_menu_items(self, categorie: Optional[str] = None) -> List[Dict]:
         """Retourne tout le menu ou filtré par catégorie"""
         if categorie:
-            return [p for p in self.menu_complet if p.get('categorie', '').lower() == categorie.lower()]
+            return self.dish_table.filter(categorie=categorie)
         return self.menu_complet
     
     def filter_menu(self, 
                     vegetarien: Optional[bool] = None,
                     vegan: Optional[bool] = None,
                     sans_gluten: Optional[bool] = None,
-                    epice: Optional[str] = None,
+                    epice: Union[bool, str, None] = None,
                     prix_max: Optional[float] = None,
-                    categorie: Optional[str] = None) -> List[Dict]:
-        """Filtre le menu selon plusieurs critères"""
-        results = self.menu_complet.copy()
-        
-        if vegetarien is not None:
-            results = [p for p in results if p.get('vegetarien') == vegetarien]
-        
-        if vegan is not None:
-            results = [p for p in results if p.get('vegan') == vegan]
-        
-        if sans_gluten is not None:
-            results = [p for p in results if p.get('sans_gluten') == sans_gluten]
-        
-        if epice:
-            results = [p for p in results if p.get('epice', '').lower() == epice.lower()]
-        
-        if prix_max:
-            def extract_price(prix_str):
-                try:
-                    return float(prix_str.replace('€', '').replace(',', '.').strip())
-                except:
-                    return 999
-            results = [p for p in results if extract_price(p.get('prix', '999€')) <= prix_max]
-        
-        if categorie:
-            results = [p for p in results if p.get('categorie', '').lower() == categorie.lower()]
-        
-        return results
+                    categorie: Optional[str] = None,
+                    signature: Optional[bool] = None) -> List[Dict]:
+        """Filtre le menu selon plusieurs critères (bitmaps de la DishTable, sans appel API)"""
+        return self.dish_table.filter(vegetarien=vegetarien, vegan=vegan, sans_gluten=sans_gluten,
+                                      signature=signature, epice=epice, prix_max=prix_max,
+                                      categorie=categorie)
     
     def get_contact_info(self, ville: Optional[str] = None) -> Dict:
         """Return contact info (for restaurant or general)"""
@@ -278,7 +282,7 @@ class EnrichedKnowledgeBase:
     
     def get_plats_signatures(self) -> List[Dict]:
         """Return signature dishes"""
-        return [p for p in self.menu_complet if p.get('signature', False)]
+        return self.dish_table.filter(signature=True)
     
     def get_info_generale(self, key: Optional[str] = None):
         """Return general info"""
@@ -308,60 +312,69 @@ class EnrichedKnowledgeBase:
         Returns:
             Dict with nearest restaurant info and distance
         """
-        # First try to geocode the reference city
-        import requests
+        # Offline gazetteer and geocode cache first, Nominatim only for unknown places
         try:
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {
-                'q': f"{ville_reference}, France",
-                'format': 'json',
-                'limit': 1
-            }
-            headers = {'User-Agent': 'BolkiriChatbot/1.0'}
-            
-            response = requests.get(url, params=params, headers=headers, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            
-            if not data:
-                return {"error": f"Ville '{ville_reference}' non trouvée"}
-            
-            ref_lat = float(data[0]['lat'])
-            ref_lon = float(data[0]['lon'])
-            
+            location = self.geocoder.geocode(ville_reference)
         except Exception as e:
             return {"error": f"Erreur de géolocalisation: {str(e)}"}
         
-        # Find nearest restaurant with coordinates
-        nearest = None
-        min_distance = float('inf')
+        return self._nearest_from_location(ville_reference, location)
+    
+    async def afind_nearest_restaurant(self, ville_reference: str) -> Dict:
+        """Async variant of find_nearest_restaurant (non-blocking Nominatim call)"""
+        try:
+            location = await self.geocoder.ageocode(ville_reference)
+        except Exception as e:
+            return {"error": f"Erreur de géolocalisation: {str(e)}"}
         
-        for resto in self.restaurants:
-            coords = resto.get('coordinates')
-            if not coords or not coords.get('lat') or not coords.get('lon'):
-                continue
-            
-            distance = self.haversine_distance(
-                ref_lat, ref_lon,
-                coords['lat'], coords['lon']
-            )
-            
-            if distance < min_distance:
-                min_distance = distance
-                nearest = resto
+        return self._nearest_from_location(ville_reference, location)
+    
+    def _nearest_from_location(self, ville_reference: str, location: Optional[Dict], k: int = 3) -> Dict:
+        """Nearest restaurant from geocoded coordinates, plus the k nearest in 'nearest'"""
+        if not location:
+            return {"error": f"Ville '{ville_reference}' non trouvée"}
         
-        if not nearest:
+        matches = self.restaurant_locations.nearest(location['lat'], location['lon'], k=k)
+        if not matches:
             return {"error": "Aucun restaurant avec coordonnées GPS disponibles"}
         
+        nearest = [self._nearest_entry(loc['restaurant'], distance) for loc, distance in matches]
+        return dict(nearest[0], nearest=nearest)
+    
+    def _nearest_entry(self, resto: Dict, distance_km: float) -> Dict:
         return {
-            'restaurant': nearest['name'],
-            'ville': self._extract_ville_from_name(nearest['name']),
-            'adresse': nearest['adresse'],
-            'distance_km': round(min_distance, 1),
-            'telephone': nearest.get('telephone', ''),
-            'url': nearest.get('url', '')
+            'restaurant': resto['name'],
+            'ville': self._extract_ville_from_name(resto['name']),
+            'adresse': resto['adresse'],
+            'distance_km': round(distance_km, 1),
+            'telephone': resto.get('telephone', ''),
+            'url': resto.get('url', '')
         }
     
+    def _build_restaurant_locations(self) -> LocationIndex:
+        """Restaurant coordinates packed once for vectorized nearest search"""
+        return LocationIndex([
+            {'lat': resto['coordinates']['lat'], 'lon': resto['coordinates']['lon'], 'restaurant': resto}
+            for resto in self.restaurants
+            if (resto.get('coordinates') or {}).get('lat') and resto['coordinates'].get('lon')
+        ])
+    
+    def _build_geocoder(self, cache: Optional[GeocodeCache] = None) -> Geocoder:
+        """Gazetteer of communes + restaurant towns, backed by the shared geocode cache"""
+        restaurant_rows = [
+            (self._extract_ville_from_name(resto.get('name', '')), '', resto['coordinates']['lat'], resto['coordinates']['lon'])
+            for resto in self.restaurants
+            if (resto.get('coordinates') or {}).get('lat') and resto['coordinates'].get('lon')
+        ]
+        if cache is None:
+            cache = GeocodeCache(os.getenv('GEOCODE_CACHE_DB', 'geocode_cache.db') or None)
+        return Geocoder(Gazetteer.from_csv(GAZETTEER_FILE, restaurant_rows), cache)
+    
+    def after_fork(self):
+        """Recreate process-local connections in a worker forked from the preloading master"""
+        self.rag_engine.after_fork()
+        self.geocoder.cache.reopen()
+    
     # Compatibility methods with old system
     def add_documents(self, documents: List[Dict]):
         """For compatibility - does nothing since enriched base is static"""
@@ -376,42 +389,13 @@ class EnrichedKnowledgeBase:
         pass
     
     def get_department_mapping(self) -> Dict[str, str]:
-        """100% RAG - Extract department mapping from restaurants data
+        """100% RAG - Department mapping from restaurant postal codes
         
         Returns:
-            Dict mapping department codes and names to cities
+            Dict mapping department codes and names to the city of the
+            department's first restaurant
         """
-        mapping = {}
-        
-        # Extract from restaurants
-        for resto in self.restaurants:
-            name = resto.get('name', '')
-            adresse = resto.get('adresse', '')
-            
-            # Extract city from name "BOLKIRI {City} Street Food Viêt"
-            ville = name.replace('BOLKIRI', '').replace('Street Food Viêt', '').strip()
-            
-            # Extract department code from address (postal code)
-            import re
-            postal_match = re.search(r'\b(\d{5})\b', adresse)
-            if postal_match:
-                postal = postal_match.group(1)
-                dept_code = postal[:2]
-                
-                # Map department code to city
-                mapping[dept_code] = ville
-                
-                # Add full department names
-                dept_names = {
-                    "91": "essonne",
-                    "94": "val-de-marne",
-                    "78": "yvelines",
-                    "77": "seine-et-marne"
-                }
-                if dept_code in dept_names:
-                    mapping[dept_names[dept_code]] = ville
-        
-        return mapping
+        return self.views.get('department_mapping', self.restaurant_index.department_mapping)
     
     def get_all_cities(self) -> List[str]:
         """100% RAG - Extract all cities from restaurants data
@@ -419,16 +403,10 @@ class EnrichedKnowledgeBase:
         Returns:
             List of all city names
         """
-        cities = []
-        
-        for resto in self.restaurants:
-            name = resto.get('name', '')
-            # Extract city from name "BOLKIRI {City} Street Food Viêt"
-            ville = name.replace('BOLKIRI', '').replace('Street Food Viêt', '').strip()
-            if ville and ville not in cities:
-                cities.append(ville)
-        
-        return cities
+        return self.views.get(
+            'cities',
+            lambda: [ville for ville in dict.fromkeys(self.restaurant_index.cities) if ville]
+        )
 
 
 # Alias for compatibility
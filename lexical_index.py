@@ -0,0 +1,106 @@
+"""
+In-process BM25 inverted index over RAG documents (accent-insensitive)
+"""
+import re
+import math
+from collections import Counter, defaultdict
+from typing import List, Dict, Tuple, Optional, Collection
+
+from text_utils import tokenize, STOPWORDS
+
+# French phone numbers written with spaces/dots/dashes ("01 23 45 67 89")
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+33[\s.\-]?|0)\d(?:[\s.\-]?\d{2}){4}(?!\d)")
+
+
+def lexical_tokens(text: str) -> List[str]:
+    """Word tokens, with each phone number collapsed into one digits-only token"""
+    phones = []
+    for match in _PHONE_RE.finditer(text):
+        digits = re.sub(r"\D", "", match.group())
+        if digits.startswith('33'):
+            digits = '0' + digits[2:]
+        phones.append(digits)
+    return tokenize(_PHONE_RE.sub(' ', text)) + phones
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse several ranked lists of document indices: score = sum 1/(k + rank)"""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_idx in enumerate(ranking, 1):
+            fused[doc_idx] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """BM25 (Okapi) scoring over an inverted index of document tokens"""
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75, max_df_ratio: float = 0.25,
+                 decisive_ratio: float = 1.5, decisive_coverage: float = 0.9):
+        self.k1 = k1
+        self.b = b
+        self.decisive_ratio = decisive_ratio
+        self.decisive_coverage = decisive_coverage
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)  # token -> [(doc, tf)]
+        self.doc_lengths: List[int] = []
+
+        for doc_idx, text in enumerate(texts):
+            counts = Counter(lexical_tokens(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                self.postings[token].append((doc_idx, tf))
+
+        n_docs = len(texts)
+        self.avg_length = (sum(self.doc_lengths) / n_docs) if n_docs else 0.0
+        # Query terms present in more docs than this carry no signal (e.g. 'bolkiri')
+        self.max_df = max(1, int(max_df_ratio * n_docs))
+        self.idf = {
+            token: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for token, docs in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 10, allowed: Optional[Collection[int]] = None) -> List[Tuple[int, float]]:
+        """Return [(doc index, BM25 score)] sorted by decreasing score
+
+        allowed restricts scoring to a subset of document indices (metadata filters).
+        """
+        return self._score(query, allowed)[0][:top_k]
+
+    def _score(self, query: str, allowed: Optional[Collection[int]] = None) -> Tuple[List[Tuple[int, float]], Dict[int, float], float]:
+        """BM25 scores plus, per document, the share of query IDF it matches"""
+        terms = [
+            t for t in dict.fromkeys(lexical_tokens(query))
+            if t not in STOPWORDS and 0 < len(self.postings.get(t, ())) <= self.max_df
+        ]
+        scores = defaultdict(float)
+        matched_idf = defaultdict(float)
+        total_idf = sum(self.idf[t] for t in terms)
+
+        for term in terms:
+            idf = self.idf[term]
+            for doc_idx, tf in self.postings[term]:
+                if allowed is not None and doc_idx not in allowed:
+                    continue
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_idx] / self.avg_length
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+                matched_idf[doc_idx] += idf
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        coverage = {doc_idx: matched_idf[doc_idx] / total_idf for doc_idx in scores} if total_idf else {}
+        return ranked, coverage, total_idf
+
+    def decisive(self, query: str, allowed: Optional[Collection[int]] = None) -> List[Tuple[int, float]]:
+        """Best lexical hit when it settles the query on its own, else []
+
+        Decisive means the best document matches (almost) every informative
+        query term and clearly outscores the runner-up - e.g. an exact phone
+        number, postal code or dish name that only one document contains.
+        """
+        ranked, coverage, total_idf = self._score(query, allowed)
+        if not ranked or total_idf == 0:
+            return []
+        best_idx, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if coverage[best_idx] < self.decisive_coverage or best < self.decisive_ratio * runner_up:
+            return []
+        return ranked[:1]
@@ -3,37 +3,247 @@ Structured JSON logging configuration for production observability
 """
 import logging
 import json
+import os
+import queue
 import sys
-from datetime import datetime
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, List
+from tracing import current_trace_id
+
+# Records go through a bounded queue to a writer thread (false: write inline, as before)
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Records written (and flushed) per write call at most
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+# Once the queue is half full, keep 1 in N records below WARNING
+LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", "10"))
+
+# Record attributes copied into the JSON line when a log call passes them in `extra`
+EXTRA_FIELDS = (
+    "user_query", "tool_name", "restaurant_count", "validation_result", "error_type", "latency_ms", "status",
+    "index_stats", "stage", "prompt_tokens", "completion_tokens", "cached_tokens", "cache_stats", "kb_version",
+    "findings", "stages",
+)
+
+# Built once: json.dumps with options creates a new encoder per call. default=str keeps
+# an unexpected extra (datetime, numpy scalar) from turning the log line into an error.
+_ENCODER = json.JSONEncoder(ensure_ascii=False, default=str)
 
 
 class JSONFormatter(logging.Formatter):
     """Custom JSON formatter for structured logging"""
     
+    def __init__(self):
+        super().__init__()
+        self._second = None
+        self._second_text = ""
+    
+    def _timestamp(self, created: float) -> str:
+        """ISO-8601 UTC of the record's creation time (strftime once per second)"""
+        second = int(created)
+        if second != self._second:
+            self._second_text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._second = second
+        return f"{self._second_text}.{int((created - second) * 1_000_000):06d}Z"
+    
     def format(self, record: logging.LogRecord) -> str:
         """Format log record as JSON"""
         log_data: Dict[str, Any] = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
         }
         
         # Add extra context if available
-        if hasattr(record, "extra"):
+        fields = record.__dict__
+        if "extra" in fields:
             log_data.update(record.extra)
         
-        # Add exception info if present
+        # Add exception info if present (already rendered when queued by AsyncJSONHandler)
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data["exception"] = record.exc_text
+        
+        # Request correlation (stamped by TraceIdFilter in the thread that logged)
+        trace_id = fields.get("trace_id")
+        if trace_id:
+            log_data["trace_id"] = trace_id
         
         # Add custom fields from record
-        for key in ["user_query", "tool_name", "restaurant_count", "validation_result", "error_type"]:
-            if hasattr(record, key):
-                log_data[key] = getattr(record, key)
+        for key in EXTRA_FIELDS:
+            if key in fields:
+                log_data[key] = fields[key]
         
-        return json.dumps(log_data, ensure_ascii=False)
+        return _ENCODER.encode(log_data)
+
+
+class TraceIdFilter(logging.Filter):
+    """Attach the trace ID of the request being served to every record"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "trace_id", None) is None:
+            record.trace_id = current_trace_id()
+        return True
+
+
+_STOP = object()
+
+
+class AsyncJSONHandler(logging.Handler):
+    """Non-blocking handler: emit() only enqueues, a writer thread formats and writes
+    
+    The queue is bounded. Once it is half full, records below WARNING are
+    sampled (1 in sample_rate kept); when it is full, new records are dropped.
+    The writer drains up to batch_size records per write and reports how many
+    were dropped or sampled out in a WARNING line of its own. Records are
+    timestamped at creation, so queueing does not skew them.
+    """
+    
+    def __init__(self, stream=None, capacity: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 sample_rate: int = LOG_SAMPLE_RATE):
+        super().__init__()
+        self.stream = stream if stream is not None else sys.stdout
+        self.capacity = max(1, capacity)
+        self.batch_size = max(1, batch_size)
+        self.sample_rate = max(1, sample_rate)
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'sampled_out': 0, 'write_errors': 0}
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._reported = {'dropped': 0, 'sampled_out': 0}
+        self._below_warning = 0
+        self._pid = None
+        self._queue = None
+        self._thread = None
+    
+    def _ensure_writer(self):
+        """Writer thread of this process (threads do not survive a gunicorn fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.capacity)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name="log-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+    
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+    
+    def emit(self, record: logging.LogRecord):
+        try:
+            self._ensure_writer()
+            if record.levelno < logging.WARNING and self._queue.qsize() * 2 >= self.capacity:
+                # Unlocked on purpose: a lost increment only shifts which record is kept
+                self._below_warning += 1
+                if self._below_warning % self.sample_rate:
+                    self._count('sampled_out')
+                    return
+            self._prepare(record)
+            self._queue.put_nowait(record)
+            self._count('queued')
+        except queue.Full:
+            self._count('dropped')
+        except Exception:
+            self.handleError(record)
+    
+    def _prepare(self, record: logging.LogRecord):
+        """Freeze what may change or pin memory once the caller moves on (args, traceback)"""
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+            record.exc_info = None
+    
+    def _run(self, records: queue.Queue):
+        while True:
+            batch = [records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batch
+            self._write([record for record in batch if record is not _STOP])
+            for _ in batch:
+                records.task_done()
+            if stop:
+                return
+    
+    def _write(self, batch: List[logging.LogRecord]):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self._count('write_errors')
+        written = len(lines)
+        lost = self._lost_since_last_report()
+        if lost:
+            summary = logging.LogRecord(__name__, logging.WARNING, __file__, 0, "Log records dropped", None, None)
+            summary.extra = lost
+            lines.append(self.format(summary))
+        if not lines:
+            return
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            self._count('write_errors')
+            return
+        with self._stats_lock:
+            self.stats['written'] += written
+            self.stats['batches'] += 1
+    
+    def _lost_since_last_report(self) -> Dict[str, int]:
+        with self._stats_lock:
+            lost = {key: self.stats[key] - self._reported[key] for key in self._reported}
+            self._reported = {key: self.stats[key] for key in self._reported}
+        return {key: count for key, count in lost.items() if count}
+    
+    def flush(self, timeout: float = 2.0):
+        """Wait (bounded) until everything queued so far is written"""
+        if self._pid != os.getpid() or self._queue is None:
+            return
+        records = self._queue
+        deadline = time.monotonic() + timeout
+        with records.all_tasks_done:
+            while records.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                records.all_tasks_done.wait(remaining)
+    
+    def close(self):
+        """Drain and stop the writer (logging.shutdown calls this at exit)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=1.0)
+                self._thread.join(timeout=2.0)
+            except queue.Full:
+                pass
+        super().close()
+
+
+_shared_handler = None
+_shared_handler_lock = threading.Lock()
+
+
+def _console_handler() -> logging.Handler:
+    """One stdout handler for every logger of the process (one writer thread)"""
+    global _shared_handler
+    with _shared_handler_lock:
+        if _shared_handler is None:
+            handler = AsyncJSONHandler(sys.stdout) if LOG_ASYNC else logging.StreamHandler(sys.stdout)
+            handler.setFormatter(JSONFormatter())
+            handler.addFilter(TraceIdFilter())
+            _shared_handler = handler
+        return _shared_handler
 
 
 def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
@@ -52,12 +262,9 @@ def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
     # Remove existing handlers to avoid duplicates
     logger.handlers.clear()
     
-    # Console handler with JSON formatting
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(level)
-    console_handler.setFormatter(JSONFormatter())
-    
-    logger.addHandler(console_handler)
+    # Shared console handler with JSON formatting (queued, see AsyncJSONHandler);
+    # the logger's level does the filtering
+    logger.addHandler(_console_handler())
     
     # Prevent propagation to root logger
     logger.propagate = False
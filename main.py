@@ -1,14 +1,18 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import os
+import gc
+import json
 from datetime import datetime
 from dotenv import load_dotenv
 from ai_agent import AIAgent
+from knowledge_base_enriched import EnrichedKnowledgeBase
 from logger_config import setup_logger
+import tracing
 
 load_dotenv()
 
@@ -25,12 +29,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def bind_trace_id(request: Request, call_next):
+    """Tag every log line of a request with one trace ID (the caller's X-Request-ID if sent)"""
+    requested = (request.headers.get("x-request-id") or "")[:64] or None
+    with tracing.bind_trace_id(requested) as trace_id:
+        response = await call_next(request)
+    response.headers["X-Trace-Id"] = trace_id
+    return response
+
 # Mount static directory
 if os.path.exists("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
 agent = None
 
+def preload_knowledge_base() -> Optional[EnrichedKnowledgeBase]:
+    """Build the KB, vectors and FAISS index once, before workers are forked
+    
+    Used with gunicorn --preload (see gunicorn_conf.py): workers inherit the
+    index copy-on-write instead of each parsing the JSON and loading vectors.
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        return None
+    try:
+        kb = EnrichedKnowledgeBase()
+    except Exception as e:
+        logger.error("Failed to preload knowledge base", extra={"error_type": type(e).__name__, "error_message": str(e)}, exc_info=True)
+        return None
+    # Move everything allocated so far out of the collector's reach: gc passes in
+    # the workers would otherwise write to (and un-share) every inherited page
+    gc.freeze()
+    logger.info("Knowledge base preloaded", extra={"index_stats": kb.index_stats})
+    return kb
+
+shared_kb = preload_knowledge_base() if os.getenv("PRELOAD_KB", "false").lower() == "true" else None
+
 @app.on_event("startup")
 async def startup_event():
     global agent
@@ -44,10 +78,13 @@ async def startup_event():
     logger.info("Initializing AI agent...")
     
     try:
-        agent = AIAgent(openai_api_key=api_key, website_url=website_url)
+        if shared_kb is not None:
+            # Forked worker: HTTP and SQLite connections must not be shared with the master
+            shared_kb.after_fork()
+        agent = AIAgent(openai_api_key=api_key, website_url=website_url, kb=shared_kb)
         # Enriched KB already loaded in __init__, no need to scrape
         restaurant_count = len(agent.kb.get_all_restaurants())
-        logger.info("Agent initialized successfully", extra={"restaurant_count": restaurant_count})
+        logger.info("Agent initialized successfully", extra={"restaurant_count": restaurant_count, "index_stats": agent.kb.index_stats})
     except Exception as e:
         logger.error("Failed to initialize agent", extra={"error_type": type(e).__name__, "error_message": str(e)}, exc_info=True)
 
@@ -74,17 +111,24 @@ async def root_options():
     """HEAD and OPTIONS for monitoring"""
     return {"status": "ok"}
 
+def _poll_knowledge(background_tasks: BackgroundTasks):
+    """Pick up a knowledge file refreshed by another worker (or redeployed) after the response"""
+    if agent.knowledge_refresh_due():
+        background_tasks.add_task(agent.refresh_knowledge_from_web)
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(chat_message: ChatMessage):
+async def chat(chat_message: ChatMessage, background_tasks: BackgroundTasks):
     global agent
     
     if agent is None:
         raise HTTPException(status_code=503, detail="AI Agent not initialized")
     
+    _poll_knowledge(background_tasks)
+    
     try:
         conversation_id = chat_message.conversation_id or f"conv_{datetime.now().timestamp()}"
         
-        response_text = agent.chat(chat_message.message, conversation_id)
+        response_text = await agent.achat(chat_message.message, conversation_id)
         
         return ChatResponse(
             response=response_text,
@@ -94,6 +138,37 @@ async def chat(chat_message: ChatMessage):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(chat_message: ChatMessage, background_tasks: BackgroundTasks):
+    """Stream the answer as server-sent events (token, done, error)"""
+    global agent
+    
+    if agent is None:
+        raise HTTPException(status_code=503, detail="AI Agent not initialized")
+    
+    _poll_knowledge(background_tasks)
+    conversation_id = chat_message.conversation_id or f"conv_{datetime.now().timestamp()}"
+    
+    async def event_stream():
+        yield _sse_event("meta", {"conversation_id": conversation_id})
+        try:
+            async for event in agent.achat_stream(chat_message.message, conversation_id):
+                yield _sse_event(event["type"], event)
+        except Exception as e:
+            logger.error("Streaming chat failed", extra={"error_type": type(e).__name__}, exc_info=True)
+            yield _sse_event("error", {"type": "error", "content": "Désolé, une erreur est survenue. Veuillez réessayer."})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks
+    )
+
 @app.post("/refresh-knowledge")
 async def refresh_knowledge(background_tasks: BackgroundTasks):
     """Endpoint pour rafraîchir la KB manuellement"""
@@ -120,6 +195,11 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text format: stage/tool latency histograms, request and OpenAI token counters (per worker)"""
+    return PlainTextResponse(tracing.metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
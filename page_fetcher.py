@@ -0,0 +1,259 @@
+"""
+Page fetcher - pooled HTTP session, per-host concurrency, conditional GETs, persistent page cache
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def timed_parse(parse: Callable[[str, bytes], object], url: str, body: bytes) -> Tuple[object, float]:
+    """(parse result, CPU milliseconds spent) - measured in the process that parses"""
+    start = time.process_time()
+    data = parse(url, body)
+    return data, (time.process_time() - start) * 1000
+
+
+class PageCache:
+    """Last response per URL: validators, body hash, body and parsed results
+
+    Parsed results are stored per parser name so an unchanged page is never
+    parsed again; bumping a parser name (e.g. 'page:2') re-parses from the
+    cached body without downloading anything.
+    """
+
+    def __init__(self, db_path: Optional[str] = "page_cache.db"):
+        self.db_path = db_path
+        self._memory: Dict[str, Dict] = {}
+        self._parsed: Dict[tuple, tuple] = {}  # (url, parser) -> (content_hash, json text)
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL, "
+                "body BLOB NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parsed ("
+                "url TEXT NOT NULL, parser TEXT NOT NULL, content_hash TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (url, parser))"
+            )
+            self._db.commit()
+
+    def get(self, url: str) -> Optional[Dict]:
+        """{'etag', 'last_modified', 'content_hash', 'body'} of the last 200 response"""
+        with self._lock:
+            entry = self._memory.get(url)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT etag, last_modified, content_hash, body FROM pages WHERE url = ?", (url,)
+                ).fetchone()
+                if row is not None:
+                    entry = {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2],
+                             'body': zlib.decompress(row[3])}
+                    self._memory[url] = entry
+            return entry
+
+    def put(self, url: str, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        entry = {'etag': etag, 'last_modified': last_modified,
+                 'content_hash': hashlib.sha256(body).hexdigest(), 'body': body}
+        with self._lock:
+            self._memory[url] = entry
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, body, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, entry['content_hash'], zlib.compress(body), time.time())
+                )
+                self._db.commit()
+        return entry
+
+    def parsed(self, url: str, parser: str, content_hash: str):
+        """Parsed result for this exact body, None if never parsed"""
+        with self._lock:
+            entry = self._parsed.get((url, parser))
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT content_hash, data FROM parsed WHERE url = ? AND parser = ?", (url, parser)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._parsed[(url, parser)] = entry
+        if entry is None or entry[0] != content_hash:
+            return None
+        # Decoded on every call: callers may mutate what they get
+        return json.loads(entry[1])
+
+    def put_parsed(self, url: str, parser: str, content_hash: str, data):
+        text = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            self._parsed[(url, parser)] = (content_hash, text)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO parsed (url, parser, content_hash, data) VALUES (?, ?, ?, ?)",
+                    (url, parser, content_hash, text)
+                )
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class PageFetcher:
+    """Concurrent conditional GETs over one pooled Session
+
+    At most per_host requests run against the same host at once. Pages with
+    a cached copy are requested with If-None-Match / If-Modified-Since; a 304,
+    or a 200 whose body hash did not change, is reported as unchanged.
+    """
+
+    def __init__(self, cache: Optional[PageCache] = None, headers: Optional[Dict] = None,
+                 max_workers: int = 8, per_host: int = 4, timeout: float = 15,
+                 session: Optional[requests.Session] = None):
+        self.cache = cache if cache is not None else PageCache(None)
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.session = session or self._session(headers or {}, max_workers)
+        self._host_slots: Dict[str, threading.Semaphore] = {}
+        self._slots_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'fetched': 0, 'not_modified': 0, 'unchanged': 0, 'errors': 0, 'bytes': 0,
+                      'parsed': 0, 'parse_cpu_ms': 0.0}
+
+    @staticmethod
+    def _session(headers: Dict, pool_size: int) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _slot(self, url: str) -> threading.Semaphore:
+        host = urlparse(url).netloc
+        with self._slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.Semaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _count(self, key: str, size: int = 0):
+        with self._stats_lock:
+            self.stats[key] += 1
+            self.stats['bytes'] += size
+
+    def fetch(self, url: str) -> Dict:
+        """{'url', 'status', 'changed', 'body', 'content_hash'}
+
+        status is 'fetched', 'not_modified', 'unchanged' or 'error'. On error
+        the last cached body (if any) is returned with changed=False so a
+        transient failure does not drop a page from the knowledge base.
+        """
+        cached = self.cache.get(url)
+        conditional = {}
+        if cached and cached['etag']:
+            conditional['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            conditional['If-Modified-Since'] = cached['last_modified']
+
+        try:
+            with self._slot(url):
+                response = self.session.get(url, headers=conditional, timeout=self.timeout)
+            if response.status_code == 304 and cached:
+                self._count('not_modified')
+                return self._result(url, 'not_modified', cached)
+            response.raise_for_status()
+        except Exception as e:
+            self._count('errors')
+            result = self._result(url, 'error', cached)
+            result['error'] = str(e)
+            return result
+
+        body = response.content
+        entry = self.cache.put(url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        if cached and cached['content_hash'] == entry['content_hash']:
+            self._count('unchanged', len(body))
+            return self._result(url, 'unchanged', entry)
+        self._count('fetched', len(body))
+        return self._result(url, 'fetched', entry, changed=True)
+
+    @staticmethod
+    def _result(url: str, status: str, entry: Optional[Dict], changed: bool = False) -> Dict:
+        return {
+            'url': url,
+            'status': status,
+            'changed': changed,
+            'body': entry['body'] if entry else None,
+            'content_hash': entry['content_hash'] if entry else None
+        }
+
+    def fetch_all(self, urls: Iterable[str]) -> Dict[str, Dict]:
+        """fetch() for every URL concurrently, results in input order"""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            return dict(zip(urls, pool.map(self.fetch, urls)))
+
+    def fetch_parsed(self, urls: Iterable[str], parser: str,
+                     parse: Callable[[str, bytes], object], pool: Optional[Executor] = None) -> Dict[str, object]:
+        """Fetch URLs and parse only the bodies that changed
+
+        Unchanged pages reuse the result stored for `parser`. With a pool
+        (e.g. ProcessPoolExecutor) each page is handed over to parsing as soon
+        as it is fetched; `parse` must then be a picklable module-level
+        function. Pages that fail with no cached copy, or whose parse returns
+        None, are left out. Results keep the order of `urls`.
+        """
+        urls = list(dict.fromkeys(urls))
+        results = {}
+        parsing = {}  # url -> (content_hash, future)
+        if urls:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as fetch_pool:
+                for done in as_completed([fetch_pool.submit(self.fetch, url) for url in urls]):
+                    page = done.result()
+                    url = page['url']
+                    if page['status'] == 'error':
+                        print(f"  Erreur: {url} - {page['error']}")
+                    if page['body'] is None:
+                        continue
+                    data = self.cache.parsed(url, parser, page['content_hash'])
+                    if data is not None:
+                        results[url] = data
+                    elif pool is not None:
+                        parsing[url] = (page['content_hash'], pool.submit(timed_parse, parse, url, page['body']))
+                    else:
+                        self._store_parsed(results, url, parser, page['content_hash'], timed_parse(parse, url, page['body']))
+
+        for url, (content_hash, future) in parsing.items():
+            try:
+                outcome = future.result()
+            except Exception as e:
+                print(f"  Erreur parsing: {url} - {e}")
+                continue
+            self._store_parsed(results, url, parser, content_hash, outcome)
+        return {url: results[url] for url in urls if url in results}
+
+    def _store_parsed(self, results: Dict, url: str, parser: str, content_hash: str, outcome: Tuple[object, float]):
+        data, cpu_ms = outcome
+        with self._stats_lock:
+            self.stats['parsed'] += 1
+            self.stats['parse_cpu_ms'] += cpu_ms
+        if data is not None:
+            self.cache.put_parsed(url, parser, content_hash, data)
+            results[url] = data
+
+    def close(self):
+        self.session.close()
+        self.cache.close()
@@ -4,45 +4,101 @@ Recherche sémantique vectorielle sur la base de connaissances
 """
 
 import os
+import asyncio
+import copy
 import json
-import pickle
+import time
 import hashlib
-from typing import List, Dict, Tuple
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
 import numpy as np
 import faiss
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 
+from embedding_cache import EmbeddingCache
+from vector_store import VectorStore
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from text_utils import tokenize
+import tracing
+
 load_dotenv()
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+
+def reset_clients():
+    """Recrée les clients OpenAI (pool de connexions propre au processus après un fork)"""
+    global client, async_client
+    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
 
 class RAGEngine:
     """Moteur de recherche sémantique avec embeddings et FAISS"""
     
-    def __init__(self, knowledge_file: str = "bolkiri_knowledge_industrial_2025.json", force_rebuild: bool = False):
+    def __init__(self, knowledge_file: str = "bolkiri_knowledge_industrial_2025.json", force_rebuild: bool = False,
+                 data: Optional[Dict] = None):
+        """data : base déjà chargée par l'appelant (le même instantané que sa version), sinon lue dans knowledge_file"""
         self.knowledge_file = knowledge_file
         self.embedding_dim = 1536  # Dimension OpenAI embeddings text-embedding-ada-002
-        self.cache_file = "embeddings_cache.pkl"
+        
+        # Similarité cosinus minimale, et écart max au meilleur score (top-k adaptatif)
+        self.min_score = float(os.getenv('RAG_MIN_SCORE', '0.72'))
+        self.score_margin = float(os.getenv('RAG_SCORE_MARGIN', '0.08'))
+        # Fusion BM25 + vectoriel (désactivable pour revenir au dense seul)
+        self.hybrid = os.getenv('RAG_HYBRID', 'true').lower() == 'true'
+        self.retrieval_stats = {'lexical_only': 0, 'hybrid': 0, 'dense': 0}
+        
+        # Vecteurs des documents : fichier float32 mappé en mémoire + manifest de hashs
+        self.vector_store = VectorStore(
+            directory=os.getenv('VECTOR_STORE_DIR', 'vector_store'),
+            dim=self.embedding_dim
+        )
+        
+        # Cache des embeddings de requêtes (LRU + SQLite optionnel, vide = mémoire seule)
+        self.query_cache = EmbeddingCache(
+            max_size=int(os.getenv('EMBEDDING_CACHE_SIZE', '4096')),
+            db_path=os.getenv('EMBEDDING_CACHE_DB', 'query_embeddings.db') or None,
+            max_rows=int(os.getenv('EMBEDDING_CACHE_MAX_ROWS', '50000'))
+        )
         
         # Supprimer le cache si force_rebuild
-        if force_rebuild and os.path.exists(self.cache_file):
-            os.remove(self.cache_file)
-            print("Cache embeddings supprimé (force_rebuild=True)")
+        if force_rebuild:
+            self.vector_store.clear()
+            print("Vector store supprimé (force_rebuild=True)")
         
         # Chargement des données
-        self.data = self._load_knowledge()
+        self.data = data if data is not None else self._load_knowledge()
         self.documents = self._prepare_documents()
         
         # Index FAISS
         self.index = None
-        self.embeddings = None
+        self.index_stats = {}
         
         # Initialiser l'index
         self._build_or_load_index()
         
+        # Index lexical BM25 (noms de plats, téléphones, codes postaux)
+        self.lexical_index = LexicalIndex([doc['text'] for doc in self.documents])
+        
+        # Sous-ensembles d'IDs précalculés par type / catégorie / ville (filtres de search)
+        self.facets = self._build_facets()
+        self._filter_cache = OrderedDict()
+        self._filter_lock = threading.Lock()
+        
         print(f"RAG Engine ready: {len(self.documents)} documents indexes")
     
+    def after_fork(self):
+        """À appeler dans un worker forké depuis le master qui a construit l'index
+        
+        L'index FAISS, la matrice mémoire et les documents restent partagés en
+        copy-on-write ; seules les connexions (HTTP, SQLite) sont recréées.
+        """
+        reset_clients()
+        self.query_cache.reopen()
+    
     def _load_knowledge(self) -> Dict:
         """Charge la base de connaissances JSON"""
         with open(self.knowledge_file, 'r', encoding='utf-8') as f:
@@ -54,11 +110,12 @@ class RAGEngine:
         
         # 1. Documents depuis les pages scrapées
         pages_categorie = self.data.get('pages_par_categorie', {})
+        seen_ids = set()
         for category, pages in pages_categorie.items():
             for page in pages:
                 if page.get('content'):
                     documents.append({
-                        'id': f"page_{len(documents)}",
+                        'id': self._unique_id(self._page_id(category, page), seen_ids),
                         'type': 'page',
                         'category': category,
                         'title': page.get('title', ''),
@@ -105,7 +162,7 @@ class RAGEngine:
             text = '\n'.join([p for p in text_parts if p])
             
             documents.append({
-                'id': f"resto_{resto.get('name', len(documents))}",
+                'id': self._unique_id(f"resto_{resto.get('name', len(documents))}", seen_ids),
                 'type': 'restaurant',
                 'category': 'restaurant',
                 'title': name,
@@ -134,13 +191,64 @@ class RAGEngine:
         
         return documents
     
+    @staticmethod
+    def _page_id(category: str, page: Dict) -> str:
+        """ID stable d'une page (catégorie + URL + titre), indépendant de sa position
+        
+        Permet de comparer deux versions de la base document par document.
+        """
+        key = f"{page.get('url', '')}\n{page.get('title', '')}"
+        return f"page_{category}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+    
+    @staticmethod
+    def _unique_id(doc_id: str, seen_ids: set) -> str:
+        """Suffixe _2, _3... en cas de doublon (deux plats de même nom sur la carte)"""
+        suffix = 2
+        unique_id = doc_id
+        while unique_id in seen_ids:
+            unique_id = f"{doc_id}_{suffix}"
+            suffix += 1
+        seen_ids.add(unique_id)
+        return unique_id
+    
+    @staticmethod
+    def _embedding_text(doc: Dict) -> str:
+        return doc['text'][:8000]  # Limiter taille
+    
     def _get_embedding(self, text: str) -> np.ndarray:
-        """Génère un embedding OpenAI pour un texte"""
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        return np.array(response.data[0].embedding, dtype=np.float32)
+        """Génère un embedding OpenAI pour un texte (servi depuis le cache si déjà vu)"""
+        cached = self.query_cache.get(text)
+        if cached is not None:
+            return cached
+        
+        with tracing.span("embedding"):
+            response = client.embeddings.create(
+                input=text,
+                model="text-embedding-ada-002"
+            )
+        tracing.record_usage("embedding", getattr(response, 'usage', None))
+        embedding = np.array(response.data[0].embedding, dtype=np.float32)
+        self.query_cache.put(text, embedding)
+        return embedding
+    
+    async def _aget_embedding(self, text: str) -> np.ndarray:
+        """Génère un embedding OpenAI sans bloquer la boucle asyncio"""
+        cached = self.query_cache.get(text)
+        if cached is not None:
+            return cached
+        
+        with tracing.span("embedding"):
+            response = await async_client.embeddings.create(
+                input=text,
+                model="text-embedding-ada-002"
+            )
+        tracing.record_usage("embedding", getattr(response, 'usage', None))
+        embedding = np.array(response.data[0].embedding, dtype=np.float32)
+        # Écriture SQLite (commit) hors de la boucle asyncio
+        self.query_cache.put(text, embedding, autoflush=False)
+        if self.query_cache.flush_due():
+            await asyncio.to_thread(self.query_cache.flush)
+        return embedding
     
     def _get_embeddings_batch(self, texts: List[str]) -> np.ndarray:
         """Génère des embeddings pour plusieurs textes en batch"""
@@ -160,94 +268,339 @@ class RAGEngine:
         
         return np.array(embeddings)
     
-    def _get_cache_key(self) -> str:
-        """Génère une clé de cache basée sur le contenu JSON"""
-        with open(self.knowledge_file, 'rb') as f:
-            content = f.read()
-        return hashlib.md5(content).hexdigest()
+    def _get_document_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embeddings de documents normalisés L2, stockés tels quels dans le vector store"""
+        vectors = np.asarray(self._get_embeddings_batch(texts), dtype=np.float32).reshape(len(texts), -1)
+        faiss.normalize_L2(vectors)
+        return vectors
+    
+    @staticmethod
+    def _normalized(vectors: np.ndarray) -> np.ndarray:
+        """Vecteurs sans copie s'ils sont déjà normalisés (memmap en lecture seule)
+        
+        Les vector stores écrits avant la normalisation au stockage sont
+        normalisés dans une copie.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) and not np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-3):
+            vectors = np.array(vectors)
+            faiss.normalize_L2(vectors)
+        return vectors
     
     def _build_or_load_index(self):
-        """Construit l'index FAISS ou le charge depuis le cache"""
-        cache_key = self._get_cache_key()
-        
-        # Essayer de charger depuis le cache
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'rb') as f:
-                    cache_data = pickle.load(f)
-                
-                if cache_data.get('cache_key') == cache_key:
-                    print("Chargement embeddings depuis cache...")
-                    self.embeddings = cache_data['embeddings']
-                    self.index = faiss.deserialize_index(cache_data['index'])
-                    print(f"{len(self.documents)} embeddings charges depuis cache")
-                    return
-            except Exception as e:
-                print(f"Erreur chargement cache: {e}")
-        
-        # Construire l'index depuis zéro
-        print("Construction de l'index FAISS...")
-        
-        # Générer les embeddings
-        texts = [doc['text'][:8000] for doc in self.documents]  # Limiter taille
-        print(f"Génération de {len(texts)} embeddings...")
-        self.embeddings = self._get_embeddings_batch(texts)
-        
-        # Créer l'index FAISS
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        self.index.add(self.embeddings)
-        
-        # Sauvegarder dans le cache
-        cache_data = {
-            'cache_key': cache_key,
-            'embeddings': self.embeddings,
-            'index': faiss.serialize_index(self.index)
+        """Construit l'index FAISS à partir du vector store
+        
+        Chaque document est validé par le hash de son texte : l'index persistant
+        est réutilisé tel quel, seuls les documents nouveaux ou modifiés sont embeddés.
+        """
+        start = time.perf_counter()
+        texts = [self._embedding_text(doc) for doc in self.documents]
+        
+        vectors, stats = self.vector_store.sync(texts, self._get_document_embeddings)
+        
+        if stats['embedded'] == 0:
+            mode = 'reused'
+        elif stats['reused'] == 0:
+            mode = 'rebuilt'
+        else:
+            mode = 'incremental'
+        self.index_stats = {
+            'mode': mode,
+            'documents': len(self.documents),
+            'reused': stats['reused'],
+            'embedded': stats['embedded'],
+            'pruned': stats['pruned'],
+            'changed_ids': [self.documents[i]['id'] for i in stats['changed']],
+            'load_ms': 0.0
         }
-        with open(self.cache_file, 'wb') as f:
-            pickle.dump(cache_data, f)
+        print(f"Embeddings ({mode}): {stats['reused']} réutilisés, {stats['embedded']} générés, {stats['pruned']} purgés")
+        if stats['changed'] and mode == 'incremental':
+            print(f"  Documents modifiés: {', '.join(self.index_stats['changed_ids'][:10])}")
+        
+        # Index produit scalaire sur vecteurs normalisés = similarité cosinus.
+        # FAISS garde sa propre copie : la memmap n'est lue que le temps de l'ajout
+        vectors = self._normalized(vectors)
+        self.index = faiss.IndexFlatIP(self.embedding_dim)
+        if len(vectors):
+            self.index.add(vectors)
         
-        print(f"Index construit: {self.index.ntotal} vecteurs")
+        self.index_stats['load_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        print(f"Index construit: {self.index.ntotal} vecteurs en {self.index_stats['load_ms']} ms")
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+    def diff_documents(self, documents: List[Dict]) -> Dict[str, List[str]]:
+        """Compare des documents à ceux de l'index courant, par ID et hash du texte
+        
+        Returns:
+            {'added', 'removed', 'updated', 'unchanged'} : listes d'IDs
         """
-        Recherche sémantique dans la base de connaissances
+        current = {doc['id']: VectorStore.text_hash(self._embedding_text(doc)) for doc in self.documents}
+        diff = {'added': [], 'removed': [], 'updated': [], 'unchanged': []}
+        new_ids = set()
+        for doc in documents:
+            new_ids.add(doc['id'])
+            old_hash = current.get(doc['id'])
+            if old_hash is None:
+                diff['added'].append(doc['id'])
+            elif old_hash != VectorStore.text_hash(self._embedding_text(doc)):
+                diff['updated'].append(doc['id'])
+            else:
+                diff['unchanged'].append(doc['id'])
+        diff['removed'] = [doc_id for doc_id in current if doc_id not in new_ids]
+        return diff
+    
+    def updated(self, data: Dict) -> "RAGEngine":
+        """Nouveau moteur pour une nouvelle version de la base, sans reconstruction complète
+        
+        Les documents sont comparés par ID et hash du texte : seuls les ajoutés
+        et modifiés sont embeddés, les vecteurs inchangés sont recopiés depuis
+        l'index courant. Ce moteur n'est jamais modifié : les requêtes en cours
+        le lisent jusqu'à ce que l'appelant remplace sa référence par le nouveau.
+        """
+        start = time.perf_counter()
+        engine = copy.copy(self)
+        engine.data = data
+        engine.documents = engine._prepare_documents()
+        diff = self.diff_documents(engine.documents)
+        
+        old_rows = {doc['id']: row for row, doc in enumerate(self.documents)}
+        unchanged = set(diff['unchanged'])
+        kept = [pos for pos, doc in enumerate(engine.documents) if doc['id'] in unchanged]
+        changed = [pos for pos, doc in enumerate(engine.documents) if doc['id'] not in unchanged]
+        
+        # Vecteurs déjà normalisés de l'index courant pour les documents inchangés
+        embeddings = np.empty((len(engine.documents), self.embedding_dim), dtype=np.float32)
+        if kept:
+            rows = np.array([old_rows[engine.documents[pos]['id']] for pos in kept], dtype=np.int64)
+            embeddings[kept] = self.index.reconstruct_batch(rows)
+        stats = {'reused': 0, 'embedded': 0}
+        if changed:
+            texts = [self._embedding_text(engine.documents[pos]) for pos in changed]
+            vectors, stats = self.vector_store.ensure(texts, self._get_document_embeddings)
+            embeddings[changed] = self._normalized(vectors)
+        
+        engine.index = faiss.IndexFlatIP(self.embedding_dim)
+        if len(embeddings):
+            engine.index.add(embeddings)
+        engine.lexical_index = LexicalIndex([doc['text'] for doc in engine.documents])
+        engine.facets = engine._build_facets()
+        engine._filter_cache = OrderedDict()
+        engine._filter_lock = threading.Lock()
+        
+        engine.index_stats = {
+            'mode': 'incremental' if diff['added'] or diff['updated'] or diff['removed'] else 'reused',
+            'documents': len(engine.documents),
+            'reused': len(kept) + stats['reused'],
+            'embedded': stats['embedded'],
+            'pruned': 0,
+            'added': len(diff['added']),
+            'updated': len(diff['updated']),
+            'removed': len(diff['removed']),
+            'changed_ids': diff['added'] + diff['updated'],
+            'removed_ids': diff['removed'],
+            'load_ms': round((time.perf_counter() - start) * 1000, 1)
+        }
+        print(f"Mise à jour incrémentale: {len(diff['added'])} ajoutés, {len(diff['updated'])} modifiés, "
+              f"{len(diff['removed'])} supprimés, {stats['embedded']} embeddés en {engine.index_stats['load_ms']} ms")
+        return engine
+    
+    FILTER_FIELDS = ('type', 'category', 'ville')
+    # Combinaisons de filtres gardées (LRU)
+    FILTER_CACHE_SIZE = 256
+    
+    @staticmethod
+    def _facet_key(value) -> str:
+        """Valeur de filtre normalisée ('Ivry-sur-Seine' -> 'ivry sur seine')"""
+        return ' '.join(tokenize(str(value)))
+    
+    def _build_facets(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """IDs de documents par valeur de chaque champ filtrable"""
+        facets = {field: {} for field in self.FILTER_FIELDS}
+        for idx, doc in enumerate(self.documents):
+            for field in self.FILTER_FIELDS:
+                value = doc.get(field)
+                if value:
+                    facets[field].setdefault(self._facet_key(value), []).append(idx)
+        return {
+            field: {value: np.array(ids, dtype=np.int64) for value, ids in values.items()}
+            for field, values in facets.items()
+        }
+    
+    def _filter_ids(self, filters: Optional[Dict]) -> Optional[Tuple[np.ndarray, object]]:
+        """(IDs autorisés, sélecteur FAISS) pour des filtres, None si pas de filtre
+        
+        Plusieurs champs = intersection. Pour 'ville', 'Ivry' couvre 'Ivry-sur-Seine'
+        et inversement (comparaison par préfixe de mots).
+        
+        Le cache est indexé par les valeurs de facettes trouvées dans l'index, pas
+        par le texte saisi : une valeur inconnue n'y ajoute rien.
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v}
+        if not filters:
+            return None
+        
+        resolved = []
+        for field, value in sorted(filters.items()):
+            if field not in self.facets:
+                raise ValueError(f"Filtre inconnu: {field} (attendu: {', '.join(self.FILTER_FIELDS)})")
+            wanted = self._facet_key(value)
+            if field == 'ville':
+                values = tuple(sorted(
+                    known for known in self.facets[field]
+                    if known == wanted or known.startswith(wanted + ' ') or wanted.startswith(known + ' ')
+                ))
+            else:
+                values = (wanted,) if wanted in self.facets[field] else ()
+            if not values:
+                return np.array([], dtype=np.int64), None
+            resolved.append((field, values))
+        
+        cache_key = tuple(resolved)
+        with self._filter_lock:
+            cached = self._filter_cache.get(cache_key)
+            if cached is not None:
+                self._filter_cache.move_to_end(cache_key)
+                return cached
+        
+        allowed = None
+        for field, values in resolved:
+            ids = np.unique(np.concatenate([self.facets[field][value] for value in values]))
+            allowed = ids if allowed is None else np.intersect1d(allowed, ids)
+        
+        # Le sélecteur limite le calcul des distances FAISS au sous-ensemble
+        selector = faiss.IDSelectorBatch(allowed) if len(allowed) else None
+        with self._filter_lock:
+            self._filter_cache[cache_key] = (allowed, selector)
+            while len(self._filter_cache) > self.FILTER_CACHE_SIZE:
+                self._filter_cache.popitem(last=False)
+        return allowed, selector
+    
+    def search(self, query: str, top_k: int = 5, min_score: float = None, filters: Dict = None) -> List[Dict]:
+        """
+        Recherche hybride (BM25 + sémantique) dans la base de connaissances
         
         Args:
             query: Question de l'utilisateur
-            top_k: Nombre de résultats à retourner
+            top_k: Nombre maximal de résultats à retourner
+            min_score: Similarité cosinus minimale (défaut RAG_MIN_SCORE)
+            filters: Restriction par métadonnées, ex. {'type': 'restaurant', 'ville': 'Ivry'}
+                     (champs: type, category, ville)
         
         Returns:
-            Liste de documents pertinents avec scores
+            Liste de documents pertinents avec scores. Si le BM25 est décisif
+            (téléphone, code postal, nom exact), aucun embedding n'est calculé.
         """
+        subset = self._filter_ids(filters)
+        if subset is not None and not len(subset[0]):
+            return []
+        
+        with tracing.span("lexical"):
+            lexical_results = self._lexical_shortcut(query, subset)
+        if lexical_results:
+            return lexical_results
+        
         # Générer embedding de la query
         query_embedding = self._get_embedding(query)
-        query_vector = np.array([query_embedding])
-        
-        # Rechercher dans FAISS
-        distances, indices = self.index.search(query_vector, top_k)
-        
-        # Préparer les résultats
-        results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if idx < len(self.documents):
-                doc = self.documents[idx]
-                
-                # Score de similarité (inverse de la distance L2)
-                # Distance L2 plus petite = plus similaire
-                similarity_score = 1.0 / (1.0 + distance)
-                
-                results.append({
-                    'type': doc['type'],
-                    'category': doc['category'],
-                    'title': doc['title'],
-                    'content': doc['text'],
-                    'metadata': doc.get('metadata', {}),
-                    'score': float(similarity_score),
-                    'distance': float(distance),
-                    'data': doc
-                })
-        
-        return results
+        with tracing.span("retrieval"):
+            return self._hybrid_search(query, query_embedding, top_k, min_score, subset)
+    
+    async def asearch(self, query: str, top_k: int = 5, min_score: float = None, filters: Dict = None) -> List[Dict]:
+        """Variante asynchrone de search (embedding via AsyncOpenAI)"""
+        subset = self._filter_ids(filters)
+        if subset is not None and not len(subset[0]):
+            return []
+        
+        with tracing.span("lexical"):
+            lexical_results = self._lexical_shortcut(query, subset)
+        if lexical_results:
+            return lexical_results
+        
+        query_embedding = await self._aget_embedding(query)
+        with tracing.span("retrieval"):
+            return self._hybrid_search(query, query_embedding, top_k, min_score, subset)
+    
+    @staticmethod
+    def _allowed_set(subset) -> Optional[set]:
+        return set(subset[0].tolist()) if subset is not None else None
+    
+    def _lexical_shortcut(self, query: str, subset=None) -> List[Dict]:
+        """Résultat BM25 seul quand il suffit à répondre (évite l'appel embeddings)"""
+        if not self.hybrid:
+            return []
+        hits = self.lexical_index.decisive(query, self._allowed_set(subset))
+        if hits:
+            self.retrieval_stats['lexical_only'] += 1
+        return [self._result(idx, score, retrieval='lexical', bm25=score) for idx, score in hits]
+    
+    def _hybrid_search(self, query: str, query_embedding: np.ndarray, top_k: int, min_score: float = None, subset=None) -> List[Dict]:
+        """Fusionne classements FAISS et BM25 par Reciprocal Rank Fusion"""
+        dense = self._dense_ranking(query_embedding, top_k, min_score, subset)
+        if not self.hybrid:
+            self.retrieval_stats['dense'] += 1
+            return [self._result(idx, score, cosine=score) for idx, score in dense]
+        
+        self.retrieval_stats['hybrid'] += 1
+        lexical = self.lexical_index.search(query, top_k, self._allowed_set(subset))
+        if lexical:
+            # Même principe que le top-k adaptatif : pas de traîne lexicale
+            best_bm25 = lexical[0][1]
+            lexical = [(idx, score) for idx, score in lexical if score >= best_bm25 / 2]
+        
+        cosine = dict(dense)
+        bm25 = dict(lexical)
+        fused = reciprocal_rank_fusion([[idx for idx, _ in dense], [idx for idx, _ in lexical]])
+        return [
+            self._result(idx, score, retrieval='hybrid', cosine=cosine.get(idx), bm25=bm25.get(idx))
+            for idx, score in fused[:top_k]
+        ]
+    
+    def _dense_ranking(self, query_embedding: np.ndarray, top_k: int, min_score: float = None, subset=None) -> List[Tuple[int, float]]:
+        """Indices FAISS et scores cosinus, après seuil et top-k adaptatif"""
+        if min_score is None:
+            min_score = self.min_score
+        
+        query_vector = np.array([query_embedding], dtype=np.float32)
+        faiss.normalize_L2(query_vector)
+        
+        # Rechercher dans FAISS (scores = cosinus, triés par ordre décroissant)
+        with tracing.span("faiss"):
+            if subset is not None:
+                allowed, selector = subset
+                if selector is None:
+                    return []
+                params = faiss.SearchParameters(sel=selector)
+                scores, indices = self.index.search(query_vector, min(top_k, len(allowed)), params=params)
+            else:
+                scores, indices = self.index.search(query_vector, top_k)
+        
+        ranking = []
+        best_score = None
+        for idx, score in zip(indices[0], scores[0]):
+            if idx < 0 or idx >= len(self.documents) or score < min_score:
+                continue
+            if best_score is None:
+                best_score = score
+            elif score < best_score - self.score_margin:
+                # Décrochage par rapport au meilleur document : le reste est du bruit
+                break
+            ranking.append((int(idx), float(score)))
+        
+        return ranking
+    
+    def _result(self, idx: int, score: float, retrieval: str = 'dense', cosine: float = None, bm25: float = None) -> Dict:
+        """Formate un document indexé en résultat de recherche"""
+        doc = self.documents[idx]
+        return {
+            'type': doc['type'],
+            'category': doc['category'],
+            'title': doc['title'],
+            'content': doc['text'],
+            'metadata': doc.get('metadata', {}),
+            'score': float(score),
+            'cosine': cosine,
+            'bm25': bm25,
+            'retrieval': retrieval,
+            'data': doc
+        }
     
     def get_context_for_llm(self, query: str, max_context_length: int = 4000) -> str:
         """
@@ -310,5 +663,5 @@ if __name__ == "__main__":
         
         for i, result in enumerate(results, 1):
             print(f"\n{i}. [{result['type']}] {result['title']}")
-            print(f"   Score: {result['score']:.3f} | Distance: {result['distance']:.3f}")
+            print(f"   Score: {result['score']:.3f} ({result['retrieval']}) | Cosinus: {result['cosine']}")
             print(f"   {result['content'][:200]}...")
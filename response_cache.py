@@ -0,0 +1,191 @@
+"""
+Response cache - final answers to context-free questions, per KB version
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Set
+import numpy as np
+
+from text_utils import tokenize, STOPWORDS
+
+# Spellings of the same criterion ("végétariennes" and "végétarien" ask the same thing)
+ENTITY_SYNONYMS = {
+    'vegetarienne': 'vegetarien', 'vegetarian': 'vegetarien', 'vege': 'vegetarien', 'veggie': 'vegetarien',
+    'vegane': 'vegan', 'vegetalien': 'vegan', 'vegetalienne': 'vegan',
+    'epicee': 'epice', 'piquant': 'epice', 'spicy': 'epice',
+}
+# Diet criteria and Vietnamese dish words that change the answer even when the
+# menu does not list them ("pho ga" must not get the answer cached for "pho bo")
+MENU_ENTITY_WORDS = {'vegetarien', 'vegan', 'gluten', 'epice', 'pho', 'bo', 'ga', 'heo', 'tom', 'chay',
+                     'bun', 'banh', 'mi', 'bao', 'com', 'nem'}
+# Menu words too generic to tell two questions apart
+GENERIC_MENU_WORDS = {'plat', 'menu', 'carte', 'formule', 'entree', 'servi', 'base', 'sauce', 'choix', 'plu',
+                      'accompagnement', 'accompagement', 'protein', 'proteine'}
+
+
+def _entity_form(token: str) -> str:
+    token = ENTITY_SYNONYMS.get(token, token)
+    if len(token) > 3 and token.endswith('s'):
+        token = token[:-1]
+    return ENTITY_SYNONYMS.get(token, token)
+
+
+def menu_vocabulary(names: Iterable[str]) -> FrozenSet[str]:
+    """Entity forms of the words in dish names and categories, plus MENU_ENTITY_WORDS"""
+    vocabulary = set(MENU_ENTITY_WORDS)
+    for name in names:
+        for token in tokenize(name or ''):
+            form = _entity_form(token)
+            if len(form) > 1 and not token.isdigit() and token not in STOPWORDS and form not in GENERIC_MENU_WORDS:
+                vocabulary.add(form)
+    return frozenset(vocabulary)
+
+
+def menu_entities(text: str, vocabulary: FrozenSet[str]) -> Set[str]:
+    """Dishes, ingredients, categories and diet criteria text names ('menu:pho', 'menu:vegan'...)"""
+    return {f"menu:{form}" for form in map(_entity_form, tokenize(text)) if form in vocabulary}
+
+
+class ResponseCache:
+    """Bounded LRU of answers keyed by normalized question text
+
+    A question matches a cached one when their normalized text is equal or,
+    given an embedding, when cosine similarity reaches min_similarity and both
+    name the same entities (cities, numbers, menu_entities) - "horaires Ivry"
+    never serves the answer cached for "horaires Bondy", nor "prix du pho ga"
+    the one for "prix du pho bo". Entries expire after ttl_seconds
+    and the whole cache is dropped when the KB version changes.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 6 * 3600,
+                 min_similarity: float = 0.97, clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self.clock = clock
+        self.version = None
+        # key -> {'response', 'entities', 'embedding', 'created_at'}
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Accent/case/punctuation-insensitive key ('Horaires d'Ivry ?' -> 'horaires d ivry')"""
+        return ' '.join(tokenize(text))
+
+    def _check_version(self, version: str):
+        """Forget every answer built from another KB version (lock held)"""
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def _expired(self, entry: Dict) -> bool:
+        return self.ttl_seconds is not None and self.clock() - entry['created_at'] > self.ttl_seconds
+
+    def get(self, text: str, version: str, entities: FrozenSet[str] = frozenset(),
+            embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        key = self.normalize(text)
+        entities = entities | self._numbers(key)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['response']
+
+            if embedding is not None:
+                similar_key = self._most_similar(embedding, entities)
+                if similar_key is not None:
+                    self._entries.move_to_end(similar_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return self._entries[similar_key]['response']
+
+            self.misses += 1
+            return None
+
+    def has_semantic_candidates(self, text: str, version: str, entities: FrozenSet[str] = frozenset()) -> bool:
+        """True when a live entry with an embedding names the same entities
+
+        Lets the caller skip embedding a message that could not match anything.
+        """
+        key = self.normalize(text)
+        entities = entities | self._numbers(key)
+        with self._lock:
+            if version != self.version:
+                return False
+            return any(entry['embedding'] is not None and entry['entities'] == entities and not self._expired(entry)
+                       for entry in self._entries.values())
+
+    def _most_similar(self, embedding: np.ndarray, entities: FrozenSet[str]) -> Optional[str]:
+        """Closest live entry with the same entities above min_similarity (lock held)"""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        best_key, best_score = None, self.min_similarity
+        for key, entry in list(self._entries.items()):
+            if entry['embedding'] is None or entry['entities'] != entities:
+                continue
+            if self._expired(entry):
+                del self._entries[key]
+                continue
+            score = float(np.dot(entry['embedding'], query))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, text: str, version: str, response: str, entities: FrozenSet[str] = frozenset(),
+            embedding: Optional[np.ndarray] = None):
+        key = self.normalize(text)
+        if not key:
+            return
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = {
+                'response': response,
+                'entities': entities | self._numbers(key),
+                'embedding': embedding,
+                'created_at': self.clock()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def skip(self):
+        """Count a message answered without the cache (history-dependent)"""
+        with self._lock:
+            self.skipped += 1
+
+    @staticmethod
+    def _numbers(key: str) -> FrozenSet[str]:
+        return frozenset(token for token in key.split() if token.isdigit())
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'version': self.version,
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / total if total else 0.0
+        }
@@ -0,0 +1,183 @@
+"""
+Response validator - one compiled scan per text, checks against sets built from the context
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Assistant phrasings that deny having a restaurant somewhere
+NEGATIVE_PHRASES = (
+    "n'avons pas de restaurant",
+    "pas de restaurant dans",
+    "aucun restaurant dans",
+    "malheureusement pas",
+    "ne disposons pas",
+)
+# Denials that contradict a department the context has a restaurant in
+DEPARTMENT_DENIALS = ("pas de restaurant", "aucun restaurant")
+# A response price above this multiple of the highest context price is aberrant
+MAX_PRICE_RATIO = 2
+GENERIC_RESTAURANT_ANSWER = ("Oui, nous avons plusieurs restaurants en Île-de-France. Pour plus de détails "
+                             "sur un restaurant spécifique, précisez la ville ou le département.")
+NO_PRICE_NOTE = "\n\nPrix disponibles sur la carte en restaurant. Contactez-nous pour plus d'informations."
+
+_HOURS = r"(?P<hours>\b(?P<h1>\d{1,2})[h:](?P<m1>\d{2})?\s?[-–]\s?(?P<h2>\d{1,2})[h:](?P<m2>\d{2})?)"
+_PRICE = r"(?P<price>(?P<amount>\d+[,.]?\d*)\s*€)"
+_NUMBER = r"(?P<number>\b\d+\b)"
+
+_MARKDOWN = (
+    (re.compile(r'\*\*([^*]+)\*\*'), r'\1'),                               # **bold**
+    (re.compile(r'__([^_]+)__'), r'\1'),                                   # __bold__
+    (re.compile(r'(?<!\*)\*(?!\*)([^*]+)(?<!\*)\*(?!\*)'), r'\1'),         # *italic*
+    (re.compile(r'(?<!_)_(?!_)([^_]+)(?<!_)_(?!_)'), r'\1'),               # _italic_
+)
+
+
+def strip_markdown(text: str) -> str:
+    """Remove bold/italic markers the chat widget would show verbatim"""
+    for pattern, replacement in _MARKDOWN:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _alternation(name: str, words) -> str:
+    """Named group matching any of words (longest first so 'Ivry-sur-Seine' beats 'Ivry')"""
+    words = sorted({w for w in words if w}, key=len, reverse=True)
+    if not words:
+        return f"(?P<{name}>(?!))"
+    return f"(?P<{name}>" + "|".join(re.escape(w) for w in words) + ")"
+
+
+class ResponseValidator:
+    """Anti-hallucination checks on a generated answer, compiled once per KB version
+
+    Every text (response, context, user query) is read by a single finditer
+    over one alternation of hours, prices, negative phrases, cities,
+    department names and numbers. The checks then compare small sets.
+    """
+
+    def __init__(self, department_mapping: Dict[str, str]):
+        # Numeric department codes -> lowercased city of their restaurant
+        self.department_cities = {dept: ville.lower() for dept, ville in department_mapping.items() if dept.isdigit()}
+        self.department_names = {dept.lower() for dept in department_mapping if not dept.isdigit()}
+        words = (NEGATIVE_PHRASES + DEPARTMENT_DENIALS + ('restaurant',)
+                 + tuple(self.department_cities.values()) + tuple(self.department_names))
+        # Every token starts a word: positions that cannot start one are rejected by a single class test
+        first_chars = re.escape(''.join(sorted({w[0].lower() for w in words if w})))
+        self._scanner = re.compile(rf"\b(?=[\d{first_chars}])(?:" + "|".join([
+            _HOURS,
+            _PRICE,
+            _alternation('negative', NEGATIVE_PHRASES),
+            _alternation('denial', DEPARTMENT_DENIALS),
+            _alternation('city', self.department_cities.values()),
+            _alternation('department', self.department_names),
+            r"(?P<restaurant>restaurant)",
+            _NUMBER,
+        ]) + ")", re.IGNORECASE)
+
+    def scan(self, text: str) -> Dict:
+        """Hours, prices, phrases, cities and numbers mentioned in text, in one pass
+
+        Returns:
+            {'hours': [(raw, (h1, m1, h2, m2))], 'prices': [(raw, amount_raw, euros)],
+             'negative': [phrase], 'denial': bool, 'cities': set, 'departments': set,
+             'restaurant': bool, 'numbers': set}
+        """
+        found = {'hours': [], 'prices': [], 'negative': [], 'denial': False, 'cities': set(),
+                 'departments': set(), 'restaurant': False, 'numbers': set()}
+        for match in self._scanner.finditer(text):
+            kind = match.lastgroup
+            if kind == 'hours':
+                found['hours'].append((match.group('hours'), (
+                    int(match.group('h1')), int(match.group('m1') or 0),
+                    int(match.group('h2')), int(match.group('m2') or 0))))
+            elif kind == 'price':
+                amount = match.group('amount')
+                found['prices'].append((match.group('price'), amount, float(amount.replace(',', '.'))))
+            elif kind == 'negative':
+                phrase = match.group('negative').lower()
+                found['negative'].append(phrase)
+                # "pas de restaurant dans" is also a department denial
+                found['denial'] = found['denial'] or any(d in phrase for d in DEPARTMENT_DENIALS)
+                found['restaurant'] = found['restaurant'] or 'restaurant' in phrase
+            elif kind == 'denial':
+                found['denial'] = True
+                found['restaurant'] = True
+            elif kind == 'city':
+                found['cities'].add(match.group('city').lower())
+            elif kind == 'department':
+                found['departments'].add(match.group('department').lower())
+            elif kind == 'restaurant':
+                found['restaurant'] = True
+            elif kind == 'number':
+                found['numbers'].add(match.group('number'))
+        return found
+
+    def validate(self, response: str, context: str, user_query: str) -> Dict:
+        """Findings for response given the retrieved context
+
+        Returns:
+            {'valid': bool, 'response': str, 'findings': [dict]} - findings in
+            priority order (restaurant, hours, department, price), each with a
+            'check' key. 'response' carries the correction of the first hours
+            or price finding; restaurant and department findings name the
+            'department' to answer about (None when the query names none) and
+            leave the wording of the correction to the caller.
+        """
+        said = self.scan(response)
+        known = self.scan(context)
+        asked = self.scan(user_query)
+        asked_codes = sorted(asked['numbers'] & self.department_cities.keys())
+
+        findings = []
+        corrected = None
+
+        # 1. Denying a restaurant the context talks about
+        if known['restaurant'] and said['negative']:
+            department = asked_codes[0] if asked_codes else (user_query if asked['departments'] else None)
+            findings.append({'check': 'restaurant', 'phrase': said['negative'][0], 'department': department})
+
+        # 2. Opening hours absent from the context
+        context_hours = {hours for _, hours in known['hours']}
+        if context_hours and said['hours'] and not any(hours in context_hours for _, hours in said['hours']):
+            findings.append({'check': 'hours', 'context_hours': [raw for raw, _ in known['hours']],
+                             'response_hours': [raw for raw, _ in said['hours']]})
+            corrected = response
+            for raw, _ in said['hours']:
+                corrected = corrected.replace(raw, known['hours'][0][0])
+
+        # 3. "No restaurant" for a department whose city is in the context
+        if said['denial']:
+            for dept in asked_codes:
+                if self.department_cities[dept] in known['cities']:
+                    findings.append({'check': 'department', 'department': dept,
+                                     'ville': self.department_cities[dept]})
+                    break
+
+        # 4. Prices the context does not support
+        if said['prices']:
+            price_finding, price_corrected = self._check_prices(response, said['prices'], known['prices'])
+            if price_finding:
+                findings.append(price_finding)
+                corrected = corrected if corrected is not None else price_corrected
+
+        return {'valid': not findings, 'response': corrected if corrected is not None else response,
+                'findings': findings}
+
+    @staticmethod
+    def _check_prices(response: str, said: List[Tuple], known: List[Tuple]) -> Tuple[Optional[Dict], str]:
+        if not known:
+            corrected = response
+            for raw, _, _ in said:
+                corrected = corrected.replace(raw, '')
+            return ({'check': 'price', 'reason': 'no_context_price', 'response_prices': [a for _, a, _ in said]},
+                    (corrected + NO_PRICE_NOTE).strip())
+
+        context_max = max(euros for _, _, euros in known)
+        response_max = max(euros for _, _, euros in said)
+        if response_max <= context_max * MAX_PRICE_RATIO:
+            return None, response
+        corrected = response
+        for (wrong, _, _), (right, _, _) in zip(said, known):
+            corrected = corrected.replace(wrong, right)
+        return ({'check': 'price', 'reason': 'aberrant', 'context_max': context_max, 'response_max': response_max},
+                corrected)
@@ -0,0 +1,169 @@
+"""
+Structured restaurant lookup - city, slug, postal code, department and aliases
+"""
+import re
+from collections import defaultdict
+from typing import List, Dict, Optional, Set
+
+from text_utils import tokenize, STOPWORDS
+
+DEPARTMENT_NAMES = {
+    '59': 'nord',
+    '75': 'paris',
+    '77': 'seine-et-marne',
+    '78': 'yvelines',
+    '91': 'essonne',
+    '92': 'hauts-de-seine',
+    '93': 'seine-saint-denis',
+    '94': 'val-de-marne',
+    '95': "val-d'oise",
+}
+
+# Words that say nothing about the location ("restaurant bolkiri de Ivry")
+NOISE_WORDS = STOPWORDS | {'bolkiri', 'restaurant', 'restaurants', 'resto', 'restos',
+                           'street', 'food', 'viet', 'vietnamien', 'vietnamienne'}
+# Leading words too generic to be an alias on their own ("saint", "les")
+GENERIC_PREFIXES = {'saint', 'sainte', 'la', 'le', 'les', 'paris', 'lille'}
+
+_POSTAL_RE = re.compile(r'\b(\d{5})\b')
+
+
+def location_key(text: str) -> str:
+    """Accent/case-insensitive key without noise words ('Restaurant à Ivry-sur-Seine' -> 'ivry seine')"""
+    return ' '.join(token for token in tokenize(text) if token not in NOISE_WORDS)
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RestaurantIndex:
+    """Hash lookups from any way of naming a location to its restaurants
+
+    Built once from the restaurant list; exact keys are O(1), unknown
+    spellings fall back to trigram similarity over the known keys.
+    """
+
+    def __init__(self, restaurants: List[Dict], fuzzy_threshold: float = 0.45):
+        self.restaurants = restaurants
+        self.fuzzy_threshold = fuzzy_threshold
+        self.keys: Dict[str, List[int]] = defaultdict(list)  # key -> restaurant positions
+        self.departments: Dict[str, List[int]] = defaultdict(list)  # '94' -> positions
+        self.cities: List[str] = []
+        self.postal_codes: List[Optional[str]] = []
+
+        for position, resto in enumerate(restaurants):
+            city = self.city_from_name(resto.get('name', ''))
+            self.cities.append(city)
+            postal_match = _POSTAL_RE.search(resto.get('adresse', ''))
+            postal = postal_match.group(1) if postal_match else None
+            self.postal_codes.append(postal)
+
+            for alias in self._aliases(resto, city, postal):
+                if position not in self.keys[alias]:
+                    self.keys[alias].append(position)
+            if postal:
+                self.departments[postal[:2]].append(position)
+
+        # Department codes and names resolve to every restaurant of the department
+        for code, positions in self.departments.items():
+            self.keys.setdefault(code, list(positions))
+            if code in DEPARTMENT_NAMES:
+                self.keys.setdefault(location_key(DEPARTMENT_NAMES[code]), list(positions))
+
+        self._compact = {key.replace(' ', ''): key for key in self.keys}
+        self._key_trigrams = {key: _trigrams(key) for key in self.keys}
+        self._trigram_index: Dict[str, Set[str]] = defaultdict(set)
+        for key, grams in self._key_trigrams.items():
+            for gram in grams:
+                self._trigram_index[gram].add(key)
+
+    @staticmethod
+    def city_from_name(name: str) -> str:
+        """'BOLKIRI Ivry Street Food Viêt' -> 'Ivry'"""
+        return name.replace('BOLKIRI', '').replace('Street Food Viêt', '').strip()
+
+    @staticmethod
+    def _aliases(resto: Dict, city: str, postal: Optional[str]) -> Set[str]:
+        aliases = set()
+        localities = [city]
+
+        # Locality after the postal code ("94200 Ivry-sur-Seine")
+        locality = re.search(r'\b\d{5}\s+(.+)$', resto.get('adresse', ''))
+        if locality:
+            localities.append(locality.group(1))
+        # Slug of the restaurant page (".../paris-11-republique/")
+        slug = resto.get('url', '').rstrip('/').rsplit('/', 1)[-1]
+        if slug and not slug.startswith('http'):
+            localities.append(slug)
+        # Bracketed part of the name ("Saint-Denis (Pierrefitte)")
+        localities.extend(re.findall(r'\(([^)]+)\)', city))
+
+        for text in localities:
+            words = ' '.join(tokenize(text))
+            if not words:
+                continue
+            key = location_key(words)
+            aliases.add(key)
+            # Short forms: "lagny sur marne" -> "lagny", "la plaine saint denis" -> "plaine"
+            aliases.add(location_key(re.split(r' (?:sur|en|les|sous) ', words)[0]))
+            first = key.split()[0] if key else ''
+            if first not in GENERIC_PREFIXES and not first.isdigit():
+                aliases.add(first)
+
+        if postal:
+            aliases.add(postal)
+        return {alias for alias in aliases if alias}
+
+    def lookup(self, query: str) -> List[Dict]:
+        """All restaurants for a city, postal code, department code/name or alias"""
+        key = location_key(query)
+        if not key:
+            return []
+
+        positions = self.keys.get(key)
+        if positions is None and key.replace(' ', '') in self._compact:
+            positions = self.keys[self._compact[key.replace(' ', '')]]
+        if positions is None:
+            postal = _POSTAL_RE.search(key)
+            if postal:
+                # Postal code of a town without a restaurant: same department
+                positions = self.departments.get(postal.group(1)[:2])
+        if positions is None:
+            positions = self._fuzzy(key)
+        return [self.restaurants[p] for p in positions or []]
+
+    def find(self, query: str) -> Optional[Dict]:
+        """Best single restaurant for query (first in data order)"""
+        matches = self.lookup(query)
+        return matches[0] if matches else None
+
+    def _fuzzy(self, key: str) -> Optional[List[int]]:
+        """Closest known key by trigram Jaccard similarity (typos, missing words)"""
+        grams = _trigrams(key)
+        candidates = set()
+        for gram in grams:
+            candidates |= self._trigram_index.get(gram, set())
+        if not candidates:
+            return None
+
+        def similarity(candidate):
+            candidate_grams = self._key_trigrams[candidate]
+            return len(grams & candidate_grams) / len(grams | candidate_grams)
+
+        # Highest similarity, then shortest key, then alphabetical (deterministic)
+        best_score, _, best_key = min((-similarity(c), len(c), c) for c in candidates)
+        if -best_score < self.fuzzy_threshold:
+            return None
+        return self.keys[best_key]
+
+    def department_mapping(self) -> Dict[str, str]:
+        """Department code and name -> city of its first restaurant"""
+        mapping = {}
+        for code, positions in sorted(self.departments.items()):
+            city = self.cities[positions[0]]
+            mapping[code] = city
+            if code in DEPARTMENT_NAMES:
+                mapping[DEPARTMENT_NAMES[code]] = city
+        return mapping
@@ -1,11 +1,180 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import time
-from typing import List, Dict, Set
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Set
+import os
 import re
 from urllib.parse import urljoin, urlparse
 
+from geocoding import Gazetteer, GeocodeCache, Geocoder
+from html_extract import extract
+from page_fetcher import PageCache, PageFetcher
+
+# Parsed results are cached per parser name: bump the suffix when a parser changes
+PAGE_PARSER = "page:2"
+LINKS_PARSER = "links:2"
+RESTAURANT_PARSER = "restaurant:2"
+
+
+def clean_text(text: str) -> str:
+    """Clean extracted text"""
+    # Remove multiple spaces
+    text = re.sub(r'\s+', ' ', text)
+    # Remove empty lines
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    return '\n'.join(lines)
+
+
+def parse_opening_hours(specs: List[Dict]) -> Dict:
+    """Parse openingHoursSpecification from Schema.org
+    
+    This site uses validFrom/validThrough format without dayOfWeek.
+    We group identical time ranges.
+    """
+    if not specs:
+        return {}
+    
+    # Collect all unique time ranges
+    time_ranges = []
+    for spec in specs:
+        opens = spec.get('opens', '')
+        closes = spec.get('closes', '')
+        
+        if opens and closes:
+            time_range = f"{opens}-{closes}"
+            if time_range not in time_ranges:
+                time_ranges.append(time_range)
+    
+    # If we have time ranges, apply to all days
+    # (site doesn't specify individual days in openingHoursSpecification)
+    if time_ranges:
+        combined = ", ".join(time_ranges)
+        return {
+            "lundi": combined,
+            "mardi": combined,
+            "mercredi": combined,
+            "jeudi": combined,
+            "vendredi": combined,
+            "samedi": combined,
+            "dimanche": combined
+        }
+    
+    return {}
+
+
+# Page parsers: module-level and side-effect free so they can run in a process pool.
+# Each one reads the page through a single html_extract.extract traversal.
+
+def parse_page(url: str, html: bytes) -> Dict:
+    """Extract title, headings, main text and lists from a page"""
+    try:
+        page = extract(html)
+        return {
+            'url': url,
+            'title': page['title'],
+            'headings': page['headings'],
+            'content': clean_text(page['content'])[:5000],  # Limit to 5000 chars
+            'lists': page['lists'],
+            'scraped_at': time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+    except Exception as e:
+        print(f"  Erreur: {e}")
+        return None
+
+
+def parse_links(url: str, html: bytes) -> List[str]:
+    """Links of a page, absolute and normalized (no query string or fragment)"""
+    links = set()
+    for href in extract(html)['links']:
+        parsed = urlparse(urljoin(url, href))
+        links.add(f"{parsed.scheme}://{parsed.netloc}{parsed.path}")
+    return sorted(links)
+
+
+def _restaurant_json_ld(scripts: List[str]) -> Optional[Dict]:
+    """First Schema.org Restaurant object of the page's JSON-LD blocks"""
+    for script in scripts:
+        try:
+            data = json.loads(script)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if isinstance(data, dict):
+            if '@graph' in data:
+                for item in data['@graph']:
+                    if isinstance(item, dict) and item.get('@type') == 'Restaurant':
+                        return item
+            elif data.get('@type') == 'Restaurant':
+                return data
+    return None
+
+
+def parse_restaurant(url: str, html: bytes) -> Dict:
+    """Restaurant data from a restaurant page (JSON-LD, HTML fallback)
+    
+    'coordinates' is left empty: geocoding needs the network and the
+    geocode cache, so the scraper fills it in after parsing.
+    """
+    try:
+        page = extract(html)
+        json_ld_data = _restaurant_json_ld(page['json_ld'])
+        page_text = page['text']
+        
+        # Status
+        statut = "ouvert"
+        if "prochaine" in page_text.lower():
+            statut = "ouverture_prochaine"
+        
+        # If no JSON-LD, fallback on HTML extraction
+        if not json_ld_data:
+            # Extract phone
+            telephone = ""
+            tel_match = re.search(r'\+33\s?\d{1}\s?\d{2}\s?\d{2}\s?\d{2}\s?\d{2}', page_text)
+            if tel_match:
+                telephone = tel_match.group(0)
+            
+            # Extract address
+            adresse = next(
+                (string for string in page['strings'] if re.search(r'\d+.*(?:Rue|Avenue|Boulevard|Place)', string)),
+                ""
+            )
+            
+            return {
+                "name": page['h1'],
+                "telephone": telephone,
+                "adresse": adresse,
+                "statut": statut,
+                "url": url
+            }
+        
+        # Extract from JSON-LD
+        name = json_ld_data.get('name', '')
+        telephone = json_ld_data.get('telephone', '')
+        
+        # Extract structured address
+        address_data = json_ld_data.get('address', {})
+        adresse = f"{address_data.get('streetAddress', '')}, {address_data.get('postalCode', '')} {address_data.get('addressLocality', '')}"
+        
+        # Extract and parse hours from openingHoursSpecification
+        horaires = {}
+        if 'openingHoursSpecification' in json_ld_data:
+            horaires = parse_opening_hours(json_ld_data['openingHoursSpecification'])
+        
+        return {
+            "name": name,
+            "telephone": telephone,
+            "adresse": adresse,
+            "horaires": horaires,
+            "statut": statut,
+            "url": url,
+            "coordinates": None,
+            "description": f"Restaurant {name}\nAdresse: {adresse}\nTéléphone: {telephone}\n\nPour réserver ou commander: <a href=\"{url}\" target=\"_blank\">Page du restaurant</a>"
+        }
+        
+    except Exception as e:
+        print(f"    Erreur: {e}")
+        return None
+
+
 class BolkiriIndustrialScraper:
     """Complete industrial scraper - Automatically scrapes ALL relevant pages"""
     
@@ -18,7 +187,21 @@ class BolkiriIndustrialScraper:
         self.all_pages_content = {}
         self.restaurants = []
         self.menu = []
-        self.geocoding_cache = {}  # Cache for Nominatim API calls
+        # Nominatim results, persisted and shared with find_nearest_restaurant
+        self.geocoding_cache = GeocodeCache(os.getenv('GEOCODE_CACHE_DB', 'geocode_cache.db') or None)
+        # Rate-limited Nominatim calls with a timeout; no gazetteer, whose postal
+        # codes would place a street address at the centre of its commune
+        self.geocoder = Geocoder(Gazetteer([]), self.geocoding_cache)
+        # Pooled, concurrent conditional GETs; unchanged pages are neither downloaded nor re-parsed
+        self.fetcher = PageFetcher(
+            PageCache(os.getenv('PAGE_CACHE_DB', 'page_cache.db') or None),
+            headers=self.headers,
+            max_workers=int(os.getenv('SCRAPER_CONCURRENCY', '8')),
+            per_host=int(os.getenv('SCRAPER_HOST_CONCURRENCY', '4'))
+        )
+        # HTML parsing runs in worker processes during scrape_all_content (0 = calling thread)
+        self.parse_workers = int(os.getenv('SCRAPER_PARSE_WORKERS', str(os.cpu_count() or 1)))
+        self.parse_pool = None
         
         # Priority pages to scrape
         self.priority_pages = [
@@ -61,122 +244,65 @@ class BolkiriIndustrialScraper:
     
     def clean_text(self, text: str) -> str:
         """Clean extracted text"""
-        # Remove multiple spaces
-        text = re.sub(r'\s+', ' ', text)
-        # Remove empty lines
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        return '\n'.join(lines)
+        return clean_text(text)
     
     def scrape_page(self, url: str) -> Dict:
         """Scrape complete page and extract content"""
-        try:
-            print(f"Scraping: {url}")
-            response = requests.get(url, headers=self.headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove unnecessary elements
-            for element in soup(['script', 'style', 'nav', 'footer', 'iframe', 'noscript']):
-                element.decompose()
-            
-            # Extract title
-            title = soup.find('title')
-            title_text = title.get_text(strip=True) if title else ""
-            
-            # Extract headings (structure)
-            headings = []
-            for tag in ['h1', 'h2', 'h3']:
-                for heading in soup.find_all(tag):
-                    text = heading.get_text(strip=True)
-                    if text and len(text) > 2:
-                        headings.append({
-                            'level': tag,
-                            'text': text
-                        })
-            
-            # Extract main content
-            main_content = soup.find('main') or soup.find('article') or soup.find('body')
-            text_content = main_content.get_text(separator='\n', strip=True) if main_content else ""
-            text_content = self.clean_text(text_content)
-            
-            # Extract lists (FAQ, key points)
-            lists = []
-            for ul in soup.find_all(['ul', 'ol']):
-                items = [li.get_text(strip=True) for li in ul.find_all('li')]
-                if items:
-                    lists.append(items)
-            
-            self.visited_urls.add(url)
-            
-            return {
-                'url': url,
-                'title': title_text,
-                'headings': headings,
-                'content': text_content[:5000],  # Limit to 5000 chars
-                'lists': lists,
-                'scraped_at': time.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            
-        except Exception as e:
-            print(f"  Erreur: {e}")
-            return None
+        print(f"Scraping: {url}")
+        return self.scrape_pages([url]).get(url)
+    
+    def scrape_pages(self, urls: List[str]) -> Dict[str, Dict]:
+        """Scrape pages concurrently (only changed pages are parsed again)"""
+        pages = self.fetcher.fetch_parsed(urls, PAGE_PARSER, parse_page, self.parse_pool)
+        self.visited_urls.update(pages)
+        return pages
     
     def discover_pages(self, start_url: str) -> List[str]:
         """Automatically discover all site pages"""
-        discovered_urls = set()
-        
         try:
-            response = requests.get(start_url, headers=self.headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find all links
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                full_url = urljoin(self.base_url, href)
-                
-                # Normalize URL
-                parsed = urlparse(full_url)
-                normalized_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-                
-                if self.should_scrape_url(normalized_url):
-                    discovered_urls.add(normalized_url)
-        
+            links = self.fetcher.fetch_parsed([start_url], LINKS_PARSER, parse_links).get(start_url, [])
         except Exception as e:
             print(f"Erreur découverte pages: {e}")
+            return []
         
-        return list(discovered_urls)
+        return [url for url in links if self.should_scrape_url(url)]
     
     def scrape_all_content(self):
         """Scrape all relevant site content"""
         print("\n" + "=" * 60)
         print("COMPLETE INDUSTRIAL SCRAPING")
         print("=" * 60)
+        started = time.monotonic()
+        if self.parse_workers > 0:
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
         
-        # 1. Scrape priority pages
-        print("\n[1/3] Priority pages...")
-        for page_path in self.priority_pages:
-            url = self.base_url + page_path
-            page_data = self.scrape_page(url)
-            if page_data:
-                self.all_pages_content[url] = page_data
-            time.sleep(0.5)
-        
-        # 2. Discover and scrape other pages
-        print("\n[2/3] Automatic discovery...")
-        discovered = self.discover_pages(self.base_url)
-        print(f"  {len(discovered)} pages discovered")
-        
-        for url in discovered[:20]:  # Limit to 20 discovered pages
-            if url not in self.all_pages_content:
-                page_data = self.scrape_page(url)
-                if page_data:
-                    self.all_pages_content[url] = page_data
-                time.sleep(0.5)
+        try:
+            # 1. Scrape priority pages
+            print("\n[1/3] Priority pages...")
+            self.all_pages_content.update(self.scrape_pages([self.base_url + path for path in self.priority_pages]))
+            
+            # 2. Discover and scrape other pages
+            print("\n[2/3] Automatic discovery...")
+            discovered = self.discover_pages(self.base_url)
+            print(f"  {len(discovered)} pages discovered")
+            
+            new_urls = [url for url in discovered[:20] if url not in self.all_pages_content]  # Limit to 20 discovered pages
+            self.all_pages_content.update(self.scrape_pages(new_urls))
+            
+            # 3. Scrape restaurants (hardcoded list for reliability)
+            print("\n[3/3] Detailed restaurants...")
+            self.scrape_restaurants()
+        finally:
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown()
+                self.parse_pool = None
         
-        # 3. Scrape restaurants (hardcoded list for reliability)
-        print("\n[3/3] Detailed restaurants...")
-        self.scrape_restaurants()
+        stats = self.fetcher.stats
+        print(f"\n  HTTP: {stats['fetched']} changed, {stats['not_modified'] + stats['unchanged']} unchanged, "
+              f"{stats['errors']} errors, {stats['bytes'] // 1024} KB in {time.monotonic() - started:.1f}s")
+        if stats['parsed']:
+            print(f"  Parsing: {stats['parsed']} pages, {stats['parse_cpu_ms'] / stats['parsed']:.1f} ms CPU/page "
+                  f"({self.parse_workers or 'no'} worker processes)")
     
     def scrape_restaurants(self):
         """Scrape tous les restaurants"""
@@ -203,12 +329,12 @@ class BolkiriIndustrialScraper:
             "https://restaurants.bolkiri.fr/street-food-vietnamienne/lille-gare-flandres/"
         ]
         
+        restaurants = self.fetcher.fetch_parsed(restaurant_urls, RESTAURANT_PARSER, parse_restaurant, self.parse_pool)
         for idx, url in enumerate(restaurant_urls, 1):
-            print(f"  [{idx}/{len(restaurant_urls)}] {url}")
-            resto_data = self.extract_restaurant_data(url)
+            resto_data = restaurants.get(url)
+            print(f"  [{idx}/{len(restaurant_urls)}] {url}{'' if resto_data else ' - ignoré'}")
             if resto_data:
-                self.restaurants.append(resto_data)
-            time.sleep(0.5)
+                self.restaurants.append(self._with_coordinates(resto_data))
     
     def parse_menu_into_dishes(self, menu_content: str) -> List[Dict]:
         """Parse menu content to extract each dish individually"""
@@ -287,172 +413,29 @@ class BolkiriIndustrialScraper:
     
     def extract_restaurant_data(self, url: str) -> Dict:
         """Extract structured restaurant data from JSON-LD Schema.org"""
-        try:
-            response = requests.get(url, headers=self.headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract JSON-LD structured data
-            json_ld_data = None
-            scripts = soup.find_all('script', type='application/ld+json')
-            
-            for script in scripts:
-                try:
-                    data = json.loads(script.string)
-                    if isinstance(data, dict):
-                        if '@graph' in data:
-                            for item in data['@graph']:
-                                if item.get('@type') == 'Restaurant':
-                                    json_ld_data = item
-                                    break
-                        elif data.get('@type') == 'Restaurant':
-                            json_ld_data = data
-                            
-                    if json_ld_data:
-                        break
-                except (json.JSONDecodeError, KeyError):
-                    continue
-            
-            # If no JSON-LD, fallback on HTML extraction
-            if not json_ld_data:
-                page_text = soup.get_text()
-                h1 = soup.find('h1')
-                
-                # Extract phone
-                telephone = ""
-                tel_pattern = r'\+33\s?\d{1}\s?\d{2}\s?\d{2}\s?\d{2}\s?\d{2}'
-                tel_match = re.search(tel_pattern, page_text)
-                if tel_match:
-                    telephone = tel_match.group(0)
-                
-                # Extract address
-                adresse = ""
-                for string in soup.stripped_strings:
-                    if re.search(r'\d+.*(?:Rue|Avenue|Boulevard|Place)', string):
-                        adresse = string
-                        break
-                
-                # Status
-                statut = "ouvert"
-                if "prochaine" in page_text.lower():
-                    statut = "ouverture_prochaine"
-                
-                return {
-                    "name": h1.get_text(strip=True) if h1 else "",
-                    "telephone": telephone,
-                    "adresse": adresse,
-                    "statut": statut,
-                    "url": url
-                }
-            
-            # Extract from JSON-LD
-            name = json_ld_data.get('name', '')
-            telephone = json_ld_data.get('telephone', '')
-            
-            # Extract structured address
-            address_data = json_ld_data.get('address', {})
-            adresse = f"{address_data.get('streetAddress', '')}, {address_data.get('postalCode', '')} {address_data.get('addressLocality', '')}"
-            
-            # Extract and parse hours from openingHoursSpecification
-            horaires = {}
-            if 'openingHoursSpecification' in json_ld_data:
-                horaires = self.parse_opening_hours(json_ld_data['openingHoursSpecification'])
-            
-            # Status
-            page_text = soup.get_text()
-            statut = "ouvert"
-            if "prochaine" in page_text.lower():
-                statut = "ouverture_prochaine"
-            
-            # Get coordinates
-            coordinates = self.geocode_address(adresse)
-            
-            restaurant_data = {
-                "name": name,
-                "telephone": telephone,
-                "adresse": adresse,
-                "horaires": horaires,
-                "statut": statut,
-                "url": url,
-                "coordinates": coordinates,
-                "description": f"Restaurant {name}\nAdresse: {adresse}\nTéléphone: {telephone}\n\nPour réserver ou commander: <a href=\"{url}\" target=\"_blank\">Page du restaurant</a>"
-            }
-            
-            return restaurant_data
-            
-        except Exception as e:
-            print(f"    Erreur: {e}")
-            return None
+        resto_data = self.fetcher.fetch_parsed([url], RESTAURANT_PARSER, parse_restaurant).get(url)
+        return self._with_coordinates(resto_data) if resto_data else None
+    
+    def _with_coordinates(self, resto_data: Dict) -> Dict:
+        """Geocode a parsed restaurant (JSON-LD pages only, geocode cache first)"""
+        if 'coordinates' in resto_data and not resto_data['coordinates']:
+            resto_data['coordinates'] = self.geocode_address(resto_data['adresse'])
+        return resto_data
     
     def geocode_address(self, address: str) -> Dict:
-        """Get coordinates from address using Nominatim (OpenStreetMap)"""
-        if address in self.geocoding_cache:
-            return self.geocoding_cache[address]
-        
+        """Get coordinates from address using Nominatim (OpenStreetMap), geocode cache first"""
         try:
             # Clean address for better results
-            clean_address = address.replace('\n', ', ').strip()
-            url = f"https://nominatim.openstreetmap.org/search"
-            params = {
-                'q': clean_address,
-                'format': 'json',
-                'limit': 1,
-                'countrycodes': 'fr'  # France only
-            }
-            
-            response = requests.get(url, params=params, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data:
-                coords = {
-                    'lat': float(data[0]['lat']),
-                    'lon': float(data[0]['lon'])
-                }
-                self.geocoding_cache[address] = coords
-                time.sleep(1)  # Nominatim rate limit: 1 req/sec
-                return coords
-            
+            coords = self.geocoder.geocode(address.replace('\n', ', ').strip())
         except Exception as e:
             print(f"    Geocoding error: {e}")
+            return None
         
-        return None
+        return {'lat': coords['lat'], 'lon': coords['lon']} if coords else None
     
     def parse_opening_hours(self, specs: List[Dict]) -> Dict:
-        """Parse openingHoursSpecification from Schema.org
-        
-        This site uses validFrom/validThrough format without dayOfWeek.
-        We group identical time ranges.
-        """
-        if not specs:
-            return {}
-        
-        # Collect all unique time ranges
-        time_ranges = []
-        for spec in specs:
-            opens = spec.get('opens', '')
-            closes = spec.get('closes', '')
-            
-            if opens and closes:
-                time_range = f"{opens}-{closes}"
-                if time_range not in time_ranges:
-                    time_ranges.append(time_range)
-        
-        # If we have time ranges, apply to all days
-        # (site doesn't specify individual days in openingHoursSpecification)
-        if time_ranges:
-            combined = ", ".join(time_ranges)
-            return {
-                "lundi": combined,
-                "mardi": combined,
-                "mercredi": combined,
-                "jeudi": combined,
-                "vendredi": combined,
-                "samedi": combined,
-                "dimanche": combined
-            }
-        
-        return {}
+        """Parse openingHoursSpecification from Schema.org"""
+        return parse_opening_hours(specs)
     
     def save_complete_knowledge_base(self):
         """Save complete knowledge base"""
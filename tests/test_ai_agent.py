@@ -1,7 +1,10 @@
 import pytest
 import os
-from unittest.mock import Mock, patch, MagicMock
+import asyncio
+import numpy as np
+from unittest.mock import Mock, patch, MagicMock, AsyncMock
 from ai_agent import AIAgent
+from kb_views import KBViews
 
 
 @pytest.fixture
@@ -29,13 +32,18 @@ def mock_kb():
         kb_instance.get_full_menu.return_value = [
             {"nom": "Pho Bo", "prix": "12.90", "categorie": "soupes"}
         ]
+        kb_instance.get_department_mapping.return_value = {"91": "Corbeil-Essonnes", "essonne": "Corbeil-Essonnes"}
+        kb_instance.get_all_cities.return_value = ["Corbeil-Essonnes"]
+        kb_instance.lookup_restaurants.return_value = []
+        kb_instance.views = KBViews("test")
+        kb_instance.version = "test"
         yield kb_instance
 
 
 @pytest.fixture
 def agent(mock_openai_key, mock_kb):
     """Create AIAgent instance with mocked dependencies"""
-    with patch('ai_agent.OpenAI'):
+    with patch('ai_agent.OpenAI'), patch('ai_agent.AsyncOpenAI'):
         agent = AIAgent(
             openai_api_key=mock_openai_key,
             website_url="https://bolkiri.fr"
@@ -54,6 +62,103 @@ class TestAIAgentInitialization:
         assert len(agent.tools) == 9
         assert agent.greeting_message is not None
     
+    def test_preloaded_kb_is_shared(self, mock_openai_key):
+        """Workers forked from a preloading master reuse its KB instead of building one"""
+        shared_kb = Mock()
+        with patch('ai_agent.OpenAI'), patch('ai_agent.AsyncOpenAI'), \
+             patch('ai_agent.EnrichedKnowledgeBase') as kb_class:
+            agent = AIAgent(openai_api_key=mock_openai_key, website_url="https://bolkiri.fr", kb=shared_kb)
+        
+        assert agent.kb is shared_kb
+        kb_class.assert_not_called()
+    
+    def test_refresh_swaps_incrementally_built_kb(self, agent):
+        """The live KB builds its successor; the agent swaps the reference once"""
+        old_kb = agent.kb
+        new_kb = Mock(index_stats={'mode': 'incremental'})
+        new_kb.get_all_restaurants.return_value = []
+        new_kb.get_all_menu_items.return_value = []
+        old_kb.refreshed.return_value = new_kb
+        
+        assert agent.refresh_knowledge_from_web() is True
+        assert agent.kb is new_kb
+        assert agent.agent_state['last_update'] is not None
+    
+    def test_refresh_unchanged_keeps_kb(self, agent):
+        old_kb = agent.kb
+        old_kb.refreshed.return_value = old_kb
+        
+        assert agent.refresh_knowledge_from_web() is True
+        assert agent.kb is old_kb
+        assert agent.agent_state['last_update'] is None
+    
+    def test_knowledge_poll_throttled(self, agent):
+        """One stat per KB_POLL_SECONDS at most; due only when the file changed"""
+        agent.kb.knowledge_file_changed.return_value = True
+        with patch('ai_agent.KB_POLL_SECONDS', 30):
+            assert agent.knowledge_refresh_due() is False
+            agent._kb_polled_at -= 31
+            assert agent.knowledge_refresh_due() is True
+            assert agent.knowledge_refresh_due() is False
+        assert agent.kb.knowledge_file_changed.call_count == 1
+    
+    def test_knowledge_poll_skipped_while_refreshing(self, agent):
+        agent.kb.knowledge_file_changed.return_value = True
+        agent._kb_polled_at -= 3600
+        with agent._refresh_lock:
+            assert agent.knowledge_refresh_due() is False
+    
+    def test_knowledge_file_change_detected_from_same_bytes(self, tmp_path):
+        from knowledge_base_enriched import EnrichedKnowledgeBase
+        kb = EnrichedKnowledgeBase.__new__(EnrichedKnowledgeBase)
+        kb.complete_file = str(tmp_path / "kb.json")
+        with open(kb.complete_file, 'w', encoding='utf-8') as f:
+            f.write('{"restaurants": []}')
+        kb._file_stat = kb._knowledge_stat()
+        raw = kb._read_knowledge_file()
+        kb.version = kb._knowledge_version(raw)
+        
+        assert kb._load_complete_knowledge(raw) == {"restaurants": []}
+        assert kb.knowledge_file_changed() is False
+        
+        # Rewritten with identical content: same KB, and the new stat is remembered
+        os.utime(kb.complete_file, ns=(0, 0))
+        assert kb.knowledge_file_changed() is True
+        assert kb.refreshed() is kb
+        assert kb.knowledge_file_changed() is False
+    
+    def test_rag_engine_built_from_hashed_bytes(self, tmp_path, monkeypatch):
+        """Version, KB data and RAG index all come from one read of the knowledge file"""
+        from knowledge_base_enriched import EnrichedKnowledgeBase
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv('GEOCODE_CACHE_DB', '')
+        with open("bolkiri_knowledge_industrial_2025.json", 'w', encoding='utf-8') as f:
+            f.write('{"restaurants": []}')
+        
+        with patch('knowledge_base_enriched.RAGEngine') as engine_class:
+            kb = EnrichedKnowledgeBase()
+        
+        assert engine_class.call_args.kwargs['data'] is kb.data
+    
+    def test_refresh_reindexes_the_snapshot_it_versions(self, tmp_path, monkeypatch):
+        """Change detection, KB data and incremental re-indexing share one read of the file"""
+        from knowledge_base_enriched import EnrichedKnowledgeBase
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv('GEOCODE_CACHE_DB', '')
+        path = tmp_path / "bolkiri_knowledge_industrial_2025.json"
+        path.write_text('{"restaurants": []}', encoding='utf-8')
+        with patch('knowledge_base_enriched.RAGEngine') as engine_class:
+            kb = EnrichedKnowledgeBase()
+        
+        path.write_text('{"restaurants": [{"name": "Bolkiri Bondy", "ville": "Bondy"}]}', encoding='utf-8')
+        new_kb = kb.refreshed()
+        
+        engine = engine_class.return_value
+        assert engine.updated.call_args.args[0] is new_kb.data
+        assert new_kb.data['restaurants'][0]['name'] == "Bolkiri Bondy"
+        assert new_kb.version == kb._knowledge_version(path.read_bytes())
+        assert new_kb.knowledge_file_changed() is False
+    
     def test_tools_defined(self, agent):
         """All 9 required tools are defined"""
         tool_names = [tool['name'] for tool in agent.tools]
@@ -113,6 +218,18 @@ class TestToolExecution:
         assert "123 Rue Test" in result
         assert "livraison" in result
     
+    def test_get_restaurants_formatted_once(self, agent, mock_kb):
+        """The restaurant list is a derived view, not rebuilt on every call"""
+        mock_kb.get_all_restaurants.return_value = [
+            {"name": "Bolkiri Ivry", "adresse": "Avenue Maurice Thorez", "telephone": "01 80 91 18 38"}
+        ]
+        
+        first = agent.get_restaurants()
+        second = agent.get_restaurants()
+        
+        assert first is second
+        mock_kb.get_all_restaurants.assert_called_once()
+    
     def test_get_menu(self, agent, mock_kb):
         """get_menu returns full menu"""
         mock_kb.get_all_menu_items.return_value = [
@@ -126,18 +243,18 @@ class TestToolExecution:
         assert isinstance(result, str)
     
     def test_filter_menu_vegetarian(self, agent, mock_kb):
-        """filter_menu handles vegetarian criteria"""
-        mock_kb.search.return_value = [
-            {
-                "nom": "Rouleaux Végétariens",
-                "prix": "8.50",
-                "data": {"nom": "Rouleaux Végétariens", "prix": "8.50"}
-            }
+        """filter_menu runs on the structured dish table, not a semantic search"""
+        mock_kb.filter_menu.return_value = [
+            {"nom": "Rouleaux Végétariens", "prix": "8.50", "vegetarien": True}
         ]
         
         result = agent.filter_menu("végétarien")
         
-        assert "Rouleaux" in result or "végétarien" in result.lower()
+        assert "Rouleaux Végétariens - 8.50" in result
+        mock_kb.filter_menu.assert_called_once_with(
+            vegetarien=True, vegan=None, sans_gluten=None, epice=None, prix_max=None
+        )
+        mock_kb.search.assert_not_called()
     
     def test_get_contact_general(self, agent, mock_kb):
         """get_contact returns general contact info"""
@@ -198,24 +315,37 @@ class TestDepartmentDetection:
     """Test department/city mapping logic"""
     
     def test_detect_essonne_91(self, agent, mock_kb):
-        """91/Essonne queries map to Corbeil"""
-        mock_kb.search.return_value = [
-            {"nom": "Bolkiri Corbeil", "ville": "Corbeil-Essonnes", "content": "Restaurant Corbeil", "data": {}}
+        """91/Essonne queries list the Essonne restaurants via the lookup index"""
+        mock_kb.lookup_restaurants.return_value = [
+            {"name": "BOLKIRI Corbeil-Essonnes Street Food Viêt", "adresse": "78 Bd Jean Jaurès, 91100 Corbeil-Essonnes"},
+            {"name": "BOLKIRI Saint-Michel-sur-Orge Street Food Viêt", "adresse": "112 Rue de Sainte-Geneviève, 91240 Saint-Michel-sur-Orge"}
         ]
         
         # Test with department code
         result = agent.get_restaurant_info("91")
-        assert mock_kb.search.called
-        assert "Corbeil" in result or "restaurant" in result.lower()
+        mock_kb.lookup_restaurants.assert_called_once_with("91")
+        assert "Corbeil" in result and "Saint-Michel" in result
+        assert "2 restaurants" in result
     
     def test_detect_val_de_marne_94(self, agent, mock_kb):
-        """94/Val-de-Marne queries map to Ivry"""
-        mock_kb.search.return_value = [
-            {"nom": "Bolkiri Ivry", "ville": "Ivry-sur-Seine", "content": "Restaurant Ivry", "data": {}}
+        """Single match is returned as one restaurant card, without embedding search"""
+        mock_kb.lookup_restaurants.return_value = [
+            {"name": "BOLKIRI Ivry Street Food Viêt", "description": "Restaurant BOLKIRI Ivry\nAdresse: 94200 Ivry-sur-Seine"}
         ]
         
-        result = agent.get_restaurant_info("94")
-        assert mock_kb.search.called
+        result = agent.get_restaurant_info("94200")
+        assert result.startswith("[RESTAURANT TROUVE]")
+        assert "Ivry" in result
+        assert not mock_kb.search.called
+    
+    def test_restaurant_info_not_found(self, agent, mock_kb):
+        mock_kb.lookup_restaurants.return_value = []
+        mock_kb.get_all_restaurants.return_value = [{"name": "BOLKIRI Ivry Street Food Viêt"}]
+        
+        result = agent.get_restaurant_info("Marseille")
+        
+        assert "Restaurant non trouvé pour 'Marseille'" in result
+        assert "BOLKIRI Ivry" in result
 
 
 class TestConversationMemory:
@@ -223,23 +353,34 @@ class TestConversationMemory:
     
     def test_conversation_memory_appended(self, agent):
         """User messages added to conversation memory"""
-        initial_length = len(agent.conversation_memory)
-        
-        agent.conversation_memory.append({
-            "role": "user",
-            "content": "Test message"
-        })
+        agent._build_chat_messages("Test message", "conv1", "")
         
-        assert len(agent.conversation_memory) == initial_length + 1
-        assert agent.conversation_memory[-1]["content"] == "Test message"
+        assert len(agent.conversations["conv1"]) == 1
+        assert agent.conversations["conv1"][-1]["content"] == "Test message"
     
     def test_conversation_memory_persists(self, agent):
         """Conversation memory maintains context across calls"""
-        agent.conversation_memory.append({"role": "user", "content": "First"})
-        agent.conversation_memory.append({"role": "assistant", "content": "Response"})
+        agent.conversations.append("conv1", {"role": "user", "content": "First"})
+        agent.conversations.append("conv1", {"role": "assistant", "content": "Response"})
+        
+        assert len(agent.conversations["conv1"]) == 2
+        assert agent.conversations["conv1"][0]["content"] == "First"
+    
+    def test_vague_query_uses_own_conversation_city(self, agent, mock_kb):
+        """Last city comes from the same conversation, never from other users"""
+        mock_kb.get_all_cities.return_value = ["Corbeil-Essonnes", "Ivry"]
+        agent._record_message("conv_a", "user", "horaires de Ivry ?")
+        agent._record_message("conv_b", "user", "bonjour")
         
-        assert len(agent.conversation_memory) >= 2
-        assert agent.conversation_memory[0]["content"] == "First"
+        assert agent._prepare_search_query("adresse", "conv_a") == "adresse Ivry"
+        assert agent._prepare_search_query("adresse", "conv_b") == "adresse"
+    
+    def test_city_slot_ignores_multi_city_messages(self, agent, mock_kb):
+        mock_kb.get_all_cities.return_value = ["Corbeil-Essonnes", "Ivry"]
+        agent._record_message("conv1", "user", "horaires de Ivry ?")
+        agent._record_message("conv1", "assistant", "Nous sommes à Ivry et Corbeil-Essonnes")
+        
+        assert agent.conversations.last_city("conv1") == "Ivry"
 
 
 class TestEdgeCases:
@@ -264,7 +405,7 @@ class TestEdgeCases:
     
     def test_invalid_department_code(self, agent, mock_kb):
         """Handle invalid department codes"""
-        mock_kb.get_restaurant_by_ville.return_value = []
+        mock_kb.lookup_restaurants.return_value = []
         
         result = agent.get_restaurant_info("99")  # Invalid department
         
@@ -299,5 +440,379 @@ class TestRecommendDish:
         assert isinstance(result, str)
 
 
+def _completion(content):
+    """Build a minimal chat completion response"""
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content=content))]
+    return response
+
+
+class TestAsyncChat:
+    """Test the non-blocking achat path used by FastAPI"""
+    
+    def test_achat_uses_async_clients(self, agent, mock_kb):
+        """achat awaits planning, retrieval and generation"""
+        agent.async_client.chat.completions.create = AsyncMock(side_effect=[
+            _completion('{"tools_to_use": [{"tool": "search_knowledge", "parameters": {"query": "pho"}}]}'),
+            _completion("Nous proposons le **Pho Bo**.")
+        ])
+        mock_kb.asearch = AsyncMock(return_value=[{"content": "Pho Bo 12.90€", "type": "page", "score": 0.9}])
+        
+        result = asyncio.run(agent.achat("avez-vous du pho ?", "conv_async"))
+        
+        assert result == "Nous proposons le Pho Bo."
+        assert agent.async_client.chat.completions.create.await_count == 2
+        mock_kb.asearch.assert_awaited_once_with("pho", limit=5)
+        agent.client.chat.completions.create.assert_not_called()
+        assert agent.conversations["conv_async"][-1]["content"] == result
+    
+    def test_blocking_store_used_off_the_event_loop(self, agent, mock_kb, tmp_path):
+        """SQLite/Redis history reads and writes run in worker threads, not on the loop"""
+        import threading
+        from conversation_store import SQLiteConversationStore
+        
+        store = SQLiteConversationStore(str(tmp_path / "c.db"))
+        calling_threads = []
+        for name in ('append', 'history', 'last_city', 'set_last_city'):
+            method = getattr(store, name)
+            def spy(*args, _method=method, **kwargs):
+                calling_threads.append(threading.current_thread())
+                return _method(*args, **kwargs)
+            setattr(store, name, spy)
+        agent.conversations = store
+        agent.async_client.chat.completions.create = AsyncMock(side_effect=[
+            _completion('{"tools_to_use": [{"tool": "search_knowledge", "parameters": {"query": "pho"}}]}'),
+            _completion("Nous proposons le Pho Bo.")
+        ])
+        mock_kb.asearch = AsyncMock(return_value=[{"content": "Pho Bo 12.90€", "type": "page", "score": 0.9}])
+        
+        result = asyncio.run(agent.achat("avez-vous du pho ?", "conv_async"))
+        
+        assert result == "Nous proposons le Pho Bo."
+        assert calling_threads
+        assert threading.main_thread() not in calling_threads
+        store.close()
+    
+    def test_aplan_falls_back_to_search(self, agent, mock_kb):
+        """Planner failure falls back to async knowledge search"""
+        agent.async_client.chat.completions.create = AsyncMock(side_effect=RuntimeError("timeout"))
+        mock_kb.asearch = AsyncMock(return_value=[])
+        
+        result = asyncio.run(agent.aplan_and_execute("parking ?"))
+        
+        assert "[HORS_PERIMETRE]" in result
+    
+    def test_aexecute_tool_sync_tools_inline(self, agent, mock_kb):
+        """Tools without I/O are served by the sync implementation"""
+        mock_kb.get_all_restaurants.return_value = [
+            {"name": "Bolkiri Corbeil", "adresse": "123 Rue Test", "telephone": "01 23 45 67 89", "email": ""}
+        ]
+        
+        result = asyncio.run(agent.aexecute_tool("get_restaurants", {}))
+        
+        assert "Bolkiri Corbeil" in result
+
+
+class TestConcurrentTools:
+    """Test parallel execution of planned tool steps"""
+    
+    STEPS = [
+        {"tool": "get_menu", "parameters": {}},
+        {"tool": "get_hours", "parameters": {}},
+        {"tool": "get_contact", "parameters": {}}
+    ]
+    
+    def test_run_tools_parallel_in_plan_order(self, agent):
+        """Three 0.2s tools cost about one tool, results keep plan order"""
+        import time
+        
+        def slow_tool(tool_name, parameters, conversation_id=None):
+            time.sleep(0.2 if tool_name != "get_contact" else 0.05)
+            return f"result:{tool_name}"
+        
+        with patch.object(agent, 'execute_tool', side_effect=slow_tool):
+            start = time.perf_counter()
+            results = agent._run_tools(self.STEPS)
+            elapsed = time.perf_counter() - start
+        
+        assert results == ["result:get_menu", "result:get_hours", "result:get_contact"]
+        assert elapsed < 0.45
+        assert agent.tool_metrics["get_menu"]["calls"] == 1
+        assert agent.tool_metrics["get_menu"]["max_ms"] >= 150
+    
+    def test_run_tools_timeout_drops_step(self, agent):
+        """A tool exceeding its deadline is dropped and counted"""
+        import time
+        
+        def tool(tool_name, parameters, conversation_id=None):
+            if tool_name == "get_hours":
+                time.sleep(0.5)
+            return f"result:{tool_name}"
+        
+        with patch('ai_agent.TOOL_TIMEOUT_SECONDS', 0.2), \
+             patch.object(agent, 'execute_tool', side_effect=tool):
+            results = agent._run_tools(self.STEPS)
+        
+        assert results == ["result:get_menu", "result:get_contact"]
+        assert agent.tool_metrics["get_hours"]["timeouts"] == 1
+    
+    def test_arun_tools_parallel_with_error(self, agent):
+        """Async tools run concurrently, failing tool is isolated"""
+        import time
+        
+        async def tool(tool_name, parameters, conversation_id=None):
+            await asyncio.sleep(0.2)
+            if tool_name == "get_hours":
+                raise RuntimeError("geocoder down")
+            return f"result:{tool_name}"
+        
+        with patch.object(agent, 'aexecute_tool', side_effect=tool):
+            start = time.perf_counter()
+            results = asyncio.run(agent._arun_tools(self.STEPS))
+            elapsed = time.perf_counter() - start
+        
+        assert results == ["result:get_menu", "result:get_contact"]
+        assert elapsed < 0.45
+        assert agent.tool_metrics["get_hours"]["errors"] == 1
+
+
+class TestPromptAssembly:
+    """Static, cache-friendly prompt prefixes with per-request suffixes"""
+    
+    def test_chat_prefix_is_byte_stable(self, agent):
+        """Context lands after the history, the system prompt never changes"""
+        first = agent._build_chat_messages("horaires Ivry ?", "conv1", "Ivry: 11:45-14:45")
+        agent.conversations.append("conv1", {"role": "assistant", "content": "11:30-14:30"})
+        second = agent._build_chat_messages("et Bondy ?", "conv1", "Bondy: 11:00-22:00")
+        
+        assert first[0]["content"] == second[0]["content"]
+        assert "11:45" not in first[0]["content"]
+        assert second[1:3] == first[-1:] + [{"role": "assistant", "content": "11:30-14:30"}]
+        assert second[-2] == {"role": "system", "content": "RETRIEVED CONTEXT FROM TOOLS:\nBondy: 11:00-22:00"}
+        assert second[-1] == {"role": "user", "content": "et Bondy ?"}
+    
+    def test_planning_prefix_built_once(self, agent, mock_kb):
+        """Tools JSON and department rules are reused, only the question varies"""
+        first = agent._build_planning_messages("menu vegan")
+        second = agent._build_planning_messages("horaires Ivry")
+        
+        assert first[0]["content"] is second[0]["content"]
+        assert '"search_knowledge"' in first[0]["content"]
+        assert 'ville="91"' in first[0]["content"]
+        assert second[1]["content"] == 'Question client: "horaires Ivry"'
+        mock_kb.get_department_mapping.assert_called_once()
+    
+    def test_token_usage_logged(self, agent):
+        usage = MagicMock(prompt_tokens=1200, completion_tokens=80)
+        usage.prompt_tokens_details.cached_tokens = 1024
+        
+        with patch('ai_agent.logger') as mock_logger:
+            agent._log_usage("answer", usage)
+            agent._log_usage("answer", None)
+        
+        mock_logger.info.assert_called_once()
+        extra = mock_logger.info.call_args.kwargs["extra"]
+        assert extra == {"stage": "answer", "prompt_tokens": 1200, "completion_tokens": 80, "cached_tokens": 1024}
+
+
+class TestPlanningFastPath:
+    """Test that routed queries skip the LLM planning call"""
+    
+    def test_obvious_query_skips_planner(self, agent, mock_kb):
+        """'horaires Corbeil-Essonnes' goes straight to get_hours"""
+        mock_kb.get_hours.return_value = {
+            'restaurant': 'BOLKIRI Corbeil-Essonnes Street Food Viêt', 'ville': 'Corbeil-Essonnes',
+            'horaires': {'lundi': '11:30-14:30'}
+        }
+        
+        context = agent.plan_and_execute("horaires Corbeil-Essonnes")
+        
+        agent.client.chat.completions.create.assert_not_called()
+        mock_kb.get_hours.assert_called_once_with("Corbeil-Essonnes")
+        assert "11:30-14:30" in context
+    
+    def test_unclear_query_uses_planner(self, agent, mock_kb):
+        """Queries the router cannot explain fall back to the LLM planner"""
+        agent.client.chat.completions.create.return_value = _completion(
+            '{"tools_to_use": [{"tool": "search_knowledge", "parameters": {"query": "parking"}}]}'
+        )
+        mock_kb.search.return_value = []
+        
+        agent.plan_and_execute("est-ce qu'il y a un parking ?")
+        
+        agent.client.chat.completions.create.assert_called_once()
+        assert agent._get_router().stats()['fallback'] == 1
+    
+    def test_centroid_router_embeds_off_the_event_loop(self, agent, mock_kb):
+        """Centroid fitting and lookups call the sync embeddings API: never on the loop thread"""
+        import threading
+        threads = set()
+        
+        def embed(text):
+            threads.add(threading.get_ident())
+            return np.ones(4, dtype=np.float32)
+        
+        mock_kb.rag_engine._get_embedding = embed
+        mock_kb.asearch = AsyncMock(return_value=[])
+        agent.async_client.chat.completions.create = AsyncMock(return_value=_completion('{"tools_to_use": []}'))
+        
+        async def plan():
+            return threading.get_ident(), await agent.aplan_and_execute("est-ce qu'il y a un parking ?")
+        
+        with patch('ai_agent.INTENT_ROUTER_CENTROIDS', True):
+            loop_thread, _ = asyncio.run(plan())
+        
+        assert threads and loop_thread not in threads
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def _stream_chunks(*deltas):
+    """Async iterator mimicking a streamed chat completion"""
+    async def gen():
+        for delta in deltas:
+            chunk = MagicMock()
+            chunk.choices = [MagicMock(delta=MagicMock(content=delta))]
+            yield chunk
+    return gen()
+
+
+class TestResponseCache:
+    """Answers to context-free questions reused across conversations"""
+    
+    def test_first_turn_answer_reused(self, agent, mock_kb):
+        agent.async_client.chat.completions.create = AsyncMock(return_value=_completion("10 points par euro."))
+        mock_kb.asearch = AsyncMock(return_value=[{"content": "Fidélité: 10 points par euro"}])
+        
+        first = asyncio.run(agent.achat("Comment marche le programme de fidélité ?", "conv_a"))
+        calls = agent.async_client.chat.completions.create.await_count
+        second = asyncio.run(agent.achat("comment marche le programme de fidelite", "conv_b"))
+        
+        assert second == first
+        assert agent.async_client.chat.completions.create.await_count == calls
+        assert agent.conversations["conv_b"][-1] == {"role": "assistant", "content": first}
+        assert agent.response_cache.stats()["hits"] == 1
+    
+    def test_no_embedding_call_without_semantic_candidate(self, agent, mock_kb):
+        """An empty cache (or no entry with the same entities) cannot match: the message is not embedded"""
+        mock_kb.rag_engine._get_embedding = Mock(return_value=np.ones(4, dtype=np.float32))
+        
+        assert agent._cache_embedding("horaires du midi", frozenset()) is None
+        agent.response_cache.put("horaires du soir", mock_kb.version, "19h", frozenset({"Corbeil-Essonnes"}),
+                                 np.ones(4, dtype=np.float32))
+        assert agent._cache_embedding("horaires du midi", frozenset()) is None
+        assert not mock_kb.rag_engine._get_embedding.called
+        
+        assert agent._cache_embedding("horaires midi", frozenset({"Corbeil-Essonnes"})) is not None
+        mock_kb.rag_engine._get_embedding.assert_called_once_with("horaires midi")
+    
+    def test_stored_answer_reuses_retrieval_embedding(self, agent, mock_kb):
+        mock_kb.rag_engine.query_cache.peek.return_value = np.ones(4, dtype=np.float32)
+        
+        agent._store_response("programme de fidélité", "10 points", frozenset(), None)
+        
+        mock_kb.rag_engine.query_cache.peek.assert_called_once_with("programme de fidélité")
+        assert agent.response_cache.has_semantic_candidates("fidélité", mock_kb.version)
+    
+    def test_scope_names_menu_entities(self, agent, mock_kb):
+        mock_kb.get_all_menu_items.return_value = [{"nom": "SOUPE PHÔ AROMATISÉE", "categorie": "soupes"}]
+        
+        assert agent._cache_scope("prix du pho bo", "new_conv") == frozenset({"menu:pho", "menu:bo"})
+        assert agent._cache_scope("prix du pho ga", "new_conv") != agent._cache_scope("prix du pho bo", "new_conv")
+    
+    def test_scope_names_nearest_reference_outside_kb(self, agent, mock_kb):
+        """Towns the KB does not know still tell two nearest-restaurant questions apart"""
+        mock_kb.get_all_menu_items.return_value = []
+        melun = agent._cache_scope("le restaurant le plus proche de Melun ?", "new_conv")
+        meaux = agent._cache_scope("le restaurant le plus proche de Meaux ?", "new_conv")
+        
+        assert melun == frozenset({"place:melun"})
+        assert melun != meaux
+        embedding = np.ones(4, dtype=np.float32)
+        agent.response_cache.put("le restaurant le plus proche de Melun ?", mock_kb.version, "Melun", melun, embedding)
+        assert agent.response_cache.get("le restaurant le plus proche de Meaux ?", mock_kb.version, meaux, embedding) is None
+    
+    def test_follow_up_turn_skips_cache(self, agent, mock_kb):
+        agent.conversations.append("conv1", {"role": "user", "content": "horaires Corbeil-Essonnes"})
+        agent.response_cache.put("et le dimanche ?", mock_kb.version, "cached")
+        
+        assert agent._cache_scope("et le dimanche ?", "conv1") is None
+        assert agent._cache_scope("et le dimanche ?", "new_conv") == frozenset()
+    
+    def test_city_from_history_skips_cache(self, agent, mock_kb):
+        """A later question without a city depends on the city discussed before"""
+        agent._record_message("conv1", "user", "horaires Corbeil-Essonnes")
+        
+        assert agent._cache_scope("quels sont les horaires du midi", "conv1") is None
+        assert agent._cache_scope("horaires du midi a Corbeil-Essonnes", "conv1") == frozenset({"Corbeil-Essonnes"})
+
+
+class TestStreamingChat:
+    """Test token-by-token delivery for /chat/stream"""
+    
+    def test_stream_tokens_then_final_correction(self, agent, mock_kb):
+        """Tokens are relayed as they arrive, final event carries cleaned text"""
+        agent.async_client.chat.completions.create = AsyncMock(side_effect=[
+            _completion('{"tools_to_use": [{"tool": "get_menu", "parameters": {}}]}'),
+            _stream_chunks("Le **Pho", " Bo** est", " délicieux.")
+        ])
+        mock_kb.get_all_menu_items.return_value = [{"nom": "Pho Bo", "prix": "12.90€", "categorie": "soupes"}]
+        
+        events = asyncio.run(_collect(agent.achat_stream("pho ?", "conv_stream")))
+        
+        tokens = [e["content"] for e in events if e["type"] == "token"]
+        assert tokens == ["Le **Pho", " Bo** est", " délicieux."]
+        assert events[-1]["type"] == "done"
+        assert events[-1]["content"] == "Le Pho Bo est délicieux."
+        assert events[-1]["corrected"] is True
+        assert agent.conversations["conv_stream"][-1]["content"] == "Le Pho Bo est délicieux."
+    
+    def test_stream_error_event(self, agent, mock_kb):
+        """OpenAI failure surfaces as an error event"""
+        # "menu ?" is routed locally, so the only OpenAI call is the stream
+        agent.async_client.chat.completions.create = AsyncMock(side_effect=RuntimeError("boom"))
+        mock_kb.get_all_menu_items.return_value = []
+        
+        events = asyncio.run(_collect(agent.achat_stream("menu ?", "conv_err")))
+        
+        assert events[-1]["type"] == "error"
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
+
+
+class TestTracing:
+    """Per-stage latencies of a chat turn"""
+    
+    def test_achat_trace_lists_stages(self, agent, mock_kb):
+        agent.async_client.chat.completions.create = AsyncMock(side_effect=[
+            _completion('{"tools_to_use": [{"tool": "search_knowledge", "parameters": {"query": "pho"}}]}'),
+            _completion("Nous proposons le Pho Bo.")
+        ])
+        mock_kb.asearch = AsyncMock(return_value=[{"content": "Pho Bo 12.90€", "type": "page", "score": 0.9}])
+        
+        with patch('ai_agent.logger') as mock_logger:
+            asyncio.run(agent.achat("est-ce que vous avez du pho ?", "conv_trace"))
+        
+        traces = [c.kwargs["extra"] for c in mock_logger.info.call_args_list if c.args[0] == "Request trace"]
+        assert len(traces) == 1
+        assert traces[0]["status"] == "ok"
+        assert {"cache_lookup", "routing", "planning", "tools", "tool:search_knowledge",
+                "generation", "validation"} <= set(traces[0]["stages"])
+    
+    def test_tool_threads_inherit_trace(self, agent):
+        import tracing
+        seen = []
+        
+        def tool(tool_name, parameters, conversation_id=None):
+            seen.append(tracing.current_trace_id())
+            return "ok"
+        
+        with patch.object(agent, 'execute_tool', side_effect=tool), tracing.trace("chat") as trace:
+            agent._run_tools([{"tool": "get_menu", "parameters": {}}])
+        
+        assert seen == [trace['trace_id']]
+        assert "tool:get_menu" in trace['stages']
@@ -0,0 +1,199 @@
+import json
+import pytest
+from conversation_store import ConversationStore, SQLiteConversationStore, RedisConversationStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Dict-backed subset of the Redis commands used by the store (TTL ignored)"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+    def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value.encode('utf-8'))
+
+    def ltrim(self, key, start, end):
+        items = self.data.get(key, [])
+        self.data[key] = items[start:] if end == -1 else items[start:end + 1]
+
+    def lrange(self, key, start, end):
+        items = self.data.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+    def set(self, key, value):
+        self.data[key] = value.encode('utf-8')
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+
+def _message(content, role="user"):
+    return {"role": role, "content": content}
+
+
+class TestConversationStore:
+    """In-memory LRU: per-conversation cap, idle TTL, global ceilings"""
+
+    def test_messages_capped_per_conversation(self):
+        store = ConversationStore(max_messages=3)
+        for i in range(5):
+            store.append("conv1", _message(f"m{i}"))
+
+        assert [m["content"] for m in store["conv1"]] == ["m2", "m3", "m4"]
+        assert store.history("conv1", limit=2) == [_message("m3"), _message("m4")]
+        assert store.stats()["chars"] == 6
+
+    def test_idle_conversation_expires(self):
+        clock = FakeClock()
+        store = ConversationStore(ttl_seconds=60, clock=clock)
+        store.append("conv1", _message("Ivry"))
+        store.set_last_city("conv1", "Ivry")
+
+        clock.now += 61
+
+        assert "conv1" not in store
+        assert store.last_city("conv1") is None
+        assert store["conv1"] == []
+
+    def test_expired_conversations_swept_on_write(self):
+        clock = FakeClock()
+        store = ConversationStore(ttl_seconds=60, clock=clock)
+        store.append("old", _message("hello"))
+        clock.now += 61
+        store.append("new", _message("hello"))
+
+        assert len(store) == 1
+        assert store.stats()["expirations"] == 1
+
+    def test_least_recently_used_evicted_at_ceiling(self):
+        store = ConversationStore(max_conversations=2)
+        store.append("a", _message("1"))
+        store.append("b", _message("1"))
+        store.history("a")  # a is now more recent than b
+        store.append("c", _message("1"))
+
+        assert "a" in store and "c" in store
+        assert "b" not in store
+        assert store.stats()["evictions"] == 1
+
+    def test_char_ceiling(self):
+        store = ConversationStore(max_chars=10)
+        store.append("a", _message("x" * 6))
+        store.append("b", _message("y" * 6))
+
+        assert "a" not in store
+        assert store.stats()["chars"] == 6
+
+    def test_last_city_slot(self):
+        store = ConversationStore()
+        store.set_last_city("conv1", "Ivry")
+        store.set_last_city("conv1", "Bondy")
+
+        assert store.last_city("conv1") == "Bondy"
+        assert store.last_city("conv2") is None
+
+
+class TestSQLiteConversationStore:
+    """Shared file backend"""
+
+    def test_history_cap_and_city_shared_between_instances(self, tmp_path):
+        db_path = str(tmp_path / "conversations.db")
+        writer = SQLiteConversationStore(db_path, max_messages=2)
+        for i in range(3):
+            writer.append("conv1", _message(f"m{i}"))
+        writer.set_last_city("conv1", "Ivry")
+
+        reader = SQLiteConversationStore(db_path, max_messages=2)
+        assert [m["content"] for m in reader["conv1"]] == ["m1", "m2"]
+        assert reader.last_city("conv1") == "Ivry"
+        assert writer._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 2
+        writer.close()
+        reader.close()
+
+    def test_idle_conversation_expires_and_purged(self, tmp_path):
+        clock = FakeClock()
+        store = SQLiteConversationStore(str(tmp_path / "c.db"), ttl_seconds=60, purge_every=1, clock=clock)
+        store.append("old", _message("hello"))
+        clock.now += 61
+
+        assert store.history("old") == []
+        store.append("new", _message("hello"))
+        assert len(store) == 1
+        assert store._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 1
+        store.close()
+
+    def test_expired_history_not_resurrected(self, tmp_path):
+        clock = FakeClock()
+        store = SQLiteConversationStore(str(tmp_path / "c.db"), ttl_seconds=60, clock=clock)
+        store.append("conv1", _message("old"))
+        clock.now += 61
+        store.append("conv1", _message("new"))
+
+        assert store["conv1"] == [_message("new")]
+        store.close()
+
+
+class TestRedisConversationStore:
+    """Redis-protocol backend: capped lists with refreshed TTL"""
+
+    def test_append_trims_and_sets_ttl(self):
+        client = FakeRedis()
+        store = RedisConversationStore(client, max_messages=2, ttl_seconds=600)
+        for i in range(3):
+            store.append("conv1", _message(f"m{i}"))
+        store.set_last_city("conv1", "Ivry")
+
+        assert [m["content"] for m in store["conv1"]] == ["m1", "m2"]
+        assert store.last_city("conv1") == "Ivry"
+        assert client.ttls["bolkiri:conversation:conv1:messages"] == 600
+        assert json.loads(client.data["bolkiri:conversation:conv1:messages"][0]) == _message("m1")
+
+    def test_clear(self):
+        store = RedisConversationStore(FakeRedis())
+        store.append("conv1", _message("hello"))
+        store.clear("conv1")
+
+        assert "conv1" not in store
+        assert store.last_city("conv1") is None
+
+
+def test_redis_backend_without_client_library_fails_at_startup(monkeypatch):
+    import builtins
+    from conversation_store import create_conversation_store
+
+    real_import = builtins.__import__
+
+    def no_redis(name, *args, **kwargs):
+        if name == 'redis':
+            raise ImportError("No module named 'redis'")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setenv('CONVERSATION_BACKEND', 'redis')
+    monkeypatch.setattr(builtins, '__import__', no_redis)
+    with pytest.raises(RuntimeError, match="pip install redis"):
+        create_conversation_store()
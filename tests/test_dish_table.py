@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from dish_table import DishTable, dish_category, normalize_dish, parse_price
+
+
+DISHES = [
+    {"nom": "FORMULE SIGNATURE entrée + bobun", "description": "viande ou végé sautée, nems", "prix": "14,90 €",
+     "tags": ["vegetarien", "signature", "nems"]},
+    {"nom": "BASILIC THAÏ 🌶 tofu ou viande", "description": "sauce thaï basilic épicé", "prix": "12,50€", "tags": ["epice"]},
+    {"nom": "Curry Malaysia coco 🌶️ tofu, légèrement épicée", "description": "servi avec du riz", "prix": "", "tags": ["epice"]},
+    {"nom": "NÊMS POULET galette de riz", "description": "menthe et sauce nuoc mam", "prix": "6 €", "tags": []},
+    {"nom": "SOUPE PHÔ AROMATISÉE", "description": "soja, menthe, citron", "prix": "11.90 €", "tags": []},
+    {"nom": "RIZ NATURE PARFUMÉ bol de riz nature", "description": "", "prix": "3 €", "tags": []},
+]
+
+
+@pytest.fixture
+def table():
+    return DishTable(DISHES)
+
+
+class TestNormalize:
+    def test_price(self):
+        assert parse_price("14,90 €") == 14.9
+        assert parse_price("6€") == 6.0
+        assert parse_price("") is None
+        assert parse_price(8.5) == 8.5
+
+    def test_category_from_name(self):
+        assert dish_category("Formule Salade papaye entrée + salade papaye") == "formules"
+        assert dish_category("NÊMS VÉGÉTARIENS galette de riz") == "entrees"
+        assert dish_category("SOUPE PHÔ AROMATISÉE") == "soupes"
+        assert dish_category("RIZ TOMATE riz sauté") == "accompagnements"
+        assert dish_category("BOEUF LOC LAC accompagement au choix (riz tomate recommandé)") == "plats"
+        assert dish_category("CANARD LAQUÉ servi avec du riz blanc parfumé") == "plats"
+
+    def test_spice_levels(self):
+        assert normalize_dish(DISHES[1])['epice'] == 'Moyen'
+        assert normalize_dish(DISHES[2])['epice'] == 'Léger'
+        assert normalize_dish(DISHES[3])['epice'] == ''
+
+    @pytest.mark.parametrize("nom,vegetarien", [
+        ("ASSORTIMENT FRITURE incluant 2 nems poulet/végé, 2 raviolis wonton frit et 2 tempura crevettes", False),
+        ("SUNNY COM base de riz nature, avec viande ou végé sautée aux oignons, œuf et légumes", False),
+        ("BASILIC THAÏ 🌶 tofu ou viande émincé ou crevettes sautées à la sauce thaï basilic épicé…", False),
+        ("Boeuf Black Poivré bœuf sauté à la sauce au poivre avec ces poivrons rouges et verts", False),
+        ("NÊMS VÉGÉTARIENS galette de riz, avec salade, menthe…", True),
+        ("Bol de légumes sans viande au tofu", True),
+    ])
+    def test_vegetarian_from_scraped_names(self, nom, vegetarien):
+        """Scraped menu strings; the scraper tags anything containing 'végé' as vegetarien"""
+        assert normalize_dish({"nom": nom, "tags": ["vegetarien"] if 'végé' in nom.lower() else []})['vegetarien'] is vegetarien
+
+    def test_vegan_implies_vegetarian(self):
+        dish = normalize_dish({"nom": "Salade vegan au tofu", "tags": []})
+
+        assert dish['vegan'] is True
+        assert dish['vegetarien'] is True
+        assert DishTable([{"nom": "Curry vegan", "vegan": True}]).filter(vegetarien=True)[0]['nom'] == "Curry vegan"
+
+    def test_category_accent_insensitive(self):
+        assert dish_category("Phở Bò") == "soupes"
+        assert dish_category("SOUPE PHÔ AROMATISÉE bouillon et pâte séparé") == "soupes"
+        assert dish_category("Thé glacé maison") == "boissons"
+
+    def test_explicit_fields_win(self):
+        dish = normalize_dish({"nom": "Tofu sauté", "prix": "9€", "vegetarien": False, "epice": "Épicé",
+                               "categorie": "Plats"})
+
+        assert dish['vegetarien'] is False
+        assert dish['epice'] == 'Épicé'
+        assert dish['categorie'] == 'plats'
+
+
+class TestDishTable:
+    def test_columns(self, table):
+        assert len(table) == 6
+        assert np.isnan(table.prices[2])
+        assert table.flags['signature'].tolist() == [True, False, False, False, False, False]
+
+    def test_duplicates_dropped(self):
+        assert len(DishTable(DISHES + [dict(DISHES[0], url="https://example.com/autre")])) == 6
+
+    def test_flags_combine(self, table):
+        names = [d['nom'] for d in table.filter(vegetarien=True, epice=True)]
+
+        assert names == ["Curry Malaysia coco 🌶️ tofu, légèrement épicée"]
+
+    def test_negative_flag(self, table):
+        assert all(not d['vegetarien'] for d in table.filter(vegetarien=False))
+
+    def test_spice_level_name(self, table):
+        assert [d['nom'] for d in table.filter(epice='léger')] == ["Curry Malaysia coco 🌶️ tofu, légèrement épicée"]
+        assert table.filter(epice='brûlant') == []
+
+    def test_price_excludes_unpriced(self, table):
+        names = [d['nom'] for d in table.filter(prix_max=12.5)]
+
+        assert "Curry Malaysia coco 🌶️ tofu, légèrement épicée" not in names
+        assert "BASILIC THAÏ 🌶 tofu ou viande" in names
+        assert "FORMULE SIGNATURE entrée + bobun" not in names
+
+    def test_category(self, table):
+        assert [d['nom'] for d in table.filter(categorie='SOUPES')] == ["SOUPE PHÔ AROMATISÉE"]
+        assert table.filter(categorie='desserts') == []
+
+    def test_no_criteria_returns_menu(self, table):
+        assert table.filter() == table.dishes
+
+    def test_empty_table(self):
+        assert DishTable([]).filter(vegetarien=True, prix_max=10) == []
@@ -0,0 +1,166 @@
+import pytest
+import numpy as np
+from unittest.mock import MagicMock, patch
+from embedding_cache import EmbeddingCache
+
+
+def _vec(value):
+    return np.full(4, value, dtype=np.float32)
+
+
+class TestEmbeddingCache:
+    """LRU/TTL behaviour of the query embedding cache"""
+    
+    def test_normalized_hit(self):
+        """Case and whitespace variants share one entry"""
+        cache = EmbeddingCache(max_size=10)
+        cache.put("Menu  Végétarien", _vec(1))
+        
+        assert np.array_equal(cache.get("  menu végétarien "), _vec(1))
+        assert cache.stats()['hits'] == 1
+    
+    def test_miss_counted(self):
+        cache = EmbeddingCache(max_size=10)
+        
+        assert cache.get("restaurant Ivry") is None
+        assert cache.stats()['misses'] == 1
+    
+    def test_lru_eviction(self):
+        """Least recently used entry is evicted first"""
+        cache = EmbeddingCache(max_size=2)
+        cache.put("a", _vec(1))
+        cache.put("b", _vec(2))
+        cache.get("a")
+        cache.put("c", _vec(3))
+        
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()['evictions'] == 1
+    
+    def test_ttl_expiry(self):
+        now = [1000.0]
+        cache = EmbeddingCache(max_size=10, ttl_seconds=60, clock=lambda: now[0])
+        cache.put("horaires", _vec(1))
+        now[0] += 61
+        
+        assert cache.get("horaires") is None
+    
+    def test_persistent_store_survives_restart(self, tmp_path):
+        """SQLite-backed entries are served by a fresh instance"""
+        db_path = str(tmp_path / "query_embeddings.db")
+        first = EmbeddingCache(db_path=db_path)
+        first.put("restaurant Ivry", _vec(7))
+        first.close()
+        
+        second = EmbeddingCache(db_path=db_path)
+        
+        assert np.array_equal(second.get("restaurant ivry"), _vec(7))
+        assert second.stats()['persistent'] is True
+    
+    def test_writes_batched(self, tmp_path):
+        """SQLite sees new entries once per batch, not once per miss"""
+        db_path = str(tmp_path / "query_embeddings.db")
+        cache = EmbeddingCache(db_path=db_path, write_batch=3)
+        cache.put("a", _vec(1))
+        cache.put("b", _vec(2))
+        
+        assert cache._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0] == 0
+        
+        cache.put("c", _vec(3))
+        
+        assert cache._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0] == 3
+    
+    def test_pending_entry_served_after_lru_eviction(self, tmp_path):
+        cache = EmbeddingCache(max_size=1, db_path=str(tmp_path / "q.db"))
+        cache.put("a", _vec(1))
+        cache.put("b", _vec(2))
+        
+        assert np.array_equal(cache.get("a"), _vec(1))
+    
+    def test_flush_due_after_interval(self, tmp_path):
+        now = [1000.0]
+        cache = EmbeddingCache(db_path=str(tmp_path / "q.db"), clock=lambda: now[0], flush_interval=5)
+        cache.put("a", _vec(1), autoflush=False)
+        
+        assert not cache.flush_due()
+        now[0] += 6
+        assert cache.flush_due()
+    
+    def test_table_pruned_at_startup(self, tmp_path):
+        """Expired rows are deleted and the table kept under max_rows"""
+        db_path = str(tmp_path / "query_embeddings.db")
+        now = [1000.0]
+        first = EmbeddingCache(db_path=db_path, ttl_seconds=100, clock=lambda: now[0], write_batch=1)
+        first.put("old", _vec(1))
+        for i in range(4):
+            now[0] += 50
+            first.put(f"query {i}", _vec(i))
+        first.close()
+        
+        second = EmbeddingCache(db_path=db_path, ttl_seconds=100, clock=lambda: now[0], max_rows=2)
+        keys = {row[0] for row in second._db.execute("SELECT key FROM query_embeddings")}
+        
+        assert keys == {"query 2", "query 3"}
+    
+    def test_table_pruned_every_n_writes(self, tmp_path):
+        cache = EmbeddingCache(db_path=str(tmp_path / "q.db"), max_rows=5, write_batch=1, prune_every=10)
+        for i in range(10):
+            cache.put(f"query {i}", _vec(i))
+        
+        assert cache._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0] == 5
+    
+    def test_peek_counts_nothing(self):
+        cache = EmbeddingCache()
+        cache.put("pho", _vec(1))
+        
+        assert np.array_equal(cache.peek("PHO"), _vec(1))
+        assert cache.peek("bobun") is None
+        assert (cache.hits, cache.misses) == (0, 0)
+    
+    def test_get_or_compute(self):
+        cache = EmbeddingCache()
+        compute = MagicMock(return_value=_vec(3))
+        
+        cache.get_or_compute("pho", compute)
+        cache.get_or_compute("PHO", compute)
+        
+        compute.assert_called_once_with("pho")
+
+
+class TestRAGEngineQueryCache:
+    """RAGEngine._get_embedding serves repeated queries from the cache"""
+    
+    def test_second_call_no_api(self):
+        from rag_engine import RAGEngine
+        
+        engine = RAGEngine.__new__(RAGEngine)
+        engine.query_cache = EmbeddingCache()
+        response = MagicMock()
+        response.data = [MagicMock(embedding=[0.1] * 8)]
+        
+        with patch('rag_engine.client') as client:
+            client.embeddings.create.return_value = response
+            first = engine._get_embedding("plat végétarien menu")
+            second = engine._get_embedding("plat végétarien menu")
+        
+        client.embeddings.create.assert_called_once()
+        assert np.array_equal(first, second)
+    
+    def test_async_miss_flushes_off_the_loop(self, tmp_path):
+        import asyncio
+        from rag_engine import RAGEngine
+        
+        engine = RAGEngine.__new__(RAGEngine)
+        engine.query_cache = EmbeddingCache(db_path=str(tmp_path / "q.db"), write_batch=1)
+        response = MagicMock()
+        response.data = [MagicMock(embedding=[0.1] * 8)]
+        
+        with patch('rag_engine.async_client') as client, \
+             patch('rag_engine.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            async def create(**kwargs):
+                return response
+            client.embeddings.create = create
+            asyncio.run(engine._aget_embedding("plat végétarien"))
+        
+        to_thread.assert_called_once_with(engine.query_cache.flush)
+        assert engine.query_cache._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0] == 1
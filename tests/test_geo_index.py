@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from geo_index import LocationIndex, haversine_km
+
+
+def _random_locations(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(48.0, 49.5, n)
+    lons = rng.uniform(1.5, 3.5, n)
+    return [{'lat': float(lat), 'lon': float(lon), 'id': i} for i, (lat, lon) in enumerate(zip(lats, lons))]
+
+
+class TestHaversine:
+    def test_paris_lyon(self):
+        assert float(haversine_km(48.8566, 2.3522, np.array([45.7640]), np.array([4.8357]))[0]) == pytest.approx(392, abs=5)
+
+    def test_same_point(self):
+        assert float(haversine_km(48.8566, 2.3522, np.array([48.8566]), np.array([2.3522]))[0]) == pytest.approx(0, abs=1e-6)
+
+
+class TestLocationIndex:
+    """k-nearest by great-circle distance, flat scan and grid"""
+
+    def test_closest_first(self):
+        index = LocationIndex([
+            {'lat': 48.8358, 'lon': 2.2400, 'name': 'Boulogne'},
+            {'lat': 48.8190, 'lon': 2.3036, 'name': 'Malakoff'},
+            {'lat': 48.8614, 'lon': 2.4414, 'name': 'Montreuil'},
+        ])
+
+        found = index.nearest(48.8128, 2.2380, k=2)  # Meudon
+
+        assert [loc['name'] for loc, _ in found] == ['Boulogne', 'Malakoff']
+        assert found[0][1] < found[1][1]
+
+    def test_k_larger_than_index(self):
+        index = LocationIndex(_random_locations(3))
+
+        assert len(index.nearest(48.8, 2.3, k=10)) == 3
+
+    def test_empty_index(self):
+        assert LocationIndex([]).nearest(48.8, 2.3, k=3) == []
+
+    def test_grid_matches_brute_force(self):
+        locations = _random_locations(2000)
+        index = LocationIndex(locations)
+        assert index.cells is not None
+
+        rng = np.random.default_rng(1)
+        for lat, lon in zip(rng.uniform(47.5, 50.0, 50), rng.uniform(1.0, 4.0, 50)):
+            distances = haversine_km(lat, lon, index.lats, index.lons)
+            expected = list(np.argsort(distances, kind='stable')[:5])
+
+            found = index.nearest(lat, lon, k=5)
+
+            assert [loc['id'] for loc, _ in found] == expected
+
+    def test_grid_query_above_every_location(self):
+        """A query further from the equator than all locations still finds the true nearest"""
+        rng = np.random.default_rng(3)
+        locations = [{"id": "V", "lat": 60.0, "lon": 0.0}, {"id": "P", "lat": 70.0, "lon": 58.0}] + [
+            {"id": i, "lat": lat, "lon": lon} for i, (lat, lon) in enumerate(zip(rng.uniform(40, 50, 300),
+                                                                                 rng.uniform(-5, 5, 300)))
+        ]
+        index = LocationIndex(locations, cell_degrees=1.0)
+
+        (location, distance), = index.nearest(78.0, 0.0)
+
+        # P is closer than V, which lies straight south of the query
+        assert location["id"] == "P"
+        assert distance == pytest.approx(float(haversine_km(78.0, 0.0, 70.0, 58.0)))
+
+    def test_batch_matches_single(self):
+        index = LocationIndex(_random_locations(50))
+        lats, lons = np.array([48.8, 49.1]), np.array([2.3, 2.0])
+
+        indices, distances = index.nearest_batch(lats, lons, k=3)
+
+        assert indices.shape == distances.shape == (2, 3)
+        for row, (lat, lon) in enumerate(zip(lats, lons)):
+            single = index.nearest(lat, lon, k=3)
+            assert [loc['id'] for loc, _ in single] == list(indices[row])
+            assert [d for _, d in single] == pytest.approx(list(distances[row]))
@@ -0,0 +1,198 @@
+import asyncio
+import pytest
+from unittest.mock import patch, Mock, AsyncMock
+from geocoding import Gazetteer, GeocodeCache, Geocoder, GeocoderBusy
+
+
+ROWS = [
+    ("Ivry-sur-Seine", "94200", 48.8157, 2.3849),
+    ("Le Kremlin-Bicêtre", "94270", 48.8100, 2.3581),
+    ("Saint-Maur-des-Fossés", "94100", 48.7994, 2.4997),
+    ("Neuilly-sur-Seine", "92200", 48.8846, 2.2697),
+    ("Neuilly-sur-Marne", "93330", 48.8536, 2.5300),
+    ("Mandres-les-Roses", "94520", 48.70, 2.54),
+    ("Périgny", "94520", 48.69, 2.56),
+    ("Paris 15e", "75015", 48.8414, 2.3003),
+]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def gazetteer():
+    return Gazetteer(ROWS)
+
+
+def _nominatim(data):
+    response = Mock()
+    response.json.return_value = data
+    response.raise_for_status.return_value = None
+    return response
+
+
+class TestGazetteer:
+    """Offline commune and postal code resolution"""
+
+    @pytest.mark.parametrize("query,expected", [
+        ("Ivry-sur-Seine", "Ivry-sur-Seine"),
+        ("ivry sur seine", "Ivry-sur-Seine"),
+        ("Ivry", "Ivry-sur-Seine"),
+        ("94200", "Ivry-sur-Seine"),
+        ("Kremlin-Bicetre", "Le Kremlin-Bicêtre"),
+        ("St-Maur-des-Fossés", "Saint-Maur-des-Fossés"),
+        ("Paris 15", "Paris 15e"),
+        ("paris 15e", "Paris 15e"),
+        ("Ivry-sur-Seine, France", "Ivry-sur-Seine"),
+    ])
+    def test_lookup(self, gazetteer, query, expected):
+        assert gazetteer.lookup(query)["name"] == expected
+
+    def test_ambiguous_short_form_not_resolved(self, gazetteer):
+        """"Neuilly" names two communes: left to the network geocoder"""
+        assert gazetteer.lookup("Neuilly") is None
+
+    def test_shared_postal_code_averaged(self, gazetteer):
+        found = gazetteer.lookup("94520")
+
+        assert found["lat"] == pytest.approx(48.695, abs=1e-4)
+        assert found["lon"] == pytest.approx(2.55, abs=1e-4)
+
+    def test_unknown(self, gazetteer):
+        assert gazetteer.lookup("Nonexistentville") is None
+
+    @pytest.mark.parametrize("query", ["Melun", "Meaux", "Provins", "Rambouillet", "Étampes", "Yèbles"])
+    def test_bundled_table_covers_ile_de_france(self, query):
+        """Communes far from the restaurants resolve offline too"""
+        assert Gazetteer.from_csv().lookup(query) is not None
+
+    def test_extra_rows_take_precedence(self, tmp_path):
+        path = tmp_path / "communes.csv"
+        path.write_text("name,postal_code,lat,lon\nIvry-sur-Seine,94200,48.8157,2.3849\n", encoding="utf-8")
+
+        gazetteer = Gazetteer.from_csv(str(path), [("Ivry-sur-Seine", "", 48.0, 2.0)])
+
+        assert gazetteer.lookup("Ivry")["lat"] == 48.0
+        assert len(gazetteer) == 2
+
+    def test_bundled_table_loads(self):
+        gazetteer = Gazetteer.from_csv()
+
+        assert len(gazetteer) > 250
+        assert gazetteer.lookup("Meudon")["name"] == "Meudon"
+
+
+class TestGeocodeCache:
+    """Persistent results, including remembered misses"""
+
+    def test_persists_across_instances(self, tmp_path):
+        db_path = str(tmp_path / "geocode.db")
+        GeocodeCache(db_path).put("6 Pl. Carnot\n94360 Bry-Sur-Marne", {"lat": 48.84, "lon": 2.52})
+
+        cache = GeocodeCache(db_path)
+        assert "6 pl. carnot, 94360 bry-sur-marne" in cache
+        assert cache["6 Pl. Carnot\n94360 Bry-Sur-Marne"] == {"lat": 48.84, "lon": 2.52}
+
+    def test_negative_entry_expires(self, tmp_path):
+        clock = FakeClock()
+        cache = GeocodeCache(str(tmp_path / "geocode.db"), negative_ttl_seconds=60, clock=clock)
+        cache.put("Nonexistentville", None)
+
+        assert cache.lookup("Nonexistentville") == (True, None)
+        assert "Nonexistentville" not in cache
+        clock.now += 61
+        assert cache.lookup("Nonexistentville") == (False, None)
+
+
+class TestGeocoder:
+    """Gazetteer, then cache, Nominatim as last resort"""
+
+    def test_gazetteer_hit_never_calls_network(self, gazetteer):
+        geocoder = Geocoder(gazetteer, GeocodeCache(None))
+
+        with patch("requests.get") as get:
+            location = geocoder.geocode("Ivry")
+
+        assert location["source"] == "gazetteer"
+        get.assert_not_called()
+
+    def test_network_result_cached(self, gazetteer):
+        geocoder = Geocoder(gazetteer, GeocodeCache(None), min_interval=0)
+
+        with patch("requests.get", return_value=_nominatim([{"lat": "48.46", "lon": "2.70"}])) as get:
+            first = geocoder.geocode("Melun")
+            second = geocoder.geocode("melun")
+
+        assert get.call_count == 1
+        assert first == {"lat": 48.46, "lon": 2.70, "source": "network"}
+        assert second["source"] == "cache"
+
+    def test_unknown_place_cached_as_miss(self, gazetteer):
+        geocoder = Geocoder(gazetteer, GeocodeCache(None), min_interval=0)
+
+        with patch("requests.get", return_value=_nominatim([])) as get:
+            assert geocoder.geocode("Nonexistentville") is None
+            assert geocoder.geocode("Nonexistentville") is None
+
+        assert get.call_count == 1
+        assert geocoder.stats["not_found"] == 2
+
+    def test_network_error_not_cached(self, gazetteer):
+        geocoder = Geocoder(gazetteer, GeocodeCache(None), min_interval=0)
+
+        with patch("requests.get", side_effect=ConnectionError("down")):
+            with pytest.raises(ConnectionError):
+                geocoder.geocode("Melun")
+
+        assert geocoder.cache.lookup("Melun") == (False, None)
+
+    def test_network_calls_spaced(self, gazetteer):
+        geocoder = Geocoder(gazetteer, min_interval=1.0)
+
+        waits = [geocoder._wait_time() for _ in range(3)]
+
+        assert waits[0] == pytest.approx(0, abs=0.05)
+        assert waits[2] == pytest.approx(2.0, abs=0.05)
+
+    def test_burst_fails_fast_beyond_max_wait(self, gazetteer):
+        """The 4th caller of a burst would sleep 3 s: it gets an error instead of queueing"""
+        geocoder = Geocoder(gazetteer, min_interval=1.0, max_wait=2.5)
+
+        waits = [geocoder._wait_time() for _ in range(3)]
+        next_slot = geocoder._next_slot
+        with pytest.raises(GeocoderBusy):
+            geocoder._wait_time()
+
+        assert waits[2] == pytest.approx(2.0, abs=0.05)
+        assert geocoder._next_slot == next_slot  # nothing reserved for the rejected caller
+
+    def test_async_cache_lookup_and_write_off_the_event_loop(self, gazetteer):
+        import threading
+        cache = GeocodeCache(None)
+        threads = []
+        lookup, put = cache.lookup, cache.put
+        cache.lookup = lambda *a: threads.append(threading.current_thread()) or lookup(*a)
+        cache.put = lambda *a: threads.append(threading.current_thread()) or put(*a)
+        geocoder = Geocoder(gazetteer, cache, min_interval=0)
+        response = _nominatim([{"lat": "48.46", "lon": "2.70"}])
+
+        with patch("httpx.AsyncClient") as client:
+            client.return_value.__aenter__.return_value.get = AsyncMock(return_value=response)
+            location = asyncio.run(geocoder.ageocode("Melun"))
+
+        assert location["source"] == "network"
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+    def test_async_uses_local_sources(self, gazetteer):
+        geocoder = Geocoder(gazetteer)
+
+        location = asyncio.run(geocoder.ageocode("94270"))
+
+        assert location["source"] == "gazetteer"
+        assert location["lat"] == pytest.approx(48.81, abs=1e-3)
@@ -0,0 +1,103 @@
+import json
+from html_extract import extract
+from scraper_industrial_2025 import parse_links, parse_page, parse_restaurant
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><title> La carte &amp; menu | Bolkiri </title>
+<script type="application/ld+json">{"@type": "Restaurant", "name": "BOLKIRI Ivry Street Food Viêt",
+ "telephone": "+33 1 23 45 67 89",
+ "address": {"streetAddress": "12 Rue Jean Jaurès", "postalCode": "94200", "addressLocality": "Ivry-sur-Seine"},
+ "openingHoursSpecification": [{"opens": "11:30", "closes": "22:30"}]}</script>
+<style>.a{color:red}</style></head>
+<body><nav><h1>Menu nav</h1><ul><li>Accueil</li></ul><a href="/nos-restaurants/">Restos</a></nav>
+<main><h1>La <b>carte</b></h1><!-- note --> Intro
+<h2>Entrées</h2><p>Nems <i>croustillants</i> 6,50 € COMMANDER</p><h3>Ok</h3><h2>Pho</h2>
+<ul><li>Bo bun <ul><li>végé</li><li>boeuf</li></ul></li><li> Pho </li></ul>
+<script>var hidden = "pas du texte";</script>
+<p>Ouverture prochaine</p><a href="https://bolkiri.fr/fidelite/?x=1#top">Fidélité</a>
+</main><footer><p>12 Rue de la Paix</p><ol><li>Mentions</li></ol></footer></body></html>
+""".encode('utf-8')
+
+
+class TestExtract:
+    """Single traversal, same reading of the page as the former BeautifulSoup passes"""
+
+    def test_title_and_headings(self):
+        page = extract(PAGE)
+
+        assert page['title'] == "La carte & menu | Bolkiri"
+        assert page['h1'] == "Menu nav"
+        # Headings outside nav, grouped by level, too-short ones dropped
+        assert page['headings'] == [
+            {'level': 'h1', 'text': 'Lacarte'},
+            {'level': 'h2', 'text': 'Entrées'},
+            {'level': 'h2', 'text': 'Pho'}
+        ]
+
+    def test_nested_lists(self):
+        assert extract(PAGE)['lists'] == [['Bo bunvégéboeuf', 'végé', 'boeuf', 'Pho'], ['végé', 'boeuf']]
+
+    def test_content_skips_chrome_and_scripts(self):
+        content = extract(PAGE)['content']
+
+        assert content.startswith("La\ncarte\nIntro\nEntrées")
+        assert "Menu nav" not in content
+        assert "pas du texte" not in content
+        assert "12 Rue de la Paix" not in content
+
+    def test_whole_page_text(self):
+        page = extract(PAGE)
+
+        assert "Menu nav" in page['text'] and "12 Rue de la Paix" in page['text']
+        assert "pas du texte" not in page['text'] and "color:red" not in page['text']
+        assert page['strings'][-2:] == ["12 Rue de la Paix", "Mentions"]
+
+    def test_json_ld_and_links(self):
+        page = extract(PAGE)
+
+        assert json.loads(page['json_ld'][0])['name'] == "BOLKIRI Ivry Street Food Viêt"
+        assert page['links'] == ["/nos-restaurants/", "https://bolkiri.fr/fidelite/?x=1#top"]
+
+    def test_latin1_bytes(self):
+        page = extract("<html><body><main>Entrées</main></body></html>".encode('latin-1'))
+
+        assert page['content'] == "Entrées"
+
+    def test_empty_document(self):
+        assert extract(b"  ")['content'] == ''
+
+
+class TestPageParsers:
+    """Module-level parsers (picklable for the process pool)"""
+
+    def test_parse_page(self):
+        page = parse_page("https://bolkiri.fr/la-carte/", PAGE)
+
+        assert page['title'] == "La carte & menu | Bolkiri"
+        assert page['content'].startswith("La carte Intro Entrées Nems")
+
+    def test_parse_links_normalized(self):
+        assert parse_links("https://bolkiri.fr", PAGE) == [
+            "https://bolkiri.fr/fidelite/",
+            "https://bolkiri.fr/nos-restaurants/"
+        ]
+
+    def test_parse_restaurant_json_ld(self):
+        resto = parse_restaurant("https://restaurants.bolkiri.fr/ivry/", PAGE)
+
+        assert resto['adresse'] == "12 Rue Jean Jaurès, 94200 Ivry-sur-Seine"
+        assert resto['horaires']['lundi'] == "11:30-22:30"
+        assert resto['statut'] == "ouverture_prochaine"
+        assert resto['coordinates'] is None
+
+    def test_parse_restaurant_html_fallback(self):
+        resto = parse_restaurant("u", PAGE.replace(b"application/ld+json", b"text/plain"))
+
+        assert resto == {
+            "name": "Menu nav",
+            "telephone": "",
+            "adresse": "12 Rue de la Paix",
+            "statut": "ouverture_prochaine",
+            "url": "u"
+        }
@@ -0,0 +1,154 @@
+import pytest
+from unittest.mock import Mock
+import numpy as np
+import tracing
+from intent_router import IntentRouter
+
+
+TOOLS = [{"name": name} for name in [
+    'search_knowledge', 'get_restaurants', 'get_restaurant_info', 'get_menu', 'filter_menu',
+    'get_contact', 'get_hours', 'recommend_dish', 'find_nearest_restaurant'
+]]
+
+
+@pytest.fixture
+def kb():
+    """Minimal KB exposing the data the router is built from"""
+    kb = Mock()
+    kb.get_all_restaurants.return_value = [
+        {"name": "BOLKIRI Ivry Street Food Viêt", "adresse": "Avenue Maurice Thorez, 94200 Ivry-sur-Seine"},
+        {"name": "BOLKIRI Corbeil-Essonnes Street Food Viêt", "adresse": "78 Bd Jean Jaurès, 91100 Corbeil-Essonnes"},
+        {"name": "BOLKIRI Paris 11 Street Food Viêt", "adresse": "22 Av. de la République, 75011 Paris"},
+    ]
+    kb.get_all_cities.return_value = ["Ivry", "Corbeil-Essonnes", "Paris 11"]
+    kb.get_department_mapping.return_value = {
+        "94": "Ivry", "val-de-marne": "Ivry", "91": "Corbeil-Essonnes", "essonne": "Corbeil-Essonnes", "75": "Paris 11"
+    }
+    return kb
+
+
+@pytest.fixture
+def router(kb):
+    return IntentRouter(kb, TOOLS)
+
+
+class TestRules:
+    """Keyword and regex rules"""
+    
+    @pytest.mark.parametrize("query,expected", [
+        ("horaires Ivry", [{"tool": "get_hours", "parameters": {"ville": "Ivry"}}]),
+        ("restaurant dans le 91", [{"tool": "get_restaurant_info", "parameters": {"ville": "91"}}]),
+        ("restaurants en Essonne", [{"tool": "get_restaurant_info", "parameters": {"ville": "essonne"}}]),
+        ("le plus proche de Melun", [{"tool": "find_nearest_restaurant", "parameters": {"ville_reference": "Melun"}}]),
+        ("Quels sont vos horaires d'ouverture ?", [{"tool": "get_hours", "parameters": {}}]),
+        ("vos restaurants", [{"tool": "get_restaurants", "parameters": {}}]),
+        ("restaurant à Paris", [{"tool": "get_restaurant_info", "parameters": {"ville": "Paris"}}]),
+    ])
+    def test_confident_routes(self, router, query, expected):
+        assert router.route(query) == expected
+    
+    @pytest.mark.parametrize("query,reference", [
+        ("le restaurant le plus proche de Saint-Maur-des-Fossés", "Saint-Maur-des-Fossés"),
+        ("le plus proche de Melun svp", "Melun"),
+        ("resto près de ivry", "ivry"),
+    ])
+    def test_nearest_reference_stops_at_place(self, router, query, reference):
+        assert router.route(query) == [{"tool": "find_nearest_restaurant", "parameters": {"ville_reference": reference}}]
+    
+    def test_sans_gluten_is_a_criterion(self, router):
+        assert router.route("plats sans gluten") == [{"tool": "filter_menu", "parameters": {"criteria": "plats sans gluten"}}]
+    
+    def test_diet_with_department(self, router):
+        """Multi-intent query produces one step per intent"""
+        plan = router.route("menu végétarien dans le 91")
+        
+        assert [step["tool"] for step in plan] == ["filter_menu", "get_restaurant_info"]
+        assert plan[1]["parameters"] == {"ville": "91"}
+    
+    def test_every_location_gets_a_step(self, router):
+        """"91 et 94" asks about both departments, not only the first one"""
+        assert router.route("horaires du 91 et 94") == [
+            {"tool": "get_hours", "parameters": {"ville": "91"}},
+            {"tool": "get_hours", "parameters": {"ville": "94"}},
+        ]
+        assert router.route("restaurants Ivry et Paris 11") == [
+            {"tool": "get_restaurant_info", "parameters": {"ville": "Ivry"}},
+            {"tool": "get_restaurant_info", "parameters": {"ville": "Paris 11"}},
+        ]
+    
+    def test_postal_code_of_named_city_is_one_location(self, router):
+        assert router.route("horaires Corbeil-Essonnes 91100") == [
+            {"tool": "get_hours", "parameters": {"ville": "Corbeil-Essonnes"}}
+        ]
+    
+    def test_too_many_steps_fall_back(self, router):
+        """Truncating the plan would drop a location: the LLM planner gets the query"""
+        assert router.route("horaires et téléphone Ivry et Corbeil-Essonnes") is None
+    
+    @pytest.mark.parametrize("query", [
+        "Quel est le prix du Phở Bò ?",
+        "est-ce qu'il y a un parking à Ivry ?",
+        "le plus proche de moi",
+        "le restaurant le plus proche de Versailles est ouvert ?",
+        "je suis à côté de la gare",
+        "un plat pas épicé",
+        "des plats non végétariens",
+        "oui",
+        "",
+    ])
+    def test_unsure_falls_back(self, router, query):
+        assert router.route(query) is None
+    
+    def test_long_query_falls_back(self, router):
+        query = "je voudrais connaitre les horaires d'Ivry mais aussi savoir si on peut venir avec un chien et réserver pour douze"
+        assert router.route(query) is None
+    
+    def test_unknown_tools_never_emitted(self, kb):
+        router = IntentRouter(kb, [{"name": "get_menu"}])
+        assert router.route("horaires Ivry") is None
+
+
+class TestStats:
+    """Hit-rate reporting"""
+    
+    def test_hit_rate(self, router):
+        router.route("horaires Ivry")
+        router.route("menu végétarien")
+        router.route("parking ?")
+        
+        stats = router.stats()
+        assert stats['routed'] == 2
+        assert stats['fallback'] == 1
+        assert stats['by_tool']['get_hours'] == 1
+        assert router.hit_rate() == pytest.approx(2 / 3)
+    
+    def test_outcomes_exported_to_metrics(self, router):
+        tracing.metrics.reset()
+        router.route("horaires Ivry")
+        router.route("parking ?")
+        
+        assert tracing.metrics.counter("bolkiri_router_queries_total", outcome="rules") == 1
+        assert tracing.metrics.counter("bolkiri_router_queries_total", outcome="fallback") == 1
+        assert 'bolkiri_router_queries_total{outcome="fallback"} 1' in tracing.metrics.render()
+        tracing.metrics.reset()
+
+
+class TestCentroids:
+    """Optional nearest-centroid classifier"""
+    
+    def test_centroid_fallback(self, kb):
+        """Queries missed by rules are classified against cached embeddings"""
+        def embed(text):
+            # Deterministic toy embedding: fidelity-like texts on axis 0, the rest on axis 1
+            return np.array([1.0, 0.0] if 'fidel' in text or 'points' in text else [0.0, 1.0], dtype=np.float32)
+        
+        router = IntentRouter(kb, TOOLS, embed_fn=embed)
+        router.fit_centroids({
+            'search_knowledge': ["programme de fidelite", "cumuler des points"],
+            'recommend_dish': ["que me conseillez-vous"],
+        })
+        
+        plan = router.route("combien de points par euro ?")
+        
+        assert plan == [{"tool": "search_knowledge", "parameters": {"query": "combien de points par euro ?"}}]
+        assert router.stats()['centroid'] == 1
@@ -0,0 +1,41 @@
+import threading
+from kb_views import KBViews
+
+
+class TestKBViews:
+    """Per-version memoization of derived KB data"""
+    
+    def test_built_once(self):
+        views = KBViews("v1")
+        calls = []
+        
+        def build():
+            calls.append(1)
+            return {"94": "Ivry"}
+        
+        assert views.get("department_mapping", build) == {"94": "Ivry"}
+        assert views.get("department_mapping", build) is views.get("department_mapping", build)
+        assert len(calls) == 1
+        assert "department_mapping" in views
+    
+    def test_concurrent_first_access_builds_once(self):
+        views = KBViews("v1")
+        calls = []
+        start = threading.Event()
+        
+        def build():
+            calls.append(1)
+            return ["Ivry"]
+        
+        def worker():
+            start.wait()
+            views.get("cities", build)
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        start.set()
+        for t in threads:
+            t.join()
+        
+        assert len(calls) == 1
@@ -0,0 +1,68 @@
+import pytest
+from lexical_index import LexicalIndex, lexical_tokens, reciprocal_rank_fusion
+
+
+DOCS = [
+    "Restaurant BOLKIRI Ivry\nSitué à 12 rue Jean Jaurès, 94200 Ivry-sur-Seine\nTéléphone: +33 1 48 47 00 05",
+    "Restaurant BOLKIRI Montrouge\nSitué à 5 avenue Verdier, 92120 Montrouge\nTéléphone: 01 55 99 17 74",
+    "Menu BOLKIRI : Phở Bò, Bánh Mì poulet, Bò Bún végétarien",
+    "Carte BOLKIRI : Bánh Mì tofu, nems, desserts",
+    "Programme fidélité BOLKIRI : cumulez des points",
+]
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex(DOCS)
+
+
+class TestLexicalTokens:
+    """Accent-insensitive tokenization"""
+
+    def test_accents_folded(self):
+        assert lexical_tokens("Phở Bò") == ['pho', 'bo']
+
+    def test_phone_collapsed(self):
+        """Spaced and +33 forms map to the same digits token"""
+        assert lexical_tokens("+33 1 48 47 00 05") == ['0148470005']
+        assert lexical_tokens("appeler le 01.48.47.00.05") == ['appeler', 'le', '0148470005']
+
+
+class TestLexicalIndex:
+    """BM25 ranking and the decisive lexical shortcut"""
+
+    def test_dish_name_ranked_first(self, index):
+        results = index.search("pho bo", top_k=3)
+
+        assert results[0][0] == 2
+
+    def test_accent_insensitive_query(self, index):
+        assert index.search("VEGETARIEN")[0][0] == 2
+        assert index.search("fidelité")[0][0] == 4
+
+    def test_stopwords_and_common_terms_ignored(self, index):
+        """'bolkiri' appears in every document and carries no signal"""
+        assert index.search("quelle est la carte bolkiri")[0][0] == 3
+        assert index.search("bolkiri") == []
+
+    def test_phone_is_decisive(self, index):
+        assert index.decisive("0148470005") == index.search("01 48 47 00 05")[:1]
+        assert index.decisive("0148470005")[0][0] == 0
+
+    def test_postal_code_is_decisive(self, index):
+        assert index.decisive("92120")[0][0] == 1
+
+    def test_ambiguous_query_not_decisive(self, index):
+        """Each document matches only half of the query - let the dense retriever decide"""
+        assert index.decisive("nems verdier") == []
+
+    def test_unknown_terms_not_decisive(self, index):
+        assert index.decisive("parking") == []
+
+
+class TestReciprocalRankFusion:
+
+    def test_documents_in_both_lists_win(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]])
+
+        assert [idx for idx, _ in fused] == [1, 3, 2]
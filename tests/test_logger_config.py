@@ -0,0 +1,193 @@
+import io
+import json
+import logging
+import threading
+import time
+import pytest
+import tracing
+from logger_config import AsyncJSONHandler, JSONFormatter, TraceIdFilter
+
+
+class GatedStream(io.StringIO):
+    """Stream whose writes block until the test opens the gate"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def write(self, text):
+        self.gate.wait(5)
+        return super().write(text)
+
+
+def make_logger(handler: AsyncJSONHandler, name: str) -> logging.Logger:
+    handler.setFormatter(JSONFormatter())
+    handler.addFilter(TraceIdFilter())
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def lines_of(stream) -> list:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.fixture
+def handlers():
+    created = []
+    yield created
+    for handler in created:
+        if hasattr(handler.stream, 'gate'):
+            handler.stream.gate.set()
+        handler.close()
+
+
+def test_formatter_timestamp_and_extras():
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "Tool %s", ("menu",), None)
+    record.created = 1700000000.25
+    record.latency_ms = 12.5
+    record.extra = {'custom': 'value'}
+
+    data = json.loads(JSONFormatter().format(record))
+
+    assert data['timestamp'] == "2023-11-14T22:13:20.250000Z"
+    assert data['message'] == "Tool menu"
+    assert data['latency_ms'] == 12.5
+    assert data['custom'] == 'value'
+
+
+def test_formatter_serializes_unexpected_types():
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "hello", None, None)
+    record.index_stats = {'built_at': object()}
+
+    data = json.loads(JSONFormatter().format(record))
+
+    assert isinstance(data['index_stats']['built_at'], str)
+
+
+def test_records_written_by_background_thread(handlers):
+    stream = io.StringIO()
+    handler = AsyncJSONHandler(stream, capacity=100, batch_size=10)
+    handlers.append(handler)
+    logger = make_logger(handler, "test_async_written")
+
+    for i in range(25):
+        logger.info("message %d", i)
+    handler.flush()
+
+    messages = [line['message'] for line in lines_of(stream)]
+    assert messages == [f"message {i}" for i in range(25)]
+    assert handler.stats['written'] == 25
+    assert handler.stats['batches'] >= 3
+
+
+def test_emit_does_not_wait_for_a_blocked_stream(handlers):
+    stream = GatedStream()
+    handler = AsyncJSONHandler(stream, capacity=1000)
+    handlers.append(handler)
+    logger = make_logger(handler, "test_async_blocked")
+
+    start = time.perf_counter()
+    for i in range(200):
+        logger.warning("message %d", i)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 1.0
+    stream.gate.set()
+    handler.flush()
+    assert len(lines_of(stream)) == 200
+
+
+def test_full_queue_drops_and_reports(handlers):
+    stream = GatedStream()
+    handler = AsyncJSONHandler(stream, capacity=10, batch_size=100)
+    handlers.append(handler)
+    logger = make_logger(handler, "test_async_full")
+
+    for i in range(50):
+        logger.error("message %d", i)
+    stream.gate.set()
+    handler.flush()
+    logger.error("after")
+    handler.flush()
+
+    lines = lines_of(stream)
+    assert handler.stats['dropped'] > 0
+    assert handler.stats['queued'] + handler.stats['dropped'] == 51
+    reports = [line for line in lines if line['message'] == "Log records dropped"]
+    assert sum(report['dropped'] for report in reports) == handler.stats['dropped']
+    assert reports[0]['level'] == "WARNING"
+
+
+def test_info_sampled_once_half_full_warnings_kept(handlers):
+    stream = GatedStream()
+    handler = AsyncJSONHandler(stream, capacity=40, sample_rate=5)
+    handlers.append(handler)
+    logger = make_logger(handler, "test_async_sampled")
+
+    # The writer takes the first record and blocks on it: the rest stays queued
+    logger.info("first")
+    time.sleep(0.05)
+    for i in range(20):
+        logger.info("fill %d", i)
+    for i in range(10):
+        logger.info("sampled %d", i)
+    logger.warning("kept")
+    stream.gate.set()
+    handler.flush()
+
+    messages = [line['message'] for line in lines_of(stream)]
+    assert handler.stats['sampled_out'] == 8
+    assert len([m for m in messages if m.startswith("sampled")]) == 2
+    assert "kept" in messages
+
+
+def test_trace_id_captured_in_logging_thread(handlers):
+    stream = io.StringIO()
+    handler = AsyncJSONHandler(stream)
+    handlers.append(handler)
+    logger = make_logger(handler, "test_async_trace")
+
+    with tracing.bind_trace_id("req-42"):
+        logger.info("inside")
+    logger.info("outside")
+    handler.flush()
+
+    lines = lines_of(stream)
+    assert lines[0]['trace_id'] == "req-42"
+    assert 'trace_id' not in lines[1]
+
+
+def test_exception_and_arguments_frozen_at_emit(handlers):
+    stream = GatedStream()
+    handler = AsyncJSONHandler(stream)
+    handlers.append(handler)
+    logger = make_logger(handler, "test_async_exception")
+    state = {'step': 1}
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed at %s", state)
+    state['step'] = 2
+    stream.gate.set()
+    handler.flush()
+
+    line = lines_of(stream)[0]
+    assert line['message'] == "failed at {'step': 1}"
+    assert "ValueError: boom" in line['exception']
+
+
+def test_close_drains_queue():
+    stream = io.StringIO()
+    handler = AsyncJSONHandler(stream)
+    logger = make_logger(handler, "test_async_close")
+
+    for i in range(5):
+        logger.info("message %d", i)
+    handler.close()
+
+    assert len(lines_of(stream)) == 5
@@ -0,0 +1,147 @@
+import threading
+import time
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import Mock
+from page_fetcher import PageCache, PageFetcher
+
+
+def _response(status=200, body=b"", headers=None):
+    response = Mock()
+    response.status_code = status
+    response.content = body
+    response.headers = headers or {}
+    if status >= 400:
+        response.raise_for_status.side_effect = Exception(f"HTTP {status}")
+    else:
+        response.raise_for_status.return_value = None
+    return response
+
+
+class FakeSession:
+    """Serves queued responses per URL and records request headers"""
+
+    def __init__(self, responses, delay=0.0):
+        self.responses = {url: list(queue) for url, queue in responses.items()}
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        with self._lock:
+            self.requests.append((url, dict(headers or {})))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            return self.responses[url].pop(0)
+
+    def close(self):
+        pass
+
+
+URL = "https://bolkiri.fr/la-carte/"
+
+
+class TestPageFetcher:
+    """Conditional GETs and change detection"""
+
+    def test_conditional_get_after_first_fetch(self):
+        session = FakeSession({URL: [
+            _response(body=b"<html>v1</html>", headers={'ETag': '"abc"', 'Last-Modified': 'Thu, 01 Oct 2026 10:00:00 GMT'}),
+            _response(status=304),
+        ]})
+        fetcher = PageFetcher(session=session)
+
+        first = fetcher.fetch(URL)
+        second = fetcher.fetch(URL)
+
+        assert first['status'] == 'fetched' and first['changed']
+        assert session.requests[0][1] == {}
+        assert session.requests[1][1] == {'If-None-Match': '"abc"', 'If-Modified-Since': 'Thu, 01 Oct 2026 10:00:00 GMT'}
+        assert second['status'] == 'not_modified' and not second['changed']
+        assert second['body'] == b"<html>v1</html>"
+
+    def test_same_body_without_validators_is_unchanged(self):
+        session = FakeSession({URL: [_response(body=b"same"), _response(body=b"same"), _response(body=b"new")]})
+        fetcher = PageFetcher(session=session)
+
+        statuses = [fetcher.fetch(URL)['status'] for _ in range(3)]
+
+        assert statuses == ['fetched', 'unchanged', 'fetched']
+
+    def test_error_serves_cached_body(self):
+        session = FakeSession({URL: [_response(body=b"v1"), _response(status=503)]})
+        fetcher = PageFetcher(session=session)
+        fetcher.fetch(URL)
+
+        result = fetcher.fetch(URL)
+
+        assert result['status'] == 'error'
+        assert result['body'] == b"v1"
+        assert fetcher.stats['errors'] == 1
+
+    def test_per_host_concurrency(self):
+        urls = [f"https://restaurants.bolkiri.fr/{i}/" for i in range(8)]
+        session = FakeSession({url: [_response(body=url.encode())] for url in urls}, delay=0.05)
+        fetcher = PageFetcher(session=session, max_workers=8, per_host=2)
+
+        results = fetcher.fetch_all(urls)
+
+        assert list(results) == urls
+        assert session.max_in_flight == 2
+
+
+def _title(url, body):
+    return {'url': url, 'body': body.decode()}
+
+
+class TestFetchParsed:
+    """Only changed bodies are parsed, results persist across runs"""
+
+    def test_unchanged_page_not_parsed_again(self, tmp_path):
+        db_path = str(tmp_path / "pages.db")
+        parse = Mock(return_value={'title': 'La carte'})
+        first = PageFetcher(PageCache(db_path), session=FakeSession({URL: [_response(body=b"v1", headers={'ETag': '"1"'})]}))
+        assert first.fetch_parsed([URL], "page:1", parse) == {URL: {'title': 'La carte'}}
+        first.close()
+
+        second = PageFetcher(PageCache(db_path), session=FakeSession({URL: [_response(status=304)]}))
+        result = second.fetch_parsed([URL], "page:1", parse)
+
+        assert result == {URL: {'title': 'La carte'}}
+        assert parse.call_count == 1
+
+    def test_new_parser_version_reparses_cached_body(self):
+        fetcher = PageFetcher(session=FakeSession({URL: [_response(body=b"v1", headers={'ETag': '"1"'}), _response(status=304)]}))
+        fetcher.fetch_parsed([URL], "page:1", lambda url, body: {'v': 1})
+
+        result = fetcher.fetch_parsed([URL], "page:2", lambda url, body: {'v': 2, 'body': body.decode()})
+
+        assert result == {URL: {'v': 2, 'body': 'v1'}}
+
+    def test_failed_parse_left_out(self):
+        fetcher = PageFetcher(session=FakeSession({URL: [_response(body=b"v1")]}))
+
+        assert fetcher.fetch_parsed([URL], "page:1", lambda url, body: None) == {}
+
+    def test_returned_data_is_a_copy(self):
+        fetcher = PageFetcher(session=FakeSession({URL: [_response(body=b"v1"), _response(body=b"v1")]}))
+        fetcher.fetch_parsed([URL], "page:1", lambda url, body: {'content': 'x'})[URL]['content'] += ' lien'
+
+        assert fetcher.fetch_parsed([URL], "page:1", Mock())[URL] == {'content': 'x'}
+
+    def test_parsing_in_process_pool(self):
+        urls = [f"https://bolkiri.fr/{i}/" for i in range(4)]
+        fetcher = PageFetcher(session=FakeSession({url: [_response(body=url.encode())] for url in urls}))
+
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            results = fetcher.fetch_parsed(urls, "page:1", _title, pool)
+
+        assert list(results) == urls
+        assert results[urls[2]] == {'url': urls[2], 'body': urls[2]}
+        assert fetcher.stats['parsed'] == 4
+        assert fetcher.stats['parse_cpu_ms'] >= 0
@@ -315,6 +315,318 @@ class TestPerformance:
 
 
 # Integration tests
+def _random_batch(texts):
+    return np.random.rand(len(texts), 1536).astype(np.float32)
+
+
+def _build_engine(data, batch_fn=_random_batch):
+    """RAGEngine over in-memory KB data with a fake embeddings batch call"""
+    with patch.object(RAGEngine, '_load_knowledge', return_value=data), \
+         patch.object(RAGEngine, '_get_embeddings_batch', side_effect=batch_fn) as batch:
+        engine = RAGEngine(knowledge_file="test.json")
+    return engine, batch
+
+
+@pytest.fixture
+def isolated_store(tmp_path, monkeypatch):
+    monkeypatch.setenv('VECTOR_STORE_DIR', str(tmp_path / "vector_store"))
+    monkeypatch.setenv('EMBEDDING_CACHE_DB', '')
+
+
+def _axis(i, scale=1.0):
+    vector = np.zeros(1536, dtype=np.float32)
+    vector[i] = scale
+    return vector
+
+
+@pytest.mark.usefixtures("isolated_store")
+class TestIndexStartup:
+    """Persisted vectors are reused and only drifted documents re-embedded"""
+    
+    @staticmethod
+    def _engine(data):
+        return _build_engine(data)
+    
+    def test_restart_reuses_index(self):
+        data = {"restaurants": [{"name": "Bolkiri Ivry"}, {"name": "Bolkiri Lognes"}]}
+        first, _ = self._engine(data)
+        second, batch = self._engine(data)
+        
+        assert first.index_stats['mode'] == 'rebuilt'
+        assert second.index_stats['mode'] == 'reused'
+        assert second.index_stats['reused'] == 2
+        assert not batch.called
+        assert second.index.ntotal == 2
+    
+    def test_stored_vectors_normalized_and_mapped_without_copy(self):
+        data = {"restaurants": [{"name": "Bolkiri Ivry"}, {"name": "Bolkiri Lognes"}]}
+        engine, _ = self._engine(data)
+        stored = engine.vector_store.vectors
+        
+        assert np.allclose(np.linalg.norm(stored, axis=1), 1.0, atol=1e-5)
+        assert np.shares_memory(RAGEngine._normalized(stored), stored)
+        assert not hasattr(engine, 'embeddings')
+    
+    def test_unnormalized_store_normalized_in_copy(self):
+        vectors = np.full((2, 4), 2.0, dtype=np.float32)
+        vectors.flags.writeable = False
+        
+        normalized = RAGEngine._normalized(vectors)
+        
+        assert not np.shares_memory(normalized, vectors)
+        assert np.allclose(np.linalg.norm(normalized, axis=1), 1.0)
+    
+    def test_content_drift_rebuilds_changed_only(self):
+        self._engine({"restaurants": [{"name": "Bolkiri Ivry"}, {"name": "Bolkiri Lognes"}]})
+        engine, batch = self._engine({"restaurants": [
+            {"name": "Bolkiri Ivry"},
+            {"name": "Bolkiri Lognes", "telephone": "01 23 45 67 89"}
+        ]})
+        
+        assert engine.index_stats['mode'] == 'incremental'
+        assert engine.index_stats['changed_ids'] == ['resto_Bolkiri Lognes']
+        assert len(batch.call_args[0][0]) == 1
+
+
+@pytest.mark.usefixtures("isolated_store")
+class TestIncrementalUpdate:
+    """New KB version diffed by document ID and text hash, old engine untouched"""
+    
+    DATA = {
+        "pages_par_categorie": {
+            "menu": [{"url": "https://bolkiri.fr/la-carte/", "title": "Plat: Pho", "content": "Pho au boeuf"}],
+            "autres": [{"url": "https://bolkiri.fr/fidelite/", "title": "Fidélité", "content": "1€ = 1 grain de riz"}]
+        },
+        "restaurants": [{"name": "Bolkiri Ivry"}, {"name": "Bolkiri Lognes"}]
+    }
+    
+    @staticmethod
+    def _updated(engine, data):
+        with patch.object(RAGEngine, '_get_embeddings_batch', side_effect=_random_batch) as batch:
+            return engine.updated(data), batch
+    
+    def test_engine_indexes_data_it_is_given(self):
+        """The KB passes the data it hashed: the engine never reads the file a second time"""
+        with patch.object(RAGEngine, '_load_knowledge') as load, \
+             patch.object(RAGEngine, '_get_embeddings_batch', side_effect=_random_batch):
+            engine = RAGEngine(knowledge_file="missing.json", data=self.DATA)
+        
+        load.assert_not_called()
+        assert engine.data is self.DATA
+        assert len(engine.documents) == 4
+    
+    def test_page_ids_stable_across_reordering(self):
+        engine, _ = _build_engine(self.DATA)
+        reordered = dict(self.DATA, pages_par_categorie={
+            "autres": self.DATA["pages_par_categorie"]["autres"],
+            "menu": self.DATA["pages_par_categorie"]["menu"]
+        })
+        
+        diff = engine.diff_documents(self._updated(engine, reordered)[0].documents)
+        
+        assert diff['added'] == diff['updated'] == diff['removed'] == []
+    
+    def test_only_changed_documents_embedded(self):
+        engine, _ = _build_engine(self.DATA)
+        data = dict(self.DATA, restaurants=[
+            {"name": "Bolkiri Ivry", "telephone": "01 23 45 67 89"},
+            {"name": "Bolkiri Bondy"}
+        ])
+        
+        new_engine, batch = self._updated(engine, data)
+        
+        assert sorted(batch.call_args[0][0]) == sorted(
+            doc['text'] for doc in new_engine.documents if doc['title'] in ("Bolkiri Ivry", "Bolkiri Bondy")
+        )
+        stats = new_engine.index_stats
+        assert (stats['added'], stats['updated'], stats['removed']) == (1, 1, 1)
+        assert stats['removed_ids'] == ['resto_Bolkiri Lognes']
+        assert new_engine.index.ntotal == 4
+    
+    def test_unchanged_vectors_copied(self):
+        engine, _ = _build_engine(self.DATA)
+        data = dict(self.DATA, restaurants=[{"name": "Bolkiri Lognes"}])
+        
+        new_engine, _ = self._updated(engine, data)
+        
+        old_row = next(i for i, doc in enumerate(engine.documents) if doc['title'] == "Bolkiri Lognes")
+        new_row = next(i for i, doc in enumerate(new_engine.documents) if doc['title'] == "Bolkiri Lognes")
+        assert np.array_equal(new_engine.index.reconstruct(new_row), engine.index.reconstruct(old_row))
+    
+    def test_live_engine_untouched(self):
+        engine, _ = _build_engine(self.DATA)
+        documents = list(engine.documents)
+        
+        new_engine, _ = self._updated(engine, dict(self.DATA, restaurants=[{"name": "Bolkiri Bondy"}]))
+        
+        assert engine.documents == documents
+        assert engine.index.ntotal == 4
+        assert new_engine.index is not engine.index
+        assert new_engine.search("Bondy", filters={'type': 'restaurant'})[0]['title'] == "Bolkiri Bondy"
+        assert engine._filter_ids({'ville': 'Bondy'})[0].size == 0
+
+
+@pytest.mark.usefixtures("isolated_store")
+class TestCosineSearch:
+    """Inner-product index over normalized vectors, cutoff and adaptive top-k"""
+    
+    @pytest.fixture
+    def engine(self):
+        # Ivry along axis 0, Lognes close to it, Mureaux orthogonal
+        vectors = {
+            "Ivry": _axis(0, 5.0),
+            "Lognes": np.array(_axis(0) * 0.95 + _axis(1) * 0.31, dtype=np.float32),
+            "Mureaux": _axis(2, 3.0)
+        }
+        def batch(texts):
+            return np.array([next(v for k, v in vectors.items() if k in t) for t in texts])
+        data = {"restaurants": [{"name": f"Bolkiri {city}"} for city in vectors]}
+        engine, _ = _build_engine(data, batch)
+        return engine
+    
+    @staticmethod
+    def _titles(engine, ranking):
+        return [engine.documents[idx]['title'] for idx, _ in ranking]
+    
+    def test_scores_are_cosine(self, engine):
+        """Vector norms do not affect scores"""
+        ranking = engine._dense_ranking(_axis(0, 0.1), top_k=3, min_score=0.0)
+        
+        assert self._titles(engine, ranking)[0] == "Bolkiri Ivry"
+        assert ranking[0][1] == pytest.approx(1.0, abs=1e-5)
+        assert ranking[1][1] == pytest.approx(0.95, abs=0.01)
+    
+    def test_min_score_cutoff(self, engine):
+        ranking = engine._dense_ranking(_axis(3), top_k=3)
+        
+        assert ranking == []
+    
+    def test_adaptive_top_k_drops_tail(self, engine):
+        """Documents far below the best score are not returned"""
+        engine.score_margin = 0.1
+        ranking = engine._dense_ranking(_axis(0), top_k=3, min_score=-1.0)
+        
+        assert self._titles(engine, ranking) == ["Bolkiri Ivry", "Bolkiri Lognes"]
+
+
+@pytest.mark.usefixtures("isolated_store")
+class TestHybridSearch:
+    """BM25 fused with FAISS, lexical-only shortcut without embedding call"""
+    
+    @pytest.fixture
+    def engine(self):
+        data = {"restaurants": [
+            {"name": "Bolkiri Ivry", "adresse": "12 rue Jean Jaurès, 94200 Ivry-sur-Seine"},
+            {"name": "Bolkiri Montrouge", "adresse": "5 avenue Verdier, 92120 Montrouge"},
+            {"name": "Bolkiri Lognes", "adresse": "1 place du Marché, 77185 Lognes"},
+            {"name": "Bolkiri Bondy", "adresse": "3 rue de Paris, 93140 Bondy"}
+        ]}
+        engine, _ = _build_engine(data, lambda texts: np.array([_axis(i) for i in range(len(texts))]))
+        return engine
+    
+    def test_decisive_lexical_hit_skips_embedding(self, engine):
+        with patch.object(engine, '_get_embedding') as embed:
+            results = engine.search("92120")
+        
+        assert not embed.called
+        assert results[0]['title'] == "Bolkiri Montrouge"
+        assert results[0]['retrieval'] == 'lexical'
+        assert engine.retrieval_stats['lexical_only'] == 1
+    
+    def test_fusion_combines_dense_and_lexical(self, engine):
+        """Dense hit (Ivry) and lexical hit (Lognes) are both returned"""
+        with patch.object(engine, '_get_embedding', return_value=_axis(0)) as embed:
+            results = engine.search("marché verdier", top_k=3)
+        
+        assert embed.called
+        
+        titles = [r['title'] for r in results]
+        assert "Bolkiri Ivry" in titles and "Bolkiri Lognes" in titles
+        assert all(r['retrieval'] == 'hybrid' for r in results)
+    
+    def test_dense_only_when_disabled(self, engine):
+        engine.hybrid = False
+        with patch.object(engine, '_get_embedding', return_value=_axis(1)) as embed:
+            results = engine.search("92120")
+        
+        assert embed.called
+        assert [r['title'] for r in results] == ["Bolkiri Montrouge"]
+
+
+@pytest.mark.usefixtures("isolated_store")
+class TestFilteredSearch:
+    """Metadata filters restrict both FAISS and BM25 to precomputed ID subsets"""
+    
+    @pytest.fixture
+    def engine(self):
+        data = {
+            "pages_par_categorie": {
+                "menu": [{"title": "Carte", "content": "Bo Bun végétarien au tofu"}],
+                "autres": [{"title": "Ouverture Ivry", "content": "Bolkiri Ivry déménage"}]
+            },
+            "restaurants": [
+                {"name": "BOLKIRI Ivry Street Food Viêt"},
+                {"name": "BOLKIRI Lille Gare Flandres Street Food Viêt"},
+                {"name": "BOLKIRI Lille Léon Gambetta Street Food Viêt"}
+            ]
+        }
+        engine, _ = _build_engine(data, lambda texts: np.array([_axis(i) for i in range(len(texts))]))
+        engine.hybrid = False
+        return engine
+    
+    def test_type_filter_excludes_pages(self, engine):
+        """The page is the closest vector but the filter only allows restaurants"""
+        with patch.object(engine, '_get_embedding', return_value=_axis(1) + _axis(2) * 0.9):
+            results = engine.search("Ivry", top_k=3, min_score=0.0, filters={'type': 'restaurant'})
+        
+        assert results and all(r['type'] == 'restaurant' for r in results)
+        assert results[0]['title'] == "BOLKIRI Ivry Street Food Viêt"
+    
+    def test_ville_filter_matches_word_prefix(self, engine):
+        """'Lille' covers both Lille restaurants, 'ivry-sur-seine' covers 'Ivry'"""
+        allowed, _ = engine._filter_ids({'type': 'restaurant', 'ville': 'Lille'})
+        assert sorted(engine.documents[i]['title'] for i in allowed) == [
+            "BOLKIRI Lille Gare Flandres Street Food Viêt",
+            "BOLKIRI Lille Léon Gambetta Street Food Viêt"
+        ]
+        allowed, _ = engine._filter_ids({'ville': 'ivry-sur-seine'})
+        assert [engine.documents[i]['title'] for i in allowed] == ["BOLKIRI Ivry Street Food Viêt"]
+    
+    def test_category_filter(self, engine):
+        with patch.object(engine, '_get_embedding', return_value=_axis(2)):
+            results = engine.search("végétarien", top_k=5, min_score=-1.0, filters={'category': 'menu'})
+        
+        assert [r['title'] for r in results] == ["Carte"]
+    
+    def test_no_matching_documents_skips_embedding(self, engine):
+        with patch.object(engine, '_get_embedding') as embed:
+            results = engine.search("restaurant", filters={'type': 'restaurant', 'ville': 'Marseille'})
+        
+        assert results == []
+        assert not embed.called
+    
+    def test_filter_cache_keyed_on_known_facets(self, engine):
+        """Unknown cities add no entry; spellings of the same city share one"""
+        for ville in ("Marseille", "Nice", "Brest"):
+            engine._filter_ids({'ville': ville})
+        engine._filter_ids({'ville': 'Ivry'})
+        engine._filter_ids({'ville': 'ivry'})
+        
+        assert len(engine._filter_cache) == 1
+    
+    def test_filter_cache_bounded(self, engine):
+        engine.FILTER_CACHE_SIZE = 2
+        for filters in ({'ville': 'Lille'}, {'ville': 'Ivry'}, {'type': 'restaurant'}):
+            engine._filter_ids(filters)
+        
+        assert len(engine._filter_cache) == 2
+        assert (('type', ('restaurant',)),) in engine._filter_cache
+    
+    def test_unknown_filter_field(self, engine):
+        with pytest.raises(ValueError):
+            engine.search("pho", filters={'prix': 10})
+
+
 class TestIntegration:
     """Integration tests with real components"""
     
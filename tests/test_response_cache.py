@@ -0,0 +1,94 @@
+import numpy as np
+from response_cache import ResponseCache, menu_entities, menu_vocabulary
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestResponseCache:
+    """Exact and near-duplicate answers, invalidated per KB version"""
+
+    def test_exact_hit_ignores_case_accents_punctuation(self):
+        cache = ResponseCache()
+        cache.put("Programme fidélité ?", "v1", "10 points par euro")
+
+        assert cache.get("programme FIDELITE", "v1") == "10 points par euro"
+        assert cache.stats()["hits"] == 1
+
+    def test_semantic_hit_above_threshold(self):
+        cache = ResponseCache(min_similarity=0.95)
+        cache.put("avez-vous des plats vegetariens", "v1", "Oui", embedding=_unit(1, 0.1))
+
+        assert cache.get("vous avez du vegetarien ?", "v1", embedding=_unit(1, 0.12)) == "Oui"
+        assert cache.get("livraison ?", "v1", embedding=_unit(0.1, 1)) is None
+        assert cache.stats()["semantic_hits"] == 1
+
+    def test_semantic_hit_requires_same_entities(self):
+        """Similar wording about another city or postal code is a miss"""
+        cache = ResponseCache(min_similarity=0.9)
+        cache.put("horaires Ivry", "v1", "11h-23h", frozenset({"Ivry"}), _unit(1, 0))
+
+        assert cache.get("horaires Bondy", "v1", frozenset({"Bondy"}), _unit(1, 0)) is None
+        assert cache.get("horaires a Ivry", "v1", frozenset({"Ivry"}), _unit(1, 0)) == "11h-23h"
+
+        cache.put("restaurant 94200", "v1", "Ivry", embedding=_unit(0, 1))
+        assert cache.get("restaurant 93140", "v1", embedding=_unit(0, 1)) is None
+
+    def test_semantic_hit_requires_same_dishes_and_diets(self):
+        """Near-identical questions about another dish or diet do not share an answer"""
+        vocabulary = menu_vocabulary(["SOUPE PHÔ AROMATISÉE bouillon et pâte séparé", "NÊMS VÉGÉTARIENS galette de riz"])
+        cache = ResponseCache(min_similarity=0.9)
+
+        def entities(text):
+            return frozenset(menu_entities(text, vocabulary))
+
+        cache.put("prix du pho bo", "v1", "12,90 €", entities("prix du pho bo"), _unit(1, 0))
+        cache.put("plats végétariens", "v1", "Nems végétariens", entities("plats végétariens"), _unit(0, 1))
+
+        assert cache.get("prix du phở gà", "v1", entities("prix du phở gà"), _unit(1, 0)) is None
+        assert cache.get("plats vegans", "v1", entities("plats vegans"), _unit(0, 1)) is None
+        assert cache.get("un plat vegetarien ?", "v1", entities("un plat vegetarien ?"), _unit(0, 1)) == "Nems végétariens"
+
+    def test_menu_entities(self):
+        vocabulary = menu_vocabulary(["NÊMS POULET galette de riz", "entrees"])
+
+        assert menu_entities("Des nems au poulet ?", vocabulary) == {"menu:nem", "menu:poulet"}
+        assert menu_entities("plats végétariennes épicées", vocabulary) == {"menu:vegetarien", "menu:epice"}
+        assert menu_entities("programme de fidélité", vocabulary) == set()
+
+    def test_kb_version_change_invalidates(self):
+        cache = ResponseCache()
+        cache.put("menu", "v1", "old menu")
+
+        assert cache.get("menu", "v2") is None
+        assert cache.stats()["invalidations"] == 1
+        assert cache.stats()["size"] == 0
+
+    def test_entry_ttl(self):
+        clock = FakeClock()
+        cache = ResponseCache(ttl_seconds=60, clock=clock)
+        cache.put("menu", "v1", "menu")
+        clock.now += 61
+
+        assert cache.get("menu", "v1") is None
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_size=2)
+        cache.put("a", "v1", "A")
+        cache.put("b", "v1", "B")
+        cache.get("a", "v1")
+        cache.put("c", "v1", "C")
+
+        assert cache.get("b", "v1") is None
+        assert cache.get("a", "v1") == "A"
+        assert cache.stats()["evictions"] == 1
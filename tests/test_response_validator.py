@@ -0,0 +1,93 @@
+import time
+import pytest
+from response_validator import ResponseValidator, strip_markdown
+
+
+MAPPING = {"91": "Corbeil-Essonnes", "essonne": "Corbeil-Essonnes", "94": "Ivry-sur-Seine",
+           "val-de-marne": "Ivry-sur-Seine"}
+
+
+@pytest.fixture
+def validator():
+    return ResponseValidator(MAPPING)
+
+
+def _checks(report):
+    return [finding['check'] for finding in report['findings']]
+
+
+class TestScan:
+    def test_single_pass_extraction(self, validator):
+        found = validator.scan("Bolkiri Corbeil-Essonnes (91) ouvert 11h30-14h30, Phở 12,90 €")
+
+        assert [hours for _, hours in found['hours']] == [(11, 30, 14, 30)]
+        assert [euros for _, _, euros in found['prices']] == [12.9]
+        assert found['cities'] == {"corbeil-essonnes"}
+        assert "91" in found['numbers']
+
+    def test_longest_city_wins(self):
+        validator = ResponseValidator({"94": "Ivry", "95": "Ivry-sur-Seine"})
+
+        assert validator.scan("IVRY-SUR-SEINE")['cities'] == {"ivry-sur-seine"}
+
+
+class TestValidate:
+    def test_consistent_answer(self, validator):
+        report = validator.validate("Ouvert de 11h30 - 14h30, bobun 12,90€",
+                                    "Horaires: 11:30-14:30. Bobun 12,90 €", "horaires")
+
+        assert report == {'valid': True, 'response': "Ouvert de 11h30 - 14h30, bobun 12,90€", 'findings': []}
+
+    def test_restaurant_denial_names_department(self, validator):
+        report = validator.validate("Nous n'avons pas de restaurant dans le 91.",
+                                    "[Restaurant trouvé] Bolkiri Corbeil-Essonnes - Essonne 91", "restaurant 91")
+
+        assert _checks(report) == ['restaurant', 'department']
+        assert report['findings'][0]['department'] == "91"
+
+    def test_restaurant_denial_without_department(self, validator):
+        report = validator.validate("Malheureusement pas.", "Nos restaurants", "vous êtes où ?")
+
+        assert report['findings'] == [{'check': 'restaurant', 'phrase': "malheureusement pas", 'department': None}]
+
+    def test_wrong_hours_replaced(self, validator):
+        report = validator.validate("Ouvert 10h00-22h00", "Horaires: 11:30-14:30", "horaires")
+
+        assert _checks(report) == ['hours']
+        assert report['response'] == "Ouvert 11:30-14:30"
+
+    def test_price_without_context_price(self, validator):
+        report = validator.validate("Le Pho Bo coûte 15€", "Pho Bo prix: (vide)", "prix")
+
+        assert report['findings'][0]['reason'] == 'no_context_price'
+        assert "15€" not in report['response']
+        assert "Prix disponibles" in report['response']
+
+    def test_aberrant_price(self, validator):
+        report = validator.validate("Le Pho Bo coûte 45 €", "Pho Bo 12,90 €", "prix")
+
+        assert report['findings'][0]['reason'] == 'aberrant'
+        assert report['response'] == "Le Pho Bo coûte 12,90 €"
+
+
+def test_strip_markdown():
+    assert strip_markdown("**Bobun** et *nems* __signature__ _maison_") == "Bobun et nems signature maison"
+
+
+def test_validate_microbenchmark(validator):
+    """One validation over a realistic context stays well under a millisecond"""
+    context = "\n".join(
+        f"[Restaurant trouvé] Bolkiri {city} - Horaires: 11:30-14:30, 18:30-22:30 - Bobun {price},90 €"
+        for city, price in [("Corbeil-Essonnes", 12), ("Ivry-sur-Seine", 13)] * 20
+    )
+    response = "Le Bolkiri Ivry-sur-Seine est ouvert de 11h30 à 14h30 et de 18:30-22:30. Bobun 13,90 €."
+    validator.validate(response, context, "horaires ivry 94")
+
+    runs = 200
+    start = time.perf_counter()
+    for _ in range(runs):
+        report = validator.validate(response, context, "horaires ivry 94")
+    per_call_ms = (time.perf_counter() - start) / runs * 1000
+
+    assert report['valid']
+    assert per_call_ms < 2
@@ -0,0 +1,76 @@
+import pytest
+from restaurant_index import RestaurantIndex
+
+
+RESTAURANTS = [
+    {"name": "BOLKIRI Bry-sur-Marne Street Food Viêt", "adresse": "6 Pl. Carnot, 94360 Bry-Sur-Marne",
+     "url": "https://restaurants.bolkiri.fr/street-food-vietnamienne/bry-sur-marne/"},
+    {"name": "BOLKIRI Corbeil-Essonnes Street Food Viêt", "adresse": "78 Bd Jean Jaurès, 91100 Corbeil-Essonnes",
+     "url": "https://restaurants.bolkiri.fr/street-food-vietnamienne/corbeil-essonnes/"},
+    {"name": "BOLKIRI Ivry Street Food Viêt", "adresse": "Avenue Maurice Thorez, 94200 Ivry-sur-Seine",
+     "url": "https://restaurants.bolkiri.fr/street-food-vietnamienne/ivry/"},
+    {"name": "BOLKIRI Paris 11 Street Food Viêt", "adresse": "22 Av. de la République, 75011 Paris",
+     "url": "https://restaurants.bolkiri.fr/street-food-vietnamienne/paris-11-republique/"},
+    {"name": "BOLKIRI Street Food Viêt Saint-Denis (Pierrefitte) ",
+     "adresse": "1 Boulevard Charles de Gaulle, 93380 Pierrefitte-Sur-Seine",
+     "url": "https://restaurants.bolkiri.fr/street-food-vietnamienne/pierrefitte/"},
+    {"name": "BOLKIRI Lille Léon Gambetta Street Food Viêt", "adresse": "203 Rue Léon Gambetta, 59000 Lille"},
+    {"name": "BOLKIRI Lille Gare Flandres Street Food Viêt", "adresse": "5 Rue du Priez, 59800 Lille"},
+]
+
+
+@pytest.fixture
+def index():
+    return RestaurantIndex(RESTAURANTS)
+
+
+def _cities(restaurants):
+    return [RestaurantIndex.city_from_name(r["name"]) for r in restaurants]
+
+
+class TestRestaurantIndex:
+    """Exact, alias and fuzzy restaurant lookups"""
+
+    @pytest.mark.parametrize("query,expected", [
+        ("Ivry", ["Ivry"]),
+        ("ivry-sur-seine", ["Ivry"]),
+        ("IVRY SUR SEINE", ["Ivry"]),
+        ("ivrysurseine", ["Ivry"]),
+        ("94200", ["Ivry"]),
+        ("Corbeil", ["Corbeil-Essonnes"]),
+        ("paris-11-republique", ["Paris 11"]),
+        ("75011", ["Paris 11"]),
+        ("Pierrefitte", ["Saint-Denis (Pierrefitte)"]),
+        ("restaurant Bolkiri à Bry", ["Bry-sur-Marne"]),
+    ])
+    def test_exact_and_alias_keys(self, index, query, expected):
+        assert _cities(index.lookup(query)) == expected
+
+    def test_department_code_and_name(self, index):
+        """Departments resolve to every restaurant with a matching postal code"""
+        assert _cities(index.lookup("94")) == ["Bry-sur-Marne", "Ivry"]
+        assert _cities(index.lookup("Val-de-Marne")) == ["Bry-sur-Marne", "Ivry"]
+        assert _cities(index.lookup("essonne")) == ["Corbeil-Essonnes"]
+
+    def test_unknown_postal_code_falls_back_to_department(self, index):
+        assert _cities(index.lookup("94300")) == ["Bry-sur-Marne", "Ivry"]
+
+    def test_ambiguous_city_returns_all(self, index):
+        assert len(index.lookup("Lille")) == 2
+
+    def test_fuzzy_typo(self, index):
+        assert _cities(index.lookup("Corbeil Essone")) == ["Corbeil-Essonnes"]
+        assert _cities(index.lookup("Ivri sur Seine")) == ["Ivry"]
+
+    def test_no_match(self, index):
+        assert index.lookup("Marseille") == []
+        assert index.lookup("bolkiri") == []
+        assert index.find("Marseille") is None
+
+    def test_department_mapping_from_postal_codes(self, index):
+        mapping = index.department_mapping()
+
+        assert mapping["94"] == "Bry-sur-Marne"
+        assert mapping["val-de-marne"] == "Bry-sur-Marne"
+        assert mapping["75"] == "Paris 11"
+        assert "77" not in mapping
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from unittest.mock import MagicMock
+import pytest
+import tracing
+from logger_config import JSONFormatter, TraceIdFilter
+from tracing import Metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    tracing.metrics.reset()
+    yield
+    tracing.metrics.reset()
+
+
+class TestMetrics:
+    def test_histogram_buckets_are_cumulative(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            metrics.observe("latency", value, stage="x")
+
+        hist = metrics.histogram("latency", stage="x")
+
+        assert hist['buckets'] == {0.1: 1, 1.0: 2}
+        assert hist['count'] == 3
+        assert hist['sum'] == pytest.approx(5.55)
+
+    def test_render_prometheus_text(self):
+        metrics = Metrics(buckets=(0.1,))
+        metrics.describe("requests_total", "Requests")
+        metrics.inc("requests_total", kind="chat", status="ok")
+        metrics.observe("latency_seconds", 0.05, stage='say "hi"')
+
+        text = metrics.render()
+
+        assert '# HELP requests_total Requests' in text
+        assert 'requests_total{kind="chat",status="ok"} 1' in text
+        assert 'latency_seconds_bucket{stage="say \\"hi\\"",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 1' in text
+        assert 'latency_seconds_count{stage="say \\"hi\\""} 1' in text
+
+
+class TestTrace:
+    def test_stages_collected_and_summed(self):
+        finished = []
+        with tracing.trace("chat", on_finish=finished.append) as record:
+            with tracing.span("embedding"):
+                pass
+            with tracing.span("embedding"):
+                pass
+            tracing.record_tool("get_menu", 0.02, "ok")
+            assert tracing.current_trace_id() == record['trace_id']
+
+        assert finished == [record]
+        assert set(record['stages']) == {"embedding", "tool:get_menu"}
+        assert record['stages']["tool:get_menu"] == 20.0
+        assert record['total_ms'] is not None
+        assert tracing.current_trace_id() is None
+        assert tracing.metrics.histogram("bolkiri_stage_seconds", stage="embedding")['count'] == 2
+        assert tracing.metrics.histogram("bolkiri_stage_seconds", stage="tool:get_menu") is None
+        assert tracing.metrics.counter("bolkiri_tool_calls_total", tool="get_menu", status="ok") == 1
+        assert tracing.metrics.counter("bolkiri_requests_total", kind="chat", status="ok") == 1
+
+    def test_error_status(self):
+        with pytest.raises(ValueError):
+            with tracing.trace("chat"):
+                raise ValueError("boom")
+
+        assert tracing.metrics.counter("bolkiri_requests_total", kind="chat", status="error") == 1
+
+    def test_reuses_bound_trace_id(self):
+        with tracing.bind_trace_id("abc123"):
+            with tracing.trace("chat") as record:
+                pass
+
+        assert record['trace_id'] == "abc123"
+
+    def test_concurrent_tasks_keep_their_own_trace(self):
+        async def turn(name):
+            with tracing.trace("chat") as record:
+                with tracing.span(name):
+                    await asyncio.sleep(0.01)
+            return record
+
+        async def main():
+            return await asyncio.gather(turn("a"), turn("b"))
+
+        first, second = asyncio.run(main())
+
+        assert list(first['stages']) == ["a"] and list(second['stages']) == ["b"]
+        assert first['trace_id'] != second['trace_id']
+
+    def test_copied_context_reaches_threads(self):
+        with tracing.trace("chat") as record:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pool.submit(contextvars.copy_context().run, tracing.record_stage, "faiss", 0.001).result()
+
+        assert "faiss" in record['stages']
+
+
+def test_token_usage_counters():
+    usage = MagicMock(prompt_tokens=1200, completion_tokens=80)
+    usage.prompt_tokens_details.cached_tokens = 1024
+
+    assert tracing.record_usage("answer", usage) == {'prompt': 1200, 'completion': 80, 'cached': 1024}
+    assert tracing.record_usage("answer", None) is None
+    assert tracing.metrics.counter("bolkiri_openai_requests_total", stage="answer") == 1
+    assert tracing.metrics.counter("bolkiri_openai_tokens_total", stage="answer", kind="cached") == 1024
+
+
+def test_trace_id_on_log_lines():
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "hello", None, None)
+    with tracing.bind_trace_id("abc123"):
+        TraceIdFilter().filter(record)
+
+    assert json.loads(JSONFormatter().format(record))["trace_id"] == "abc123"
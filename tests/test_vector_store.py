@@ -0,0 +1,143 @@
+import os
+import pytest
+import numpy as np
+from vector_store import VectorStore
+
+DIM = 4
+
+
+class _Embedder:
+    """Deterministic fake embedding function that records what it was asked to embed"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([np.full(DIM, len(t), dtype=np.float32) for t in texts])
+
+
+class TestVectorStore:
+    """Content-addressed, memory-mapped document vectors"""
+
+    def test_first_sync_embeds_everything(self, tmp_path):
+        store = VectorStore(str(tmp_path), dim=DIM)
+        embed = _Embedder()
+
+        vectors, stats = store.sync(["a", "bb", "ccc"], embed)
+
+        assert embed.calls == [["a", "bb", "ccc"]]
+        assert stats == {'reused': 0, 'embedded': 3, 'pruned': 0, 'changed': [0, 1, 2]}
+        assert vectors.shape == (3, DIM)
+        assert vectors[2][0] == 3
+
+    def test_concurrent_worker_reuses_vectors_embedded_meanwhile(self, tmp_path):
+        """Two workers opened before either synced: the second one embeds nothing"""
+        first = VectorStore(str(tmp_path), dim=DIM)
+        second = VectorStore(str(tmp_path), dim=DIM)
+        first.sync(["a", "bb"], _Embedder())
+
+        embed = _Embedder()
+        vectors, stats = second.sync(["a", "bb"], embed)
+
+        assert embed.calls == []
+        assert stats['reused'] == 2
+        assert vectors[1][0] == 2
+
+    def test_restart_reuses_memmap(self, tmp_path):
+        """A fresh instance loads vectors from disk without calling the embedder"""
+        VectorStore(str(tmp_path), dim=DIM).sync(["a", "bb"], _Embedder())
+
+        store = VectorStore(str(tmp_path), dim=DIM)
+        embed = _Embedder()
+        vectors, stats = store.sync(["a", "bb"], embed)
+
+        assert embed.calls == []
+        assert stats['reused'] == 2
+        assert isinstance(store.vectors, np.memmap)
+        assert vectors[1][0] == 2
+
+    def test_only_changed_documents_embedded(self, tmp_path):
+        store = VectorStore(str(tmp_path), dim=DIM)
+        store.sync(["a", "bb", "ccc"], _Embedder())
+
+        embed = _Embedder()
+        vectors, stats = store.sync(["a", "bbbb", "ccc"], embed)
+
+        assert embed.calls == [["bbbb"]]
+        assert stats['embedded'] == 1 and stats['reused'] == 2
+        assert [v[0] for v in vectors] == [1, 4, 3]
+
+    def test_stale_rows_compacted(self, tmp_path):
+        store = VectorStore(str(tmp_path), dim=DIM)
+        store.sync(["a", "bb"], _Embedder())
+
+        vectors, stats = store.sync(["ccc"], _Embedder())
+
+        assert stats['pruned'] == 2
+        assert len(store.vectors) == 1
+        assert vectors[0][0] == 3
+
+    def test_interrupted_append_discarded(self, tmp_path):
+        """Rows written after the last manifest update are ignored, then overwritten by the next sync"""
+        store = VectorStore(str(tmp_path), dim=DIM)
+        store.sync(["a"], _Embedder())
+        with open(store.vectors_path, 'ab') as f:
+            f.write(np.ones(DIM, dtype=np.float32).tobytes())
+
+        reloaded = VectorStore(str(tmp_path), dim=DIM)
+        assert len(reloaded.vectors) == 1
+
+        vectors, _ = reloaded.sync(["a", "bbb"], _Embedder())
+
+        assert vectors[1][0] == 3
+        assert os.path.getsize(store.vectors_path) == 2 * DIM * 4
+
+    def test_load_leaves_unpublished_rows_alone(self, tmp_path):
+        """A worker starting while another is mid-sync must not cut the rows it is about to publish"""
+        store = VectorStore(str(tmp_path), dim=DIM)
+        store.sync(["a"], _Embedder())
+        with open(store.vectors_path, 'ab') as f:
+            f.write(np.ones(DIM, dtype=np.float32).tobytes())
+
+        VectorStore(str(tmp_path), dim=DIM)
+
+        assert os.path.getsize(store.vectors_path) == 2 * DIM * 4
+
+    def test_model_change_invalidates(self, tmp_path):
+        VectorStore(str(tmp_path), dim=DIM, model="old").sync(["a"], _Embedder())
+
+        store = VectorStore(str(tmp_path), dim=DIM, model="new")
+
+        assert store.rows == {}
+
+    def test_clear(self, tmp_path):
+        directory = tmp_path / "store"
+        store = VectorStore(str(directory), dim=DIM)
+        store.sync(["a"], _Embedder())
+
+        store.clear()
+
+        assert not directory.exists()
+        assert store.rows == {}
+
+    def test_changed_positions_reported(self, tmp_path):
+        store = VectorStore(str(tmp_path), dim=DIM)
+        store.sync(["a", "bb", "ccc"], _Embedder())
+
+        _, stats = store.sync(["a", "xx", "ccc", "yyyy"], _Embedder())
+
+        assert stats['changed'] == [1, 3]
+
+    def test_ensure_never_compacts(self, tmp_path):
+        """A partial update keeps the rows of documents it was not given"""
+        store = VectorStore(str(tmp_path), dim=DIM)
+        store.sync(["a", "bb", "ccc"], _Embedder())
+        embed = _Embedder()
+
+        vectors, stats = store.ensure(["dddd"], embed)
+
+        assert embed.calls == [["dddd"]]
+        assert stats['pruned'] == 0
+        assert len(store.rows) == 4
+        assert vectors[0][0] == 4
@@ -0,0 +1,35 @@
+"""
+Text normalization helpers shared by routing, caching and lexical search
+"""
+import re
+import unicodedata
+from typing import List
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_SPACES_RE = re.compile(r"\s+")
+
+# Function words ignored when matching queries (folded, as produced by tokenize)
+STOPWORDS = {
+    'le', 'la', 'les', 'l', 'un', 'une', 'des', 'de', 'du', 'd', 'a', 'au', 'aux', 'en', 'dans',
+    'et', 'est', 'ce', 'c', 'qu', 'que', 'quel', 'quels', 'quelle', 'quelles', 'vos', 'votre',
+    'vous', 'nous', 'je', 'j', 'me', 'mon', 'ma', 'mes', 'il', 'y', 'sur', 'pour', 'avec', 'sont',
+    'etes', 'avez', 'ou', 'svp', 'merci', 'bonjour', 'the', 'an', 'is', 'are', 'your', 'you',
+    'in', 'of', 'for', 'what', 'do', 'have', 'please', 'moi', 'departement', 'dept', 'ville',
+    'sans', 'avoir', 'donner', 'donnez', 'connaitre', 'savoir', 'voudrais', 'veux',
+}
+
+
+def fold_accents(text: str) -> str:
+    """Remove diacritics: 'Phở Bò végétarien' -> 'Pho Bo vegetarien'"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).replace('đ', 'd').replace('Đ', 'D')
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, accent-folded, single-spaced version of text"""
+    return _SPACES_RE.sub(' ', fold_accents(text).lower()).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-insensitive alphanumeric tokens ('Bry-sur-Marne' -> ['bry', 'sur', 'marne'])"""
+    return _WORD_RE.findall(normalize_text(text))
@@ -0,0 +1,224 @@
+"""
+Request tracing - per-stage latency, OpenAI token counters and Prometheus text exposition
+"""
+import asyncio
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+# Seconds; covers cache hits (sub-ms) up to slow completions
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Current request: its ID (on every log line) and the stage timings collected so far
+_trace_id: contextvars.ContextVar = contextvars.ContextVar('trace_id', default=None)
+_stages: contextvars.ContextVar = contextvars.ContextVar('trace_stages', default=None)
+# Tools of one request run in parallel threads and add to the same stages dict
+_stages_lock = threading.Lock()
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """In-process counters and histograms, rendered in the Prometheus text format
+
+    Each worker process keeps its own registry (scrape every worker, or sum
+    in the collector).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}  # labels -> [bucket counts..., sum, count]
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(self._key(labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Dict]:
+        """{'buckets': {le: cumulative count}, 'sum', 'count'} or None"""
+        with self._lock:
+            counts = self._histograms.get(name, {}).get(self._key(labels))
+            if counts is None:
+                return None
+            return {'buckets': dict(zip(self.buckets, counts[:-2])), 'sum': counts[-2], 'count': counts[-1]}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _labels(key: tuple, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{self._labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, counts in sorted(self._histograms[name].items()):
+                    for bound, count in zip(self.buckets, counts):
+                        lines.append(f"{name}_bucket{self._labels(key, (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{name}_bucket{self._labels(key, (('le', '+Inf'),))} {counts[-1]}")
+                    lines.append(f"{name}_sum{self._labels(key)} {counts[-2]:.6f}")
+                    lines.append(f"{name}_count{self._labels(key)} {counts[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('bolkiri_request_seconds', 'End-to-end latency of a traced request')
+metrics.describe('bolkiri_stage_seconds', 'Latency of one stage of a request')
+metrics.describe('bolkiri_tool_seconds', 'Latency of one agent tool execution')
+metrics.describe('bolkiri_requests_total', 'Traced requests by kind and status')
+metrics.describe('bolkiri_tool_calls_total', 'Agent tool executions by tool and status')
+metrics.describe('bolkiri_openai_requests_total', 'OpenAI API calls by stage')
+metrics.describe('bolkiri_openai_tokens_total', 'OpenAI tokens by stage and kind (prompt, completion, cached)')
+metrics.describe('bolkiri_router_queries_total',
+                 'Queries seen by the intent router by outcome (rules, centroid, fallback to LLM planning)')
+
+
+@contextmanager
+def bind_trace_id(trace_id: Optional[str] = None) -> Iterator[str]:
+    """Use trace_id (or a new one) for logs emitted in this context, e.g. one HTTP request"""
+    trace_id = trace_id or new_trace_id()
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+
+@contextmanager
+def trace(kind: str, on_finish: Optional[Callable[[Dict], None]] = None) -> Iterator[Dict]:
+    """Time a whole request and collect its stages
+
+    Yields {'trace_id', 'kind', 'stages': {stage: ms}, 'status', 'total_ms'}.
+    Reuses the trace ID bound by the caller (HTTP middleware) when there is
+    one. Set 'status' to label the outcome; an exception sets 'error', a
+    cancelled request or closed stream 'cancelled'. on_finish gets the
+    completed record while the trace ID is still bound (summary log line).
+    """
+    trace_id = _trace_id.get() or new_trace_id()
+    record = {'trace_id': trace_id, 'kind': kind, 'stages': {}, 'status': 'ok', 'total_ms': None}
+    id_token = _trace_id.set(trace_id)
+    stages_token = _stages.set(record['stages'])
+    start = time.perf_counter()
+    try:
+        yield record
+    except (GeneratorExit, asyncio.CancelledError):
+        record['status'] = 'cancelled'
+        raise
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        record['total_ms'] = round(elapsed * 1000, 1)
+        metrics.observe('bolkiri_request_seconds', elapsed, kind=kind)
+        metrics.inc('bolkiri_requests_total', kind=kind, status=record['status'])
+        try:
+            if on_finish is not None:
+                on_finish(record)
+        finally:
+            _stages.reset(stages_token)
+            _trace_id.reset(id_token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time one stage; repeated stages add up in the request's trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_stage(stage: str, seconds: float):
+    metrics.observe('bolkiri_stage_seconds', seconds, stage=stage)
+    _add_to_trace(stage, seconds)
+
+
+def record_tool(tool_name: str, seconds: float, status: str):
+    """Tool latency has its own histogram; the trace lists it as 'tool:<name>'"""
+    metrics.observe('bolkiri_tool_seconds', seconds, tool=tool_name)
+    metrics.inc('bolkiri_tool_calls_total', tool=tool_name, status=status)
+    _add_to_trace(f"tool:{tool_name}", seconds)
+
+
+def _add_to_trace(stage: str, seconds: float):
+    stages = _stages.get()
+    if stages is not None:
+        with _stages_lock:
+            stages[stage] = round(stages.get(stage, 0) + seconds * 1000, 1)
+
+
+def record_usage(stage: str, usage) -> Optional[Dict[str, int]]:
+    """Count one OpenAI call and its tokens; returns the token counts (None without usage)"""
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    if not isinstance(prompt_tokens, int):
+        return None
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)
+    tokens = {
+        'prompt': prompt_tokens,
+        'completion': completion_tokens if isinstance(completion_tokens, int) else 0,
+        'cached': cached_tokens if isinstance(cached_tokens, int) else 0,
+    }
+    metrics.inc('bolkiri_openai_requests_total', stage=stage)
+    for kind, count in tokens.items():
+        if count:
+            metrics.inc('bolkiri_openai_tokens_total', count, stage=stage, kind=kind)
+    return tokens
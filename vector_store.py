@@ -0,0 +1,177 @@
+"""
+Content-addressed vector store - raw float32 rows opened with np.memmap
+plus a JSON manifest mapping text hashes to rows. Replaces the pickled
+embeddings_cache.pkl: startup is a manifest read + memmap, and a rebuild
+only embeds documents whose text changed.
+"""
+import os
+import json
+import shutil
+import hashlib
+from contextlib import contextmanager
+from typing import List, Dict, Callable, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker assumed
+    fcntl = None
+
+
+class VectorStore:
+    """Per-document embedding store keyed by SHA-256 of the embedded text"""
+
+    VECTORS_FILE = "vectors.f32"
+    MANIFEST_FILE = "manifest.json"
+    LOCK_FILE = ".lock"
+
+    def __init__(self, directory: str = "vector_store", dim: int = 1536,
+                 model: str = "text-embedding-ada-002"):
+        self.directory = directory
+        self.dim = dim
+        self.model = model
+        self.vectors_path = os.path.join(directory, self.VECTORS_FILE)
+        self.manifest_path = os.path.join(directory, self.MANIFEST_FILE)
+        self.rows: Dict[str, int] = {}  # text hash -> row in vectors file
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.load()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def load(self):
+        """Read the manifest and memory-map the vectors (no deserialization)"""
+        self.rows = {}
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if not os.path.exists(self.manifest_path) or not os.path.exists(self.vectors_path):
+            return
+
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get('model') != self.model or manifest.get('dim') != self.dim:
+            return
+
+        count = manifest.get('count', 0)
+        # Rows past `count` belong to a sync not yet published (or interrupted): never
+        # mapped here, and only _append (under the lock) may cut them
+        if os.path.getsize(self.vectors_path) < count * self.dim * 4:
+            return
+
+        self.rows = {h: r for h, r in manifest.get('rows', {}).items() if r < count}
+        if count:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(count, self.dim))
+
+    def _write_manifest(self, count: int):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model, 'dim': self.dim, 'count': count, 'rows': self.rows}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _append(self, hashes: List[str], vectors: np.ndarray):
+        """Append new rows then publish them in the manifest"""
+        os.makedirs(self.directory, exist_ok=True)
+        start = len(self.vectors)
+        with open(self.vectors_path, 'ab') as f:
+            # Discard rows of an interrupted sync so new rows land right after the published ones
+            f.truncate(start * self.dim * 4)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for offset, text_hash in enumerate(hashes):
+            self.rows[text_hash] = start + offset
+        self._write_manifest(start + len(hashes))
+        self.load()
+
+    def _compact(self, live_hashes: List[str]):
+        """Rewrite the file with only live rows, in document order"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.vectors_path + ".tmp"
+        ordered = list(dict.fromkeys(live_hashes))
+        with open(tmp_path, 'wb') as f:
+            for text_hash in ordered:
+                f.write(np.ascontiguousarray(self.vectors[self.rows[text_hash]]).tobytes())
+        # Drop the memmap before replacing the file it points to
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        os.replace(tmp_path, self.vectors_path)
+        self.rows = {text_hash: row for row, text_hash in enumerate(ordered)}
+        self._write_manifest(len(ordered))
+        self.load()
+
+    @contextmanager
+    def _exclusive(self):
+        """Cross-process lock: workers starting together embed the corpus once"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, self.LOCK_FILE), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def sync(self, texts: List[str], embed_batch: Callable[[List[str]], np.ndarray]) -> Tuple[np.ndarray, Dict]:
+        """Return one vector per text, embedding only texts not already stored
+
+        Returns:
+            (vectors in `texts` order, {'reused', 'embedded', 'pruned', 'changed'})
+            where 'changed' lists the positions of texts that had to be embedded
+        """
+        with self._exclusive():
+            # Another process may have embedded while we waited for the lock
+            self.load()
+            return self._sync(texts, embed_batch)
+
+    def ensure(self, texts: List[str], embed_batch: Callable[[List[str]], np.ndarray]) -> Tuple[np.ndarray, Dict]:
+        """Like sync for a subset of the corpus: embeds what is missing, never compacts
+
+        Used by incremental KB updates, which only pass added/changed documents.
+        """
+        with self._exclusive():
+            self.load()
+            return self._sync(texts, embed_batch, compact=False)
+
+    def _sync(self, texts: List[str], embed_batch: Callable[[List[str]], np.ndarray],
+              compact: bool = True) -> Tuple[np.ndarray, Dict]:
+        hashes = [self.text_hash(text) for text in texts]
+
+        missing = {}
+        changed = []
+        for position, (text_hash, text) in enumerate(zip(hashes, texts)):
+            if text_hash not in self.rows:
+                changed.append(position)
+                missing.setdefault(text_hash, text)
+
+        if missing:
+            new_vectors = np.asarray(embed_batch(list(missing.values())), dtype=np.float32)
+            self._append(list(missing.keys()), new_vectors.reshape(len(missing), self.dim))
+
+        # Reclaim space once stale rows dominate (e.g. after many KB updates)
+        live = set(hashes)
+        stale = len(self.rows) - len(live) if compact else 0
+        if stale and stale >= len(live):
+            self._compact(hashes)
+
+        stats = {
+            'reused': len(set(hashes)) - len(missing),
+            'embedded': len(missing),
+            'pruned': stale if stale and stale >= len(live) else 0,
+            'changed': changed
+        }
+
+        rows = [self.rows[text_hash] for text_hash in hashes]
+        if rows == list(range(len(rows))):
+            # Store already in document order: zero-copy view on the memmap
+            return self.vectors[:len(rows)], stats
+        return np.asarray(self.vectors[rows]), stats
+
+    def clear(self):
+        """Delete every stored vector (REBUILD_EMBEDDINGS=true)"""
+        self.rows = {}
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)